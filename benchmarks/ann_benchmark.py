@@ -0,0 +1,85 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from services.ann import IVFIndex, normalize, top_k
+
+load_dotenv()
+
+
+def synthetic_embeddings(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    # clustered vectors, closer to real sentence embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 100), dim))
+    labels = rng.integers(len(centers), size=n)
+    return (centers[labels] + 0.5 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IVF recall@k vs latency benchmark")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="Use N synthetic vectors instead of movie_embeddings.npy",
+    )
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings = synthetic_embeddings(args.synthetic, args.dim)
+    else:
+        embeddings = np.load(f"{os.environ['CACHE_DIR']}/movie_embeddings.npy")
+
+    rng = np.random.default_rng(1)
+    picked = embeddings[rng.choice(len(embeddings), args.queries)]
+    queries = picked + 0.3 * rng.normal(size=picked.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(embeddings, args.nlist)
+    print(f"Vectors: {len(embeddings)}, nlist: {ivf.nlist}")
+    print(f"Build time: {time.perf_counter() - start:.2f}s")
+
+    # brute force as SemanticSearch.search does it without an ANN index
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        scores = np.dot(embeddings, query) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query)
+        )
+        exact.append(set(np.argsort(scores)[::-1][: args.k].tolist()))
+    brute_latency = (time.perf_counter() - start) / len(queries)
+
+    # exact over pre-normalized vectors, the floor for any exact search
+    vectors = normalize(embeddings)
+    start = time.perf_counter()
+    for query in queries:
+        top_k(vectors @ normalize(query), args.k)
+    normalized_latency = (time.perf_counter() - start) / len(queries)
+
+    print(f"{'method':<22}{'recall@' + str(args.k):>10}{'latency':>12}")
+    print(f"{'brute force':<22}{1.0:>10.3f}{brute_latency * 1000:>10.3f}ms")
+    print(f"{'exact, normalized':<22}{1.0:>10.3f}{normalized_latency * 1000:>10.3f}ms")
+
+    nprobe = 1
+    while nprobe <= ivf.nlist:
+        start = time.perf_counter()
+        hits = 0
+        for query, expected in zip(queries, exact):
+            rows, _ = ivf.search(query, args.k, nprobe)
+            hits += len(expected.intersection(rows.tolist()))
+        latency = (time.perf_counter() - start) / len(queries)
+        recall = hits / (args.k * len(queries))
+        name = f"ivf nprobe={nprobe}"
+        print(f"{name:<22}{recall:>10.3f}{latency * 1000:>10.3f}ms")
+        nprobe *= 2
+
+
+if __name__ == "__main__":
+    main()
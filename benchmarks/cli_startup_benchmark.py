@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS: Dict[str, List[str]] = {
+    "semantic --help": ["-m", "cli.semantic_search_cli", "--help"],
+    "semantic verify_embeddings": [
+        "-m",
+        "cli.semantic_search_cli",
+        "verify_embeddings",
+    ],
+    "semantic cache_stats": ["-m", "cli.semantic_search_cli", "cache_stats"],
+    "semantic embedquery": ["-m", "cli.semantic_search_cli", "embedquery", "space"],
+    "semantic search": ["-m", "cli.semantic_search_cli", "search", "space", "--exact"],
+    "keyword --help": ["cli/keyword_search_cli.py", "--help"],
+    "keyword search": ["cli/keyword_search_cli.py", "search", "space"],
+    "keyword bm25search": ["cli/keyword_search_cli.py", "bm25search", "space"],
+}
+
+
+def time_command(args: List[str], runs: int) -> float:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            cwd=ROOT,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup time per CLI subcommand")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per command")
+    parser.add_argument("--output", type=str, help="Write timings to this JSON file")
+    parser.add_argument(
+        "--compare", type=str, help="Fail if slower than the timings in this file"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown against --compare, as a fraction",
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    for name, command in COMMANDS.items():
+        try:
+            results[name] = time_command(command, args.runs)
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.strip().splitlines()[-1] if e.stderr.strip() else ""
+            print(f"{name:<30}   failed: {error}")
+            continue
+
+        line = f"{name:<30}{results[name] * 1000:>8.0f}ms"
+        if name in baseline:
+            change = results[name] / baseline[name] - 1
+            line += f"  ({change:+.0%})"
+            if change > args.threshold:
+                regressions.append(name)
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if regressions:
+        print(f"Startup regressions: {', '.join(regressions)}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
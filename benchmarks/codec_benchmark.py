@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from services.indexing import InvertedIndex
+from services.postings import PostingLists
+from services.segment import Segment, write_segment
+from services.utils import POSTINGS_BLOCK_SIZE, POSTINGS_CODECS
+
+from .load_generator import DEFAULT_QUERIES
+
+
+def postings_bytes(postings: PostingLists) -> int:
+    size = postings.doc_ids.nbytes + postings.tfs.nbytes
+    if postings.codec != "raw":
+        size += sum(
+            table.nbytes
+            for table in (
+                postings.block_offsets,
+                postings.block_last_doc_ids,
+                postings.block_doc_offsets,
+                postings.block_tf_offsets,
+            )
+        )
+    return size
+
+
+def time_calls(fn: Callable, items: List, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) / (runs * len(items))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Index size and query latency per posting list codec"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--block-size", type=int, default=POSTINGS_BLOCK_SIZE)
+    parser.add_argument("--output", type=str, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    index = InvertedIndex()
+    index.load()
+    terms = list(index.postings.terms)
+    # the most frequent terms decode the longest lists
+    frequent = sorted(terms, key=index.postings.document_frequency)[-20:]
+    probes = [(doc_id, term) for term in frequent for doc_id in (1, 1000, 100000)]
+
+    report: List[Dict] = []
+    with tempfile.TemporaryDirectory() as directory:
+        for codec in POSTINGS_CODECS:
+            path = os.path.join(directory, f"{codec}.seg")
+            start = time.perf_counter()
+            write_segment(path, index.postings, index.docmap, codec, args.block_size)
+            write_time = time.perf_counter() - start
+
+            loaded = InvertedIndex(index.tokenizer, directory)
+            segment = Segment(path)
+            loaded.postings, loaded.docmap = segment.postings, segment.documents
+            loaded.build_scorer()
+
+            report.append(
+                {
+                    "codec": codec,
+                    "file_mb": os.path.getsize(path) / 2**20,
+                    "postings_mb": postings_bytes(segment.postings) / 2**20,
+                    "write_s": write_time,
+                    "bm25_search_ms": 1000
+                    * time_calls(
+                        lambda query: loaded.bm25_search(query, args.limit),
+                        DEFAULT_QUERIES,
+                        args.runs,
+                    ),
+                    "get_documents_ms": 1000
+                    * time_calls(loaded.get_documents, frequent, args.runs),
+                    "get_tf_us": 1e6
+                    * time_calls(
+                        lambda probe: segment.postings.get_tf(*probe),
+                        probes,
+                        args.runs,
+                    ),
+                }
+            )
+
+    print(f"Documents: {len(index.docmap)}, terms: {len(terms)}")
+    print(
+        f"{'codec':<10}{'file':>11}{'postings':>11}{'write':>9}"
+        f"{'bm25_search':>14}{'get_documents':>16}{'get_tf':>11}"
+    )
+    for row in report:
+        print(
+            f"{row['codec']:<10}{row['file_mb']:>8.2f} MB{row['postings_mb']:>8.2f} MB"
+            f"{row['write_s']:>8.2f}s{row['bm25_search_ms']:>12.2f}ms"
+            f"{row['get_documents_ms']:>14.2f}ms{row['get_tf_us']:>9.1f}us"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
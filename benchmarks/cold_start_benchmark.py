@@ -0,0 +1,57 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter so nothing is warm except the OS page cache
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from services.indexing import InvertedIndex
+imported = time.perf_counter()
+index = InvertedIndex()
+getattr(index, sys.argv[1])()
+loaded = time.perf_counter()
+index.bm25_search(sys.argv[2], 5)
+done = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "load": loaded - imported,
+    "query": done - loaded,
+}))
+"""
+
+
+def run(loader: str, query: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, loader, query],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Cold-start time of the pickle cache vs the mmap segment"
+    )
+    parser.add_argument("--query", type=str, default="space adventure")
+    parser.add_argument("--runs", type=int, default=5, help="Processes per loader")
+    args = parser.parse_args()
+
+    print(f"{'loader':<14}{'import':>10}{'load':>10}{'query':>10}")
+    for loader in ["load_pickles", "load_segment"]:
+        runs = [run(loader, args.query) for _ in range(args.runs)]
+        medians = {
+            key: statistics.median(r[key] for r in runs) * 1000 for key in runs[0]
+        }
+        print(
+            f"{loader:<14}{medians['import']:>8.1f}ms"
+            f"{medians['load']:>8.1f}ms{medians['query']:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
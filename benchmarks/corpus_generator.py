@@ -0,0 +1,187 @@
+import argparse
+import hashlib
+import json
+import random
+import zlib
+from collections import Counter
+from string import punctuation
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from services.processing import load_movies
+
+from .load_generator import DEFAULT_QUERIES
+
+# synthetic documents are sampled this many at a time
+SAMPLE_BATCH = 1000
+QUERY_MAX_WORDS = 3
+
+_trans_table = str.maketrans("", "", punctuation)
+
+
+def word_distribution(counts: Counter) -> Tuple[np.ndarray, np.ndarray]:
+    # sorted, so the same source gives the same corpus whatever its order
+    words = sorted(counts)
+    weights = np.array([counts[word] for word in words], dtype=np.float64)
+    return np.array(words, dtype=object), weights / weights.sum()
+
+
+class CorpusModel:
+    # Word frequencies and lengths of the source titles and descriptions.
+    # Documents sampled from it keep the source's Zipfian term distribution,
+    # so posting lists grow with the corpus the way a bigger crawl of the
+    # same kind of text would.
+    def __init__(self, movies: List[Dict]):
+        if not movies:
+            raise ValueError("source corpus is empty")
+
+        self.title_words, self.title_p = word_distribution(
+            Counter(word for movie in movies for word in movie["title"].split())
+        )
+        self.description_words, self.description_p = word_distribution(
+            Counter(word for movie in movies for word in movie["description"].split())
+        )
+        self.title_lengths = np.array(
+            [max(1, len(movie["title"].split())) for movie in movies]
+        )
+        self.description_lengths = np.array(
+            [max(1, len(movie["description"].split())) for movie in movies]
+        )
+        self.next_id = max(movie["id"] for movie in movies) + 1
+
+    def sample(self, n_docs: int, seed: int) -> Iterator[Dict]:
+        rng = np.random.default_rng(seed)
+        doc_id = self.next_id
+        while n_docs > 0:
+            n = min(n_docs, SAMPLE_BATCH)
+            titles = self.__sample_texts(
+                rng, n, self.title_lengths, self.title_words, self.title_p
+            )
+            descriptions = self.__sample_texts(
+                rng,
+                n,
+                self.description_lengths,
+                self.description_words,
+                self.description_p,
+            )
+            for title, description in zip(titles, descriptions):
+                yield {"id": doc_id, "title": title, "description": description}
+                doc_id += 1
+            n_docs -= n
+
+    def __sample_texts(
+        self,
+        rng: np.random.Generator,
+        n: int,
+        lengths: np.ndarray,
+        words: np.ndarray,
+        p: np.ndarray,
+    ) -> List[str]:
+        sampled_lengths = rng.choice(lengths, n)
+        # every word of the batch in one draw, then cut into texts
+        sampled = words[rng.choice(len(words), sampled_lengths.sum(), p=p)]
+        ends = np.cumsum(sampled_lengths)
+        return [
+            " ".join(sampled[end - length : end])
+            for end, length in zip(ends, sampled_lengths)
+        ]
+
+
+def synthetic_corpus(movies: List[Dict], n_docs: int, seed: int = 0) -> Iterator[Dict]:
+    # the source documents first, then as many sampled ones as it takes
+    yield from movies[:n_docs]
+    if n_docs > len(movies):
+        yield from CorpusModel(movies).sample(n_docs - len(movies), seed)
+
+
+def write_corpus(path: str, documents: Iterable[Dict]) -> int:
+    # JSONL, which iter_documents streams without reading the whole file
+    n_docs = 0
+    with open(path, "w") as f:
+        for doc in documents:
+            f.write(json.dumps(doc) + "\n")
+            n_docs += 1
+    return n_docs
+
+
+def clean_query(text: str) -> str:
+    # lowercase words only, so boolean search reads them as plain ANDed words
+    return " ".join(text.translate(_trans_table).lower().split())
+
+
+def make_queries(movies: List[Dict], n_queries: int, seed: int = 0) -> List[str]:
+    # the load generator's queries, then alternately titles and short runs
+    # of description words of random source movies
+    rng = random.Random(seed)
+    queries = [clean_query(query) for query in DEFAULT_QUERIES]
+    while len(queries) < n_queries:
+        movie = rng.choice(movies)
+        if len(queries) % 2:
+            query = clean_query(movie["title"])
+        else:
+            words = clean_query(movie["description"]).split()
+            n_words = rng.randint(1, QUERY_MAX_WORDS)
+            start = rng.randrange(max(1, len(words) - n_words + 1))
+            query = " ".join(words[start : start + n_words])
+        if query:
+            queries.append(query)
+    return queries[:n_queries]
+
+
+def queries_fingerprint(queries: List[str]) -> str:
+    return hashlib.sha1("\n".join(queries).encode()).hexdigest()
+
+
+class StubEmbedder:
+    # Stands in for the SentenceTransformer: a text embeds as the normalized
+    # sum of fixed random vectors of its words, each seeded by the word. No
+    # model download, the same vectors on every machine, and texts sharing
+    # words are similar, which is all a latency benchmark needs.
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+        self.vectors: Dict[str, np.ndarray] = {}
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.translate(_trans_table).lower().split():
+                embeddings[i] += self.__vector(word)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def __vector(self, word: str) -> np.ndarray:
+        vector = self.vectors.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode()))
+            vector = rng.standard_normal(self.dimensions).astype(np.float32)
+            self.vectors[word] = vector
+        return vector
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic corpus and query set sampled from the movies"
+    )
+    parser.add_argument("--docs", type=int, required=True, help="Corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, required=True, help="Corpus path (JSONL)")
+    parser.add_argument(
+        "--queries-output", type=str, help="Write the queries here, one per line"
+    )
+    args = parser.parse_args()
+
+    movies = load_movies()
+    n_docs = write_corpus(args.output, synthetic_corpus(movies, args.docs, args.seed))
+    print(f"Wrote {n_docs} documents to {args.output}")
+
+    if args.queries_output:
+        queries = make_queries(movies, args.queries, args.seed)
+        with open(args.queries_output, "w") as f:
+            f.writelines(f"{query}\n" for query in queries)
+        print(f"Wrote {len(queries)} queries to {args.queries_output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import time
+
+from services.hybrid import HybridSearch
+from services.indexing import InvertedIndex
+from services.processing import load_movies
+from services.semantic_search import SemanticSearch
+
+from .load_generator import DEFAULT_QUERIES
+
+
+def time_retrieve(hybrid: HybridSearch, limit: int, runs: int, **kwargs) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for query in DEFAULT_QUERIES:
+            hybrid.retrieve(query, limit, **kwargs)
+    return (time.perf_counter() - start) / (runs * len(DEFAULT_QUERIES))
+
+
+def time_retrieve_bm25(index: InvertedIndex, limit: int, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for query in DEFAULT_QUERIES:
+            index.bm25_search(query, limit)
+    return (time.perf_counter() - start) / (runs * len(DEFAULT_QUERIES))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Hybrid retrieval latency: full dense scoring vs BM25-restricted"
+    )
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    index = InvertedIndex()
+    index.load()
+    ss = SemanticSearch()
+    ss.load_or_create_embeddings(load_movies())
+    ss.load_or_create_ann_index()
+    hybrid = HybridSearch(index, ss)
+
+    # warm the query embedding cache so only retrieval is measured
+    for query in DEFAULT_QUERIES:
+        ss.embed_query(query)
+
+    timings = {
+        "bm25 only": time_retrieve_bm25(
+            index, hybrid.candidate_multiplier * args.limit, args.runs
+        ),
+        "hybrid, exact": time_retrieve(hybrid, args.limit, args.runs, exact=True),
+        "hybrid, ann": time_retrieve(hybrid, args.limit, args.runs),
+        "hybrid, restricted": time_retrieve(
+            hybrid, args.limit, args.runs, restrict=True
+        ),
+    }
+    hybrid.close()
+
+    print(f"Documents: {len(ss.documents)}, embeddings: {ss.embeddings.shape}")
+    for name, latency in timings.items():
+        print(f"{name:<22}{latency * 1000:>10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
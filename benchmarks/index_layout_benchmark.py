@@ -0,0 +1,71 @@
+import argparse
+import pickle
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from services.postings import PostingLists, PostingListsBuilder
+from services.processing import get_tokenizer, load_movies
+
+
+def build_layouts(movies: List[Dict]) -> Tuple[Any, PostingLists]:
+    tokenizer = get_tokenizer()
+    index: Dict[str, set] = {}
+    term_frequencies: Dict[int, Counter] = {}
+    docs_length: Dict[int, int] = {}
+    builder = PostingListsBuilder()
+
+    texts = (f"{movie['title']} {movie['description']}" for movie in movies)
+    for movie, tokens in zip(movies, tokenizer.tokenize_many(texts)):
+        doc_id = movie["id"]
+        for token in tokens:
+            index.setdefault(token, set()).add(doc_id)
+        term_frequencies[doc_id] = Counter(tokens)
+        docs_length[doc_id] = len(tokens)
+        builder.add(doc_id, tokens)
+
+    return (index, term_frequencies, docs_length), builder.finish()
+
+
+def measure_load(payload: bytes, repeat: int) -> Tuple[float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pickle.loads(payload)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    loaded = pickle.loads(payload)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return best, memory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Memory footprint and load time of the index layouts"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Load repetitions")
+    args = parser.parse_args()
+
+    movies = load_movies()
+    legacy, compact = build_layouts(movies)
+
+    print(f"Documents: {len(movies)}, terms: {len(compact.terms)}")
+    print(f"{'layout':<28}{'pickle size':>14}{'memory':>14}{'load time':>12}")
+    for name, layout in [
+        ("dict-of-sets + Counters", legacy),
+        ("compact posting arrays", compact),
+    ]:
+        payload = pickle.dumps(layout, protocol=pickle.HIGHEST_PROTOCOL)
+        load_time, memory = measure_load(payload, args.repeat)
+        print(
+            f"{name:<28}{len(payload) / 2**20:>11.2f} MB"
+            f"{memory / 2**20:>11.2f} MB{load_time * 1000:>9.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List, Tuple
+from urllib.parse import urlencode
+
+from services.utils import SERVER_HOST, SERVER_PORT
+
+DEFAULT_QUERIES = [
+    "space adventure",
+    "haunted house",
+    "bear attack",
+    "romantic comedy in paris",
+    "time travel",
+    "heist gone wrong",
+    "alien invasion",
+    "high school drama",
+]
+
+
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, value = line.decode().split(":", 1)
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(
+    host: str,
+    port: int,
+    endpoint: str,
+    queries: List[str],
+    limit: int,
+    deadline: float,
+    offset: int,
+    latencies: List[float],
+    errors: List[int],
+):
+    # one keep-alive connection per client, like a pooled HTTP client
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            query = queries[i % len(queries)]
+            i += 1
+            target = f"/{endpoint}?{urlencode({'q': query, 'limit': limit})}"
+            start = time.perf_counter()
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+            status, _ = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(
+    host: str,
+    port: int,
+    endpoint: str,
+    queries: List[str],
+    concurrency: int,
+    duration: float,
+    limit: int,
+) -> dict:
+    latencies: List[float] = []
+    errors: List[int] = []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(
+        *[
+            client(host, port, endpoint, queries, limit, deadline, c, latencies, errors)
+            for c in range(concurrency)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "qps": len(latencies) / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies) if latencies else 0.0,
+        "p99_ms": 1000 * percentiles[98] if percentiles else 0.0,
+        "max_ms": 1000 * latencies[-1] if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure search server latency under concurrent load"
+    )
+    parser.add_argument("--host", type=str, default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument(
+        "--endpoint", choices=["bm25", "semantic", "hybrid"], default="bm25"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 8, 32],
+        help="Concurrent keep-alive clients; one run per value",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument(
+        "--queries", type=str, help="File with one query per line (default: built-in)"
+    )
+    parser.add_argument("--output", type=str, help="Write results as JSON")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    results = []
+    print(f"{'clients':>8} {'requests':>9} {'qps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for concurrency in args.concurrency:
+        result = asyncio.run(
+            run_load(
+                args.host,
+                args.port,
+                args.endpoint,
+                queries,
+                concurrency,
+                args.duration,
+                args.limit,
+            )
+        )
+        results.append(result)
+        print(
+            f"{concurrency:>8} {result['requests']:>9} {result['qps']:>9.1f} "
+            f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+            + (f"  ({result['errors']} errors)" if result["errors"] else "")
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from services.chunking import PassageSearch, PassageStore, split_sentences
+from services.indexing import InvertedIndex
+from services.processing import load_movies
+from services.semantic_search import SemanticSearch
+from services.utils import CHUNK_OVERLAP, PASSAGE_POOLING, PASSAGE_POOLINGS
+
+# queries are the last QUERY_WORDS words of the descriptions at least
+# QUERY_MIN_WORDS long
+QUERY_WORDS = 12
+QUERY_MIN_WORDS = 100
+
+
+def directory_bytes(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory)
+        for name in names
+    )
+
+
+def make_queries(
+    movies: List[Dict], n_queries: int, seed: int
+) -> List[Tuple[str, int]]:
+    # the end of a long description, which a single document embedding is
+    # the most likely to have truncated away, and its movie
+    rng = random.Random(seed)
+    long_movies = [
+        movie
+        for movie in movies
+        if len(movie["description"].split()) >= QUERY_MIN_WORDS
+    ]
+    sample = rng.sample(long_movies, min(n_queries, len(long_movies)))
+    return [
+        (
+            " ".join(split_sentences(movie["description"])[-1][-QUERY_WORDS:]),
+            movie["id"],
+        )
+        for movie in sample
+    ]
+
+
+def evaluate(
+    engine: str,
+    unit: str,
+    records: int,
+    size: int,
+    search: Callable[[str], List[int]],
+    queries: List[Tuple[str, int]],
+) -> Dict:
+    hits = 0
+    start = time.perf_counter()
+    for query, doc_id in queries:
+        hits += doc_id in search(query)
+    elapsed = time.perf_counter() - start
+    return {
+        "engine": engine,
+        "unit": unit,
+        "records": records,
+        "index_mb": size / 2**20,
+        "recall": hits / len(queries),
+        "latency_ms": 1000 * elapsed / len(queries),
+    }
+
+
+def evaluate_passages(
+    store: PassageStore,
+    pooling: str,
+    limit: int,
+    semantic: bool,
+    queries: List[Tuple[str, int]],
+) -> List[Dict]:
+    unit = f"passages/{store.size}"
+    passages = PassageSearch(store, pooling=pooling)
+    passages.load_or_create_index()
+    rows = [
+        evaluate(
+            "bm25",
+            unit,
+            len(store.passages),
+            directory_bytes(passages.index_dir),
+            lambda query: [r["id"] for r in passages.bm25_search(query, limit)],
+            queries,
+        )
+    ]
+    if semantic:
+        embeddings = passages.load_or_create_embeddings(use_query_cache=False)
+        rows.append(
+            evaluate(
+                "semantic",
+                unit,
+                len(store.passages),
+                embeddings.embeddings.nbytes,
+                lambda query: [
+                    r["id"] for r in passages.semantic_search(query, limit, True)
+                ],
+                queries,
+            )
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recall@k and index size for whole documents vs chunked passages"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 128, 64])
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--pooling", choices=PASSAGE_POOLINGS, default=PASSAGE_POOLING)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--semantic", action="store_true", help="Also embed and search (slow)"
+    )
+    parser.add_argument("--output", type=str, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    movies = load_movies()
+    queries = make_queries(movies, args.queries, args.seed)
+    limit = args.limit
+
+    report: List[Dict] = []
+    with tempfile.TemporaryDirectory() as directory:
+        index = InvertedIndex(directory=f"{directory}/documents")
+        index.build(movies)
+        index.save()
+        report.append(
+            evaluate(
+                "bm25",
+                "documents",
+                len(movies),
+                directory_bytes(index.directory),
+                lambda query: list(index.bm25_search(query, limit)),
+                queries,
+            )
+        )
+        if args.semantic:
+            semantic = SemanticSearch(
+                use_query_cache=False, prefix=f"{directory}/documents/embeddings"
+            )
+            semantic.build_embeddings(movies)
+            report.append(
+                evaluate(
+                    "semantic",
+                    "documents",
+                    len(movies),
+                    semantic.embeddings.nbytes,
+                    lambda query: [r["id"] for r in semantic.search(query, limit)],
+                    queries,
+                )
+            )
+
+        for size in args.sizes:
+            store = PassageStore(f"{directory}/passages-{size}", size, args.overlap)
+            store.load_or_build(movies)
+            report.extend(
+                evaluate_passages(store, args.pooling, limit, args.semantic, queries)
+            )
+
+    print(f"Documents: {len(movies)}, queries: {len(queries)}, k: {limit}")
+    print(
+        f"{'engine':<10}{'unit':<16}{'records':>9}{'index':>12}"
+        f"{'recall@k':>10}{'latency':>11}"
+    )
+    for row in report:
+        print(
+            f"{row['engine']:<10}{row['unit']:<16}{row['records']:>9}"
+            f"{row['index_mb']:>9.2f} MB{row['recall']:>10.3f}"
+            f"{row['latency_ms']:>9.2f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
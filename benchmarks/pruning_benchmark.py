@@ -0,0 +1,81 @@
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from services.bm25 import BM25Scorer
+from services.indexing import InvertedIndex
+
+from .load_generator import DEFAULT_QUERIES
+
+
+def make_queries(
+    index: InvertedIndex, n_queries: int, n_terms: int, seed: int
+) -> List[List[str]]:
+    # the fixed queries plus random mixes of frequent and rare terms, which
+    # is where skipping the long posting lists pays off
+    queries = [index.tokenizer.tokenize(query) for query in DEFAULT_QUERIES]
+    terms = sorted(
+        index.postings.terms, key=index.postings.document_frequency, reverse=True
+    )
+    split = max(n_terms, len(terms) // 10)
+    frequent, rare = terms[:split], terms[split:]
+    rng = random.Random(seed)
+    for _ in range(n_queries):
+        n_frequent = rng.randint(1, n_terms - 1)
+        query = rng.sample(frequent, n_frequent) + rng.sample(
+            rare, n_terms - n_frequent
+        )
+        rng.shuffle(query)
+        queries.append(query)
+    return [query for query in queries if len(query) > 1]
+
+
+def time_queries(fn: Callable, queries: List[List[str]], runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        for tokens in queries:
+            fn(tokens)
+    return (time.perf_counter() - start) / (runs * len(queries))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Top-k BM25 latency: exhaustive scoring vs MaxScore pruning"
+    )
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--terms", type=int, default=4, help="Terms per query")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    index = InvertedIndex()
+    index.load()
+    scorer = BM25Scorer(index.postings, len(index.docmap))
+    queries = make_queries(index, args.queries, args.terms, args.seed)
+
+    print(f"Documents: {len(index.docmap)}, multi-term queries: {len(queries)}")
+    print(f"{'limit':>6}{'exhaustive':>14}{'maxscore':>14}{'speedup':>10}")
+    for limit in args.limits:
+        for tokens in queries:
+            expected = scorer.top_k(scorer.score_all(tokens), limit)
+            if scorer.score_pruned(tokens, limit) != expected:
+                raise ValueError(f"Pruned top-{limit} differs for {tokens}")
+
+        exhaustive = time_queries(
+            lambda tokens: scorer.top_k(scorer.score_all(tokens), limit),
+            queries,
+            args.runs,
+        )
+        pruned = time_queries(
+            lambda tokens: scorer.score_pruned(tokens, limit), queries, args.runs
+        )
+        print(
+            f"{limit:>6}{exhaustive * 1000:>12.3f}ms{pruned * 1000:>12.3f}ms"
+            f"{exhaustive / pruned:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
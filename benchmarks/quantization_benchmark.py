@@ -0,0 +1,76 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from benchmarks.ann_benchmark import synthetic_embeddings
+from services.ann import normalize, top_k
+from services.quantization import QuantizedStore
+
+load_dotenv()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Memory, latency and recall of quantized embedding stores"
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="Use N synthetic vectors instead of movie_embeddings.npy",
+    )
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings = normalize(synthetic_embeddings(args.synthetic, args.dim))
+    else:
+        embeddings = normalize(
+            np.load(f"{os.environ['CACHE_DIR']}/movie_embeddings.npy")
+        )
+
+    rng = np.random.default_rng(1)
+    picked = embeddings[rng.choice(len(embeddings), args.queries)]
+    queries = normalize(picked + 0.3 * rng.normal(size=picked.shape))
+    exact = [set(top_k(embeddings @ query, args.k).tolist()) for query in queries]
+
+    print(f"Vectors: {len(embeddings)} x {embeddings.shape[1]}")
+    print(f"{'store':<18}{'memory':>12}{'recall@' + str(args.k):>11}{'latency':>12}")
+
+    def report(name: str, memory: int, search):
+        start = time.perf_counter()
+        hits = 0
+        for query, expected in zip(queries, exact):
+            hits += len(expected.intersection(search(query).tolist()))
+        latency = (time.perf_counter() - start) / len(queries)
+        recall = hits / (args.k * len(queries))
+        print(
+            f"{name:<18}{memory / 2**20:>9.2f} MB{recall:>11.3f}"
+            f"{latency * 1000:>10.3f}ms"
+        )
+
+    report("float32", embeddings.nbytes, lambda q: top_k(embeddings @ q, args.k))
+
+    for mode in ["int8", "pq"]:
+        start = time.perf_counter()
+        store = QuantizedStore.build(mode, embeddings, "benchmark")
+        print(f"  {mode} build: {time.perf_counter() - start:.2f}s")
+
+        report(mode, store.codes.nbytes, lambda q: top_k(store.scores(q), args.k))
+
+        def reranked(query):
+            candidates = np.sort(top_k(store.scores(query), args.rerank))
+            return candidates[top_k(embeddings[candidates] @ query, args.k)]
+
+        # codes stay resident; the float32 rows are only read for candidates
+        report(f"{mode}+rerank", store.codes.nbytes, reranked)
+
+
+if __name__ == "__main__":
+    main()
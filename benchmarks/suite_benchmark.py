@@ -0,0 +1,435 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.indexing import InvertedIndex
+from services.processing import Tokenizer, iter_documents, load_movies
+from services.semantic_search import SemanticSearch
+
+from .corpus_generator import (
+    StubEmbedder,
+    make_queries,
+    queries_fingerprint,
+    synthetic_corpus,
+    write_corpus,
+)
+from .passage_benchmark import directory_bytes
+
+ENGINES = ("inverted_index", "semantic")
+# a metric regresses when it is this much worse than the baseline's
+REGRESSION_THRESHOLD = 0.1
+# metrics where more is better; for every other one less is
+HIGHER_IS_BETTER = ("qps",)
+# counts that describe the run rather than measure it
+NOT_COMPARED = ("documents", "batch_size")
+
+
+def time_calls(fn: Callable, items: Sequence, runs: int) -> List[float]:
+    # one untimed pass pages in the mapped files and fills the per-term
+    # caches, so the timed runs measure the steady state
+    for item in items:
+        fn(item)
+    latencies = []
+    for _ in range(runs):
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def latency_stats(latencies: List[float], n_queries: int) -> Dict:
+    # latencies of calls that answered n_queries queries in all
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    else:
+        percentiles = latencies * 99
+    return {
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * percentiles[94],
+        "p99_ms": 1000 * percentiles[98],
+        "qps": n_queries / sum(latencies),
+    }
+
+
+def median_seconds(fn: Callable, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_inverted_index(
+    corpus_path: str,
+    directory: str,
+    queries: List[str],
+    limit: int,
+    runs: int,
+    workers: int = 1,
+    tokenizer: Optional[Tokenizer] = None,
+) -> Dict:
+    index = InvertedIndex(tokenizer, directory)
+    start = time.perf_counter()
+    n_docs = index.build_streaming(iter_documents(corpus_path), workers)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    index.save()
+    save = time.perf_counter() - start
+
+    def load() -> InvertedIndex:
+        loaded = InvertedIndex(tokenizer, directory)
+        loaded.load()
+        return loaded
+
+    load_seconds = median_seconds(load, runs)
+    index = load()
+    n_queries = runs * len(queries)
+    return {
+        "documents": n_docs,
+        "build_s": build,
+        "save_s": save,
+        "index_mb": directory_bytes(directory) / 2**20,
+        "load_ms": 1000 * load_seconds,
+        "queries": {
+            "search": latency_stats(
+                time_calls(lambda query: index.search(query, limit), queries, runs),
+                n_queries,
+            ),
+            "bm25_search": latency_stats(
+                time_calls(
+                    lambda query: index.bm25_search(query, limit), queries, runs
+                ),
+                n_queries,
+            ),
+        },
+    }
+
+
+def bench_semantic(
+    documents: List[Dict],
+    prefix: str,
+    queries: List[str],
+    limit: int,
+    runs: int,
+    batch_size: int,
+    embedder: StubEmbedder,
+) -> Dict:
+    semantic = SemanticSearch(use_query_cache=False, prefix=prefix, model=embedder)
+    start = time.perf_counter()
+    semantic.build_embeddings(documents)
+    build = time.perf_counter() - start
+
+    def load() -> SemanticSearch:
+        loaded = SemanticSearch(use_query_cache=False, prefix=prefix, model=embedder)
+        loaded.load_or_create_embeddings(documents)
+        return loaded
+
+    load_seconds = median_seconds(load, runs)
+    semantic = load()
+    directory, name = os.path.split(prefix)
+    store_bytes = sum(
+        os.path.getsize(os.path.join(directory, file))
+        for file in os.listdir(directory)
+        if file.startswith(name)
+    )
+    batches = [
+        queries[start : start + batch_size]
+        for start in range(0, len(queries), batch_size)
+    ]
+    n_queries = runs * len(queries)
+    return {
+        "documents": len(documents),
+        "build_s": build,
+        "index_mb": store_bytes / 2**20,
+        "load_ms": 1000 * load_seconds,
+        "queries": {
+            "exact": latency_stats(
+                time_calls(
+                    lambda query: semantic.search(query, limit, exact=True),
+                    queries,
+                    runs,
+                ),
+                n_queries,
+            ),
+            # latencies here are of whole batches
+            "batched": dict(
+                latency_stats(
+                    time_calls(
+                        lambda batch: semantic.search_many(batch, limit, exact=True),
+                        batches,
+                        runs,
+                    ),
+                    n_queries,
+                ),
+                batch_size=batch_size,
+            ),
+        },
+    }
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_suite(
+    movies: List[Dict],
+    queries: List[str],
+    n_docs: int,
+    directory: str,
+    engines: Sequence[str] = ENGINES,
+    seed: int = 0,
+    limit: int = 10,
+    runs: int = 3,
+    dimensions: int = 384,
+    batch_size: int = 32,
+    workers: int = 1,
+    tokenizer: Optional[Tokenizer] = None,
+) -> Dict:
+    corpus_path = f"{directory}/corpus.jsonl"
+    start = time.perf_counter()
+    n_docs = write_corpus(corpus_path, synthetic_corpus(movies, n_docs, seed))
+    report = {
+        "config": {
+            "documents": n_docs,
+            "seed": seed,
+            "queries": len(queries),
+            "queries_sha1": queries_fingerprint(queries),
+            "limit": limit,
+            "runs": runs,
+            "embedder": f"stub/{dimensions}",
+            "batch_size": batch_size,
+            "workers": workers,
+        },
+        "environment": environment(),
+        "corpus_s": time.perf_counter() - start,
+        "engines": {},
+    }
+
+    if "inverted_index" in engines:
+        report["engines"]["inverted_index"] = bench_inverted_index(
+            corpus_path, f"{directory}/index", queries, limit, runs, workers, tokenizer
+        )
+    if "semantic" in engines:
+        report["engines"]["semantic"] = bench_semantic(
+            list(iter_documents(corpus_path)),
+            f"{directory}/embeddings",
+            queries,
+            limit,
+            runs,
+            batch_size,
+            StubEmbedder(dimensions),
+        )
+    return report
+
+
+def flatten(metrics: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{name}."))
+        elif name not in NOT_COMPARED:
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def compare(
+    baseline: Dict, current: Dict, threshold: float = REGRESSION_THRESHOLD
+) -> List[Dict]:
+    # the relative change of every metric both reports have; a change for
+    # the worse past the threshold is a regression
+    before = flatten(baseline["engines"])
+    after = flatten(current["engines"])
+    rows = []
+    for metric in sorted(before.keys() & after.keys()):
+        old, new = before[metric], after[metric]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = change
+        if metric.rsplit(".", 1)[-1] in HIGHER_IS_BETTER:
+            worse = -change
+        rows.append(
+            {
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": change,
+                "regressed": worse > threshold,
+            }
+        )
+    return rows
+
+
+def print_report(report: Dict):
+    config = report["config"]
+    print(
+        f"Documents: {config['documents']} (written in {report['corpus_s']:.2f}s), "
+        f"queries: {config['queries']}, k: {config['limit']}, runs: {config['runs']}"
+    )
+    print(f"{'engine':<16}{'build':>10}{'index':>12}{'load':>11}")
+    for engine, metrics in report["engines"].items():
+        print(
+            f"{engine:<16}{metrics['build_s']:>9.2f}s{metrics['index_mb']:>9.2f} MB"
+            f"{metrics['load_ms']:>9.2f}ms"
+        )
+    print(
+        f"{'engine':<16}{'operation':<13}{'p50':>10}{'p95':>10}{'p99':>10}{'qps':>10}"
+    )
+    for engine, metrics in report["engines"].items():
+        for operation, stats in metrics["queries"].items():
+            print(
+                f"{engine:<16}{operation:<13}{stats['p50_ms']:>8.3f}ms"
+                f"{stats['p95_ms']:>8.3f}ms{stats['p99_ms']:>8.3f}ms"
+                f"{stats['qps']:>10.1f}"
+            )
+
+
+def print_comparison(baseline: Dict, current: Dict, rows: List[Dict]) -> bool:
+    changed = [
+        key
+        for key in baseline["config"].keys() | current["config"].keys()
+        if baseline["config"].get(key) != current["config"].get(key)
+    ]
+    if changed:
+        print(f"Warning: runs differ in {', '.join(sorted(changed))}")
+    print(
+        f"Baseline: {baseline['environment']['commit']}, "
+        f"current: {current['environment']['commit']}"
+    )
+    print(f"{'metric':<42}{'baseline':>12}{'current':>12}{'change':>9}")
+    for row in rows:
+        print(
+            f"{row['metric']:<42}{row['baseline']:>12.3f}{row['current']:>12.3f}"
+            f"{row['change']:>+9.1%}" + ("  REGRESSION" if row["regressed"] else "")
+        )
+    return any(row["regressed"] for row in rows)
+
+
+def load_report(path: str) -> Dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Indexing and retrieval benchmarks on a synthetic corpus"
+    )
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    run_parser = subparsers.add_parser("run", help="Run the suite")
+    run_parser.add_argument(
+        "--docs", type=int, help="Corpus size (default: the movie dataset's)"
+    )
+    run_parser.add_argument("--queries", type=int, default=200)
+    run_parser.add_argument(
+        "--queries-file", type=str, help="File with one query per line"
+    )
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--limit", type=int, default=10)
+    run_parser.add_argument("--runs", type=int, default=3)
+    run_parser.add_argument(
+        "--engines", choices=ENGINES, nargs="+", default=list(ENGINES)
+    )
+    run_parser.add_argument(
+        "--dimensions", type=int, default=384, help="Stub embedding size"
+    )
+    run_parser.add_argument(
+        "--batch-size", type=int, default=32, help="Queries per batched search"
+    )
+    run_parser.add_argument(
+        "--workers", type=int, default=1, help="Index build workers"
+    )
+    run_parser.add_argument(
+        "--workdir", type=str, help="Where to build (default: a temporary directory)"
+    )
+    run_parser.add_argument("--output", type=str, help="Write the report as JSON")
+    run_parser.add_argument(
+        "--baseline", type=str, help="Compare with this report when done"
+    )
+    run_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two reports and fail on regressions"
+    )
+    compare_parser.add_argument("baseline", type=str, help="Report to compare with")
+    compare_parser.add_argument("current", type=str, help="Report to check")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="Relative change that counts as a regression",
+    )
+
+    args = parser.parse_args()
+    match args.command:
+        case "run":
+            movies = load_movies()
+            if args.queries_file:
+                with open(args.queries_file, "r") as f:
+                    queries = [line.strip() for line in f if line.strip()]
+            else:
+                queries = make_queries(movies, args.queries, args.seed)
+
+            with tempfile.TemporaryDirectory(dir=args.workdir) as directory:
+                report = run_suite(
+                    movies,
+                    queries,
+                    args.docs if args.docs is not None else len(movies),
+                    directory,
+                    args.engines,
+                    args.seed,
+                    args.limit,
+                    args.runs,
+                    args.dimensions,
+                    args.batch_size,
+                    args.workers,
+                )
+            print_report(report)
+
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(report, f, indent=2)
+
+            if args.baseline:
+                baseline = load_report(args.baseline)
+                rows = compare(baseline, report, args.threshold)
+                if print_comparison(baseline, report, rows):
+                    exit(1)
+
+        case "compare":
+            baseline, current = load_report(args.baseline), load_report(args.current)
+            rows = compare(baseline, current, args.threshold)
+            if print_comparison(baseline, current, rows):
+                exit(1)
+
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
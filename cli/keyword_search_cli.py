@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
+import time
 
 from utils.keyword_search_parsers import register_parsers
 
-from services.indexing import InvertedIndex
-from services.processing import search_field, tokenize
+from services.fields import search_fields
+from services.indexing import InvertedIndex, convert_pickle_cache
+from services.processing import iter_documents
+from services.result_cache import ResultCache, result_cache_dir
+from services.tracing import profile_command
 
 
 def main() -> None:
@@ -14,14 +18,22 @@ def main() -> None:
     register_parsers(parser)
 
     args = parser.parse_args()
+    profile_command(args.command, args.profile, args.profile_output)
     match args.command:
         case "search_keyword":
             print(f"Searching for: {args.query}")
-            search_results = search_field(field="title", query=args.query)
+            try:
+                weights = {}
+                for field in args.field or ["title"]:
+                    name, _, weight = field.partition(":")
+                    weights[name] = float(weight or 1.0)
+                search_results = search_fields(args.query, weights, args.limit)
+            except ValueError as e:
+                print("Error:", e)
+                exit(1)
 
-            max_results = 5 if len(search_results) >= 5 else len(search_results)
-            for i in range(max_results):
-                print(f"{i + 1}. {search_results[i]['title']}")
+            for i, (doc, score) in enumerate(search_results):
+                print(f"{i + 1}. {doc['title']} - Score: {score:.2f}")
 
         case "search":
             inverted_index = InvertedIndex()
@@ -31,14 +43,68 @@ def main() -> None:
                 print("Error:", e)
                 exit(1)
 
-            tokens = tokenize(args.query)
-            matching_docs = inverted_index.search(tokens)
+            try:
+                results = inverted_index.boolean_search(args.query, args.limit)
+            except ValueError as e:
+                print("Error:", e)
+                exit(1)
+
             print(f"Searching for: {args.query}")
-            if not matching_docs:
+            if not results:
                 print(f"No results found for: {args.query}")
             else:
-                for n, doc in enumerate(matching_docs):
-                    print(f"{n + 1}. {doc['id']} {doc['title']}")
+                for n, id in enumerate(results):
+                    title = inverted_index.docmap[id]["title"]
+                    print(f"{n + 1}. {id} {title} - Score: {results[id]:.2f}")
+
+        case "bm25search" if args.sharded:
+            # chunking, rerank, sharding and server are imported by the
+            # commands using them: chunking and rerank load numpy
+            from services.rerank import Reranker, rerank_cache_dir
+            from services.sharding import ShardedIndex
+
+            sharded_index = ShardedIndex(workers=args.workers)
+            try:
+                sharded_index.load()
+            except FileNotFoundError as e:
+                print("Error: ", e)
+                exit(1)
+
+            if args.rerank_top:
+                n_results = max(args.limit, args.rerank_top)
+                scores = sharded_index.bm25_search(args.query, n_results)
+                candidates = [dict(sharded_index.document(id), id=id) for id in scores]
+                reranked = Reranker(
+                    budget_ms=args.rerank_budget_ms, path=rerank_cache_dir
+                ).rerank(args.query, candidates, args.limit)
+                results = {doc["id"]: scores[doc["id"]] for doc in reranked}
+            else:
+                results = sharded_index.bm25_search(args.query, args.limit)
+            for idx, id in enumerate(results):
+                title = sharded_index.document(id)["title"]
+                print(f"{idx + 1}. ({id}) {title} - Score: {results[id]:.2f}")
+            sharded_index.close()
+
+        case "bm25search" if args.passages:
+            from services.chunking import load_passage_search
+            from services.rerank import Reranker, rerank_cache_dir
+
+            passage_search = load_passage_search(args.pooling)
+            index = passage_search.load_or_create_index()
+            if args.cache:
+                index.result_cache = ResultCache("bm25", result_cache_dir)
+            n_results = max(args.limit, args.rerank_top)
+            results = passage_search.bm25_search(args.query, n_results)
+            if args.rerank_top:
+                results = Reranker(
+                    budget_ms=args.rerank_budget_ms, path=rerank_cache_dir
+                ).rerank(args.query, results, args.limit)
+            for idx, result in enumerate(results):
+                print(
+                    f"{idx + 1}. ({result['id']}) {result['title']} "
+                    f"- Score: {result['score']:.2f}"
+                )
+                print(f"   {result['passage']}")
 
         case "bm25search":
             inverted_index = InvertedIndex()
@@ -47,8 +113,21 @@ def main() -> None:
             except FileNotFoundError as e:
                 print("Error: ", e)
                 exit(1)
+            if args.cache:
+                inverted_index.result_cache = ResultCache("bm25", result_cache_dir)
 
-            results = inverted_index.bm25_search(args.query, args.limit)
+            if args.rerank_top:
+                from services.rerank import Reranker, rerank_cache_dir
+
+                n_results = max(args.limit, args.rerank_top)
+                scores = inverted_index.bm25_search(args.query, n_results)
+                candidates = [dict(inverted_index.docmap[id], id=id) for id in scores]
+                reranked = Reranker(
+                    budget_ms=args.rerank_budget_ms, path=rerank_cache_dir
+                ).rerank(args.query, candidates, args.limit)
+                results = {doc["id"]: scores[doc["id"]] for doc in reranked}
+            else:
+                results = inverted_index.bm25_search(args.query, args.limit)
             for idx, id in enumerate(results):
                 document = inverted_index.docmap[id]
                 title = document["title"]
@@ -107,7 +186,8 @@ def main() -> None:
 
             term_freq = inverted_index.get_tf(doc_id=args.doc_id, term=args.term)
             print(
-                f"Term frequency for term {args.term} in document {args.doc_id}: {term_freq}"
+                f"Term frequency for term {args.term} in document {args.doc_id}: "
+                f"{term_freq}"
             )
 
         case "idf":
@@ -121,15 +201,81 @@ def main() -> None:
             idf = inverted_index.get_idf(args.term)
             print(f"Inverse document frequency of {args.term}: {idf:.2f}")
 
+        case "build" if args.shards:
+            from services.sharding import ShardedIndex
+
+            sharded_index = ShardedIndex(workers=args.workers)
+
+            print(f"Building {args.shards} index shards...")
+            start = time.perf_counter()
+            n_docs = sharded_index.build(args.shards, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            print(
+                f"Indexed {n_docs} documents in {elapsed:.2f}s "
+                f"({n_docs / elapsed:.0f} docs/s)"
+            )
+            sharded_index.close()
+
         case "build":
-            inverted_index = InvertedIndex()
+            inverted_index = InvertedIndex(codec=args.codec)
 
             print("Building indexes...")
-            inverted_index.build()
+            start = time.perf_counter()
+            n_docs = inverted_index.build_streaming(
+                workers=args.workers, batch_size=args.batch_size
+            )
+            elapsed = time.perf_counter() - start
+            print(
+                f"Indexed {n_docs} documents in {elapsed:.2f}s "
+                f"({n_docs / elapsed:.0f} docs/s)"
+            )
 
             print("Saving to disk...")
             inverted_index.save()
 
+        case "add":
+            inverted_index = InvertedIndex()
+            n_docs = inverted_index.add_documents(iter_documents(args.path))
+            print(
+                f"Added {n_docs} documents, "
+                f"{len(inverted_index.segments)} segments in the index"
+            )
+
+        case "delete":
+            inverted_index = InvertedIndex()
+            try:
+                inverted_index.delete_document(args.doc_id)
+            except ValueError as e:
+                print("Error:", e)
+                exit(1)
+            print(f"Deleted document {args.doc_id}")
+
+        case "merge":
+            inverted_index = InvertedIndex()
+            inverted_index.merge()
+            print(f"Merged into {len(inverted_index.segments)} segment(s)")
+
+        case "serve":
+            from services.server import serve
+
+            serve(
+                host=args.host,
+                port=args.port,
+                workers=args.workers,
+                executor=args.executor,
+                semantic=not args.no_semantic,
+                ann=args.ann,
+                result_cache=not args.no_result_cache,
+            )
+
+        case "convert":
+            try:
+                convert_pickle_cache()
+            except FileNotFoundError as e:
+                print("Error:", e)
+                exit(1)
+            print("Converted pickle cache to segment format")
+
         case _:
             parser.print_help()
 
@@ -1,7 +1,14 @@
 import argparse
 
 from cli.utils.semantic_search_parsers import register_parsers
+from services.chunking import load_passage_search
+from services.embedding_cache import QueryEmbeddingCache
+from services.hybrid import HybridSearch
+from services.indexing import InvertedIndex
 from services.processing import load_movies
+from services.rerank import Reranker, rerank_cache_dir
+from services.result_cache import ResultCache, result_cache_dir
+from services.server import serve
 from services.semantic_search import (
     SemanticSearch,
     embed_query_text,
@@ -9,6 +16,8 @@ from services.semantic_search import (
     verify_embeddings,
     verify_model,
 )
+from services.tracing import profile_command
+from services.utils import EMBEDDING_MODEL
 
 
 def main():
@@ -17,6 +26,7 @@ def main():
     register_parsers(parser)
 
     args = parser.parse_args()
+    profile_command(args.command, args.profile, args.profile_output)
 
     match args.command:
         case "verify":
@@ -31,12 +41,78 @@ def main():
         case "verify_embeddings":
             verify_embeddings()
 
+        case "build_embeddings":
+            ss = SemanticSearch()
+            ss.build_embeddings(load_movies(), args.batch_size, args.workers)
+
+        case "serve":
+            serve(
+                host=args.host,
+                port=args.port,
+                workers=args.workers,
+                executor=args.executor,
+                semantic=not args.no_semantic,
+                ann=args.ann,
+                result_cache=not args.no_result_cache,
+            )
+
+        case "cache_stats":
+            total = QueryEmbeddingCache(EMBEDDING_MODEL).stats()["total"]
+            print(f"Memory hits: {total['memory_hits']}")
+            print(f"Disk hits: {total['disk_hits']}")
+            print(f"Misses: {total['misses']}")
+            print(f"Cached embeddings on disk: {total['disk_entries']}")
+
+            hits = total["memory_hits"] + total["disk_hits"]
+            lookups = hits + total["misses"]
+            if lookups:
+                print(f"Hit rate: {hits / lookups:.1%} ({hits}/{lookups})")
+
+            for engine in ("bm25", "semantic"):
+                total = ResultCache(engine, result_cache_dir).stats()["total"]
+                hits = total["memory_hits"] + total["disk_hits"]
+                lookups = hits + total["misses"]
+                print(
+                    f"Cached {engine} results: {total['hit_rate']:.1%} hit rate "
+                    f"({hits}/{lookups})"
+                )
+
+        case "search" if args.passages:
+            passage_search = load_passage_search(args.pooling)
+            ss = passage_search.load_or_create_embeddings(
+                quantization=args.quantization, rerank=args.rerank
+            )
+            if args.cache:
+                ss.result_cache = ResultCache("semantic", result_cache_dir)
+            if not args.exact and args.quantization is None:
+                ss.load_or_create_ann_index()
+            results = passage_search.semantic_search(
+                args.query, max(args.limit, args.rerank_top), args.exact, args.nprobe
+            )
+            if args.rerank_top:
+                results = Reranker(
+                    budget_ms=args.rerank_budget_ms, path=rerank_cache_dir
+                ).rerank(args.query, results, args.limit)
+            for n, result in enumerate(results):
+                print(f"{n + 1}. {result['title']} (score: {result['score']:.4f}) ")
+                print(f"{result['passage']}\n")
+
         case "search":
             documents = load_movies()
 
-            ss = SemanticSearch()
+            ss = SemanticSearch(quantization=args.quantization, rerank=args.rerank)
             ss.load_or_create_embeddings(documents)
-            results = ss.search(args.query, args.limit)
+            if args.cache:
+                ss.result_cache = ResultCache("semantic", result_cache_dir)
+            if not args.exact and args.quantization is None:
+                ss.load_or_create_ann_index()
+            results = ss.search(
+                args.query, max(args.limit, args.rerank_top), args.exact, args.nprobe
+            )
+            if args.rerank_top:
+                results = Reranker(
+                    budget_ms=args.rerank_budget_ms, path=rerank_cache_dir
+                ).rerank(args.query, results, args.limit)
             for n, result in enumerate(results):
                 title = result["title"].encode().decode("unicode-escape")
 
@@ -50,6 +126,39 @@ def main():
 
                 print(f"{truncated_desc}\n")
 
+        case "hybrid":
+            index = InvertedIndex()
+            index.load()
+
+            ss = SemanticSearch()
+            ss.load_or_create_embeddings(load_movies())
+            if not args.exact and not args.restrict:
+                ss.load_or_create_ann_index()
+
+            hybrid = HybridSearch(index, ss)
+            results = hybrid.search(
+                args.query,
+                max(args.limit, args.rerank_top),
+                mode=args.mode,
+                alpha=args.alpha,
+                k=args.k,
+                restrict=args.restrict,
+                exact=args.exact,
+            )
+            hybrid.close()
+            if args.rerank_top:
+                results = Reranker(
+                    budget_ms=args.rerank_budget_ms, path=rerank_cache_dir
+                ).rerank(args.query, results, args.limit)
+            for n, result in enumerate(results):
+                print(f"{n + 1}. {result['title']} (score: {result['score']:.4f})")
+                bm25 = result["bm25_score"]
+                semantic = result["semantic_score"]
+                print(
+                    f"   BM25: {'-' if bm25 is None else f'{bm25:.4f}'}, "
+                    f"semantic: {'-' if semantic is None else f'{semantic:.4f}'}"
+                )
+
         case _:
             parser.print_help()
 
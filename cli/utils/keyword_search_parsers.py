@@ -1,21 +1,47 @@
 import argparse
 
-from services.utils import BM25_B, BM25_K1
+from services.utils import (
+    BM25_B,
+    BM25_K1,
+    BUILD_BATCH_SIZE,
+    PASSAGE_POOLING,
+    PASSAGE_POOLINGS,
+    POSTINGS_CODEC,
+    POSTINGS_CODECS,
+)
+
+from .profile_parsers import add_profile_arguments
+from .rerank_parsers import add_rerank_arguments
+from .serve_parsers import register_serve_parser
 
 
 def register_parsers(parser: argparse.ArgumentParser):
+    add_profile_arguments(parser)
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     search_keyword_parser = subparsers.add_parser(
-        "search_keyword", help="Search movies using simple search"
+        "search_keyword", help="Search movie fields, ranked by BM25F"
     )
     search_keyword_parser.add_argument("query", type=str, help="Search query")
+    search_keyword_parser.add_argument(
+        "--field",
+        type=str,
+        action="append",
+        help="Field to search as name or name:weight, repeatable (default: title)",
+    )
+    search_keyword_parser.add_argument(
+        "--limit", type=int, nargs="?", default=5, help="Max results"
+    )
 
     search_parser = subparsers.add_parser(
-        "search", help="Search movies using Inverted Index"
+        "search",
+        help='Boolean search: AND, OR, NOT, parentheses and "quoted phrases"',
     )
 
     search_parser.add_argument("query", type=str, help="Search query")
+    search_parser.add_argument(
+        "--limit", type=int, nargs="?", default=5, help="Max results"
+    )
 
     tf_parser = subparsers.add_parser("tf", help="Search movies using TF")
     tf_parser.add_argument("doc_id", type=int, help="Document id to search")
@@ -52,5 +78,84 @@ def register_parsers(parser: argparse.ArgumentParser):
     bm25_search_parser.add_argument(
         "--limit", type=int, nargs="?", default=5, help="Max results"
     )
+    # the sharded index has no build id to key cached results by
+    bm25_source_group = bm25_search_parser.add_mutually_exclusive_group()
+    bm25_source_group.add_argument(
+        "--sharded", action="store_true", help="Search the sharded index"
+    )
+    bm25_search_parser.add_argument(
+        "--passages",
+        action="store_true",
+        help="Search chunked passages, collapsed back to movies",
+    )
+    bm25_search_parser.add_argument(
+        "--pooling",
+        choices=PASSAGE_POOLINGS,
+        default=PASSAGE_POOLING,
+        help="Score a movie by its best passage or the sum of its passages",
+    )
+    add_rerank_arguments(bm25_search_parser)
+    bm25_source_group.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse results cached on disk for the same query and index version",
+    )
+    bm25_search_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes querying shards, one per shard by default",
+    )
 
-    subparsers.add_parser("build", help="Build inverted indexes from movies list")
+    build_parser = subparsers.add_parser(
+        "build", help="Build inverted indexes from movies list"
+    )
+    build_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Processes tokenizing documents (or building shards), "
+            "1 builds in this process"
+        ),
+    )
+    build_parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Partition documents by id into this many saved index shards",
+    )
+    build_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BUILD_BATCH_SIZE,
+        help="Documents per tokenization batch",
+    )
+    build_parser.add_argument(
+        "--codec",
+        choices=POSTINGS_CODECS,
+        default=POSTINGS_CODEC,
+        help="Posting list compression of the saved index",
+    )
+
+    add_parser = subparsers.add_parser(
+        "add", help="Add or replace documents in a new index segment"
+    )
+    add_parser.add_argument(
+        "path", type=str, help="JSON file with a 'movies' array, or JSONL"
+    )
+
+    delete_parser = subparsers.add_parser(
+        "delete", help="Delete a document from the index"
+    )
+    delete_parser.add_argument("doc_id", type=int, help="Document id to delete")
+
+    subparsers.add_parser(
+        "merge", help="Compact all index segments and drop deleted documents"
+    )
+
+    register_serve_parser(subparsers)
+
+    subparsers.add_parser(
+        "convert", help="Convert the pickled index cache to the on-disk segment format"
+    )
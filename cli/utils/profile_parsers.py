@@ -0,0 +1,20 @@
+import argparse
+
+from services.tracing import PROFILE_ENV, PROFILE_OUTPUT_ENV
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Trace where the command spends its time, also set by {PROFILE_ENV}=1",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        help=(
+            "Write the trace here instead of stderr: *.prof for cProfile stats, "
+            "*.folded for flamegraph stacks, else JSON lines "
+            f"(default: ${PROFILE_OUTPUT_ENV})"
+        ),
+    )
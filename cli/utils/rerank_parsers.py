@@ -0,0 +1,23 @@
+import argparse
+
+from services.utils import RERANK_BUDGET_MS, RERANK_CANDIDATES
+
+
+def add_rerank_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--rerank-top",
+        type=int,
+        nargs="?",
+        const=RERANK_CANDIDATES,
+        default=0,
+        help=(
+            "Rescore the top N results with a cross-encoder "
+            f"({RERANK_CANDIDATES} without N)"
+        ),
+    )
+    parser.add_argument(
+        "--rerank-budget-ms",
+        type=float,
+        default=RERANK_BUDGET_MS,
+        help="Stop reranking after this long and keep first stage order for the rest",
+    )
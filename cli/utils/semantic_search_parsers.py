@@ -1,7 +1,22 @@
 import argparse
 
+from services.utils import (
+    EMBEDDING_BATCH_SIZE,
+    HYBRID_ALPHA,
+    IVF_NPROBE,
+    PASSAGE_POOLING,
+    PASSAGE_POOLINGS,
+    QUANTIZED_RERANK,
+    RRF_K,
+)
+
+from .profile_parsers import add_profile_arguments
+from .rerank_parsers import add_rerank_arguments
+from .serve_parsers import register_serve_parser
+
 
 def register_parsers(parser: argparse.ArgumentParser):
+    add_profile_arguments(parser)
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     subparsers.add_parser(
@@ -16,6 +31,32 @@ def register_parsers(parser: argparse.ArgumentParser):
 
     subparsers.add_parser("verify_embeddings", help="Verify embeddings")
 
+    build_parser = subparsers.add_parser(
+        "build_embeddings",
+        help="Rebuild the embedding store, resuming an interrupted build",
+    )
+    build_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EMBEDDING_BATCH_SIZE,
+        help="Documents per encoded batch",
+    )
+    build_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Processes encoding batches, each loading the model; "
+            "1 encodes in this process"
+        ),
+    )
+
+    register_serve_parser(subparsers)
+
+    subparsers.add_parser(
+        "cache_stats", help="Show query embedding cache hits and misses"
+    )
+
     embed_query_parser = subparsers.add_parser(
         "embedquery", help="Generate embeddings for query"
     )
@@ -28,3 +69,77 @@ def register_parsers(parser: argparse.ArgumentParser):
     semantic_search_parser.add_argument(
         "--limit", type=int, nargs="?", default=5, help="Max results"
     )
+    semantic_search_parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Score every embedding instead of using the ANN index",
+    )
+    semantic_search_parser.add_argument(
+        "--nprobe",
+        type=int,
+        default=IVF_NPROBE,
+        help="ANN lists to probe, higher is slower with better recall",
+    )
+    semantic_search_parser.add_argument(
+        "--quantization",
+        choices=["int8", "pq"],
+        default=None,
+        help="Score quantized embeddings instead of float32",
+    )
+    semantic_search_parser.add_argument(
+        "--rerank",
+        type=int,
+        default=QUANTIZED_RERANK,
+        help="Quantized candidates to rerank with float32 vectors, 0 to disable",
+    )
+    semantic_search_parser.add_argument(
+        "--passages",
+        action="store_true",
+        help="Search chunked passages, collapsed back to movies",
+    )
+    semantic_search_parser.add_argument(
+        "--pooling",
+        choices=PASSAGE_POOLINGS,
+        default=PASSAGE_POOLING,
+        help="Score a movie by its best passage or the sum of its passages",
+    )
+    add_rerank_arguments(semantic_search_parser)
+    semantic_search_parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse results cached on disk for the same query and index version",
+    )
+
+    hybrid_parser = subparsers.add_parser(
+        "hybrid", help="Search movies with BM25 and semantic search fused"
+    )
+    hybrid_parser.add_argument("query", type=str, help="Text to search")
+    hybrid_parser.add_argument(
+        "--limit", type=int, nargs="?", default=5, help="Max results"
+    )
+    hybrid_parser.add_argument(
+        "--mode",
+        choices=["weighted", "rrf"],
+        default="rrf",
+        help="Fuse min-max normalized scores or reciprocal ranks",
+    )
+    hybrid_parser.add_argument(
+        "--alpha",
+        type=float,
+        default=HYBRID_ALPHA,
+        help="Weight of the BM25 score in weighted mode, between 0 and 1",
+    )
+    hybrid_parser.add_argument(
+        "--k", type=int, default=RRF_K, help="RRF rank constant in rrf mode"
+    )
+    hybrid_parser.add_argument(
+        "--restrict",
+        action="store_true",
+        help="Only score the BM25 candidates with embeddings",
+    )
+    hybrid_parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Score every embedding instead of using the ANN index",
+    )
+    add_rerank_arguments(hybrid_parser)
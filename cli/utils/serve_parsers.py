@@ -0,0 +1,33 @@
+import argparse
+
+from services.utils import SERVER_HOST, SERVER_PORT
+
+
+def register_serve_parser(subparsers: argparse._SubParsersAction):
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve BM25, semantic and hybrid search over HTTP"
+    )
+    serve_parser.add_argument("--host", type=str, default=SERVER_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT)
+    serve_parser.add_argument(
+        "--workers", type=int, default=4, help="Scoring pool size"
+    )
+    serve_parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="Score in threads sharing one index and model, or in worker processes",
+    )
+    serve_parser.add_argument(
+        "--no-semantic",
+        action="store_true",
+        help="Only serve /bm25, without loading the embedding model",
+    )
+    serve_parser.add_argument(
+        "--ann", action="store_true", help="Use the ANN index for semantic search"
+    )
+    serve_parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        help="Compute every request instead of reusing cached results",
+    )
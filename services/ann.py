@@ -0,0 +1,154 @@
+import hashlib
+import math
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .utils import IVF_KMEANS_ITERATIONS, IVF_NPROBE
+
+IVF_FORMAT_VERSION = 1
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def fingerprint(vectors: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(vectors).tobytes()).hexdigest()
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # argpartition for the k best, then sort only those k
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iterations: int = IVF_KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # re-seed empty clusters with random points instead of dropping them
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    # Inverted file index over L2-normalized vectors: a k-means coarse
+    # quantizer assigns every vector to one list, and a query only scores the
+    # vectors of its nprobe closest lists.
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        list_vectors: np.ndarray,
+        source_fingerprint: str,
+    ):
+        self.centroids = centroids
+        # rows of list i are list_rows[list_offsets[i]:list_offsets[i + 1]]
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        # the vectors reordered by list, so each probed list is contiguous
+        self.list_vectors = list_vectors
+        self.source_fingerprint = source_fingerprint
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        nlist: Optional[int] = None,
+        max_training_points: int = 256,
+        seed: int = 0,
+        source_fingerprint: Optional[str] = None,
+    ) -> "IVFIndex":
+        vectors = normalize(embeddings)
+        if nlist is None:
+            nlist = max(1, int(4 * math.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+
+        rng = np.random.default_rng(seed)
+        n_training = min(len(vectors), nlist * max_training_points)
+        training = vectors[rng.choice(len(vectors), n_training, replace=False)]
+        centroids = spherical_kmeans(training, nlist, seed=seed)
+
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        list_rows = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        return cls(
+            centroids,
+            list_offsets,
+            list_rows,
+            vectors[list_rows],
+            source_fingerprint or fingerprint(embeddings),
+        )
+
+    def search(
+        self, query: np.ndarray, k: int, nprobe: int = IVF_NPROBE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        query = normalize(query)
+        probes = top_k(self.centroids @ query, min(nprobe, self.nlist))
+
+        ranges = [
+            np.arange(self.list_offsets[p], self.list_offsets[p + 1]) for p in probes
+        ]
+        positions = np.concatenate(ranges)
+        scores = self.list_vectors[positions] @ query
+
+        best = top_k(scores, k)
+        return self.list_rows[positions[best]], scores[best]
+
+    def save(self, path: str):
+        # replace rather than truncate, so a save cut short leaves the old index
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                version=IVF_FORMAT_VERSION,
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_rows=self.list_rows,
+                list_vectors=self.list_vectors,
+                source_fingerprint=self.source_fingerprint,
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Could not find {path}")
+
+        with np.load(path) as data:
+            if int(data["version"]) != IVF_FORMAT_VERSION:
+                raise ValueError(f"Unsupported IVF index version in {path}")
+
+            return cls(
+                data["centroids"],
+                data["list_offsets"],
+                data["list_rows"],
+                data["list_vectors"],
+                str(data["source_fingerprint"]),
+            )
@@ -0,0 +1,290 @@
+import heapq
+import math
+from bisect import bisect_left
+from operator import itemgetter
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple, Union
+
+from .postings import PostingLists, max_tf_score
+from .segment import SegmentedPostings
+from .tracing import count, span
+from .utils import BM25_B, BM25_K1
+
+
+def bm25_idf(n_docs: int, n_matching_docs: int) -> float:
+    return math.log((n_docs - n_matching_docs + 0.5) / (n_matching_docs + 0.5) + 1)
+
+
+class BM25Scorer:
+    def __init__(
+        self,
+        postings: Union[PostingLists, SegmentedPostings],
+        n_docs: int,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        avg_doc_length: Optional[float] = None,
+        pruning: bool = True,
+    ):
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        # n_docs and avg_doc_length are given for a shard, whose own
+        # statistics are not the collection's
+        self.n_docs = n_docs
+        if avg_doc_length is None:
+            avg_doc_length = postings.avg_doc_length
+        self.avg_doc_length = avg_doc_length
+        # filled per term on first use so that opening a mapped segment does
+        # not have to walk the whole term dictionary
+        self.idf: Dict[str, float] = {}
+        # (segment, term) -> upper bound of the term's tf component
+        self.bounds: Dict[Tuple[int, str], float] = {}
+        self.pruning = pruning
+
+    def term_idf(self, term: str) -> float:
+        idf = self.idf.get(term)
+        if idf is None:
+            with span("idf"):
+                idf = bm25_idf(self.n_docs, self.postings.document_frequency(term))
+            self.idf[term] = idf
+        return idf
+
+    def term_bound(
+        self,
+        part: int,
+        postings: PostingLists,
+        term: str,
+        doc_ids: memoryview,
+        tfs: memoryview,
+    ) -> float:
+        # the highest tf component of term in one segment: stored at build
+        # time, or computed once here when the segment's statistics are not
+        # the ones scored with (several segments, shards)
+        bound = self.bounds.get((part, term))
+        if bound is None:
+            if postings.avg_doc_length == self.avg_doc_length:
+                bound = postings.max_score(term, self.k1, self.b)
+            if bound is None:
+                bound = max_tf_score(
+                    doc_ids,
+                    tfs,
+                    postings.doc_lengths,
+                    self.avg_doc_length,
+                    self.k1,
+                    self.b,
+                )
+            self.bounds[(part, term)] = bound
+        return bound
+
+    def score(self, tokens: Iterable[str], limit: int) -> Dict[int, float]:
+        tokens = list(tokens)
+        if self.pruning and len(tokens) > 1 and limit > 0:
+            with span("maxscore"):
+                return dict(self.score_pruned(tokens, limit))
+
+        with span("accumulate"):
+            scores = self.score_all(tokens)
+        with span("top_k"):
+            return dict(self.top_k(scores, limit))
+
+    def score_all(self, tokens: Iterable[str]) -> Dict[int, float]:
+        k1, b = self.k1, self.b
+        k1_plus_one = k1 + 1
+        avg_doc_length = self.avg_doc_length
+        scores: Dict[int, float] = {}
+        for token in tokens:
+            # one part per segment; idf and avgdl are global across them
+            for _, postings, doc_ids, tfs, deleted in self.postings.segment_postings(
+                token
+            ):
+                idf = self.term_idf(token)
+                doc_lengths = postings.doc_lengths
+                count("postings_scanned", len(doc_ids))
+                pairs = zip(doc_ids, tfs)
+                if deleted:
+                    pairs = ((d, tf) for d, tf in pairs if d not in deleted)
+
+                for doc_id, tf in pairs:
+                    length_norm = 1 - b + b * (doc_lengths[doc_id] / avg_doc_length)
+                    bm25_tf = (tf * k1_plus_one) / (tf + k1 * length_norm)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + bm25_tf * idf
+        count("docs_scored", len(scores))
+        return scores
+
+    def score_pruned(self, tokens: List[str], limit: int) -> List[Tuple[int, float]]:
+        # MaxScore, term at a time. Terms are accumulated from the highest
+        # upper bound down; once the k-th best partial score beats all that
+        # the remaining terms could add, no new document can reach the top-k,
+        # so the remaining (long, low idf) lists are only probed for the
+        # surviving candidates. The final candidates are rescored in query
+        # order, so the result equals top_k(score_all(tokens), limit) exactly.
+        terms: List[Tuple[float, float, List[Tuple]]] = []
+        for token in tokens:
+            idf = self.term_idf(token)
+            parts = list(self.postings.segment_postings(token))
+            bound = max(
+                (
+                    self.term_bound(part[0], part[1], token, part[2], part[3])
+                    for part in parts
+                ),
+                default=0.0,
+            )
+            terms.append((bound * idf, idf, parts))
+        by_bound = sorted(terms, key=itemgetter(0), reverse=True)
+        # remaining[i]: the most terms i.. add to any document together
+        remaining = [0.0] * (len(by_bound) + 1)
+        for i in range(len(by_bound) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + by_bound[i][0]
+
+        scores: Dict[int, float] = {}
+        threshold = -math.inf
+        i = 0
+        while i < len(by_bound):
+            _, idf, parts = by_bound[i]
+            for _, postings, doc_ids, tfs, deleted in parts:
+                self.__accumulate(scores, postings, doc_ids, tfs, deleted, idf)
+            i += 1
+            # the k-th score cannot exceed the bounds accumulated so far
+            if len(scores) >= limit and remaining[i] < remaining[0] - remaining[i]:
+                threshold = heapq.nlargest(limit, scores.values())[-1]
+                if _below(remaining[i], threshold):
+                    break
+
+        count("docs_scored", len(scores))
+        candidates = {
+            doc_id: score
+            for doc_id, score in scores.items()
+            if not _below(score + remaining[i], threshold)
+        }
+        for j in range(i, len(by_bound)):
+            _, idf, parts = by_bound[j]
+            for _, postings, doc_ids, tfs, deleted in parts:
+                self.__probe(candidates, postings, doc_ids, tfs, deleted, idf)
+            if len(candidates) >= limit:
+                threshold = max(
+                    threshold, heapq.nlargest(limit, candidates.values())[-1]
+                )
+            candidates = {
+                doc_id: score
+                for doc_id, score in candidates.items()
+                if not _below(score + remaining[j + 1], threshold)
+            }
+
+        ranked = sorted(
+            (-self.__rescore(doc_id, terms), doc_id) for doc_id in candidates
+        )
+        return [(doc_id, -score) for score, doc_id in ranked[:limit]]
+
+    def score_documents(
+        self, tokens: Iterable[str], doc_ids: Iterable[int], limit: int
+    ) -> Dict[int, float]:
+        # BM25 of the given documents only, e.g. the matches of a boolean
+        # query; short term lists are scanned, long ones probed for them
+        scores = dict.fromkeys(doc_ids, 0.0)
+        for token in tokens:
+            idf = self.term_idf(token)
+            for (
+                _,
+                postings,
+                term_doc_ids,
+                tfs,
+                deleted,
+            ) in self.postings.segment_postings(token):
+                self.__probe(scores, postings, term_doc_ids, tfs, deleted, idf)
+        count("docs_scored", len(scores))
+        return dict(self.top_k(scores, limit))
+
+    def __length_norm(self, postings: PostingLists, doc_id: int) -> float:
+        b = self.b
+        return 1 - b + b * (postings.doc_lengths[doc_id] / self.avg_doc_length)
+
+    def __accumulate(
+        self,
+        scores: Dict[int, float],
+        postings: PostingLists,
+        doc_ids: memoryview,
+        tfs: memoryview,
+        deleted: AbstractSet[int],
+        idf: float,
+    ):
+        k1, b = self.k1, self.b
+        k1_plus_one = k1 + 1
+        avg_doc_length = self.avg_doc_length
+        doc_lengths = postings.doc_lengths
+        count("postings_scanned", len(doc_ids))
+        pairs = zip(doc_ids, tfs)
+        if deleted:
+            pairs = ((d, tf) for d, tf in pairs if d not in deleted)
+
+        for doc_id, tf in pairs:
+            length_norm = 1 - b + b * (doc_lengths[doc_id] / avg_doc_length)
+            bm25_tf = (tf * k1_plus_one) / (tf + k1 * length_norm)
+            scores[doc_id] = scores.get(doc_id, 0.0) + bm25_tf * idf
+
+    def __probe(
+        self,
+        candidates: Dict[int, float],
+        postings: PostingLists,
+        doc_ids: memoryview,
+        tfs: memoryview,
+        deleted: AbstractSet[int],
+        idf: float,
+    ):
+        end = len(doc_ids)
+        # a scan beats one binary search per candidate on a short list
+        if len(candidates) * end.bit_length() >= end:
+            count("postings_scanned", end)
+            hits = [(d, tf) for d, tf in zip(doc_ids, tfs) if d in candidates]
+        else:
+            count("postings_probed", len(candidates))
+            hits = []
+            i = 0
+            for doc_id in sorted(candidates):
+                i = bisect_left(doc_ids, doc_id, i, end)
+                if i == end:
+                    break
+                if doc_ids[i] == doc_id:
+                    hits.append((doc_id, tfs[i]))
+
+        k1, b = self.k1, self.b
+        k1_plus_one = k1 + 1
+        avg_doc_length = self.avg_doc_length
+        doc_lengths = postings.doc_lengths
+        for doc_id, tf in hits:
+            if doc_id in deleted:
+                continue
+            length_norm = 1 - b + b * (doc_lengths[doc_id] / avg_doc_length)
+            bm25_tf = (tf * k1_plus_one) / (tf + k1 * length_norm)
+            candidates[doc_id] += bm25_tf * idf
+
+    def __rescore(
+        self, doc_id: int, terms: List[Tuple[float, float, List[Tuple]]]
+    ) -> float:
+        # the score summed in score_all's order
+        k1 = self.k1
+        score = 0.0
+        for _, idf, parts in terms:
+            for _, postings, doc_ids, tfs, deleted in parts:
+                i = bisect_left(doc_ids, doc_id)
+                if i == len(doc_ids) or doc_ids[i] != doc_id or doc_id in deleted:
+                    continue
+                tf = tfs[i]
+                length_norm = self.__length_norm(postings, doc_id)
+                bm25_tf = (tf * (k1 + 1)) / (tf + k1 * length_norm)
+                score += bm25_tf * idf
+        return score
+
+    @staticmethod
+    def top_k(scores: Dict[int, float], limit: int) -> List[Tuple[int, float]]:
+        # equal scores rank by doc id, so the order does not depend on which
+        # segment a document is in; no sort of every candidate
+        return heapq.nsmallest(limit, scores.items(), key=_rank)
+
+
+def _rank(item: Tuple[int, float]) -> Tuple[float, int]:
+    return -item[1], item[0]
+
+
+def _below(upper_bound: float, threshold: float) -> bool:
+    # bounds are summed in a different order than scores, so allow for
+    # rounding before ruling a document out
+    return upper_bound * (1 + 1e-9) < threshold
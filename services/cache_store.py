@@ -0,0 +1,199 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .tracing import count
+
+COUNTERS = ("memory_hits", "disk_hits", "misses")
+
+
+class CacheStore:
+    # In-process LRU in front of an optional size-bounded SQLite table, so
+    # entries are shared between processes using the same file. Entries expire
+    # after ttl seconds, if given. Hits and misses are counted for this process
+    # and, per name, summed on disk over every process. Values are kept
+    # decoded in memory and stored as whatever dumps returns (bytes or str).
+    def __init__(
+        self,
+        name: str,
+        table: str,
+        memory_size: int,
+        disk_size: int,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+        dumps: Callable[[Any], Any] = lambda value: value,
+        loads: Callable[[Any], Any] = lambda value: value,
+    ):
+        self.name = name
+        self.table = table
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.clock = clock
+        self.dumps = dumps
+        self.loads = loads
+        self.memory: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self.counters = {name: 0 for name in COUNTERS}
+        # counts not yet added to the on-disk totals, flushed with the next write
+        self.pending: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            if not os.path.exists(os.path.dirname(self.path) or "."):
+                os.makedirs(os.path.dirname(self.path))
+
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_last_used "
+                f"ON {self.table} (last_used)"
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_expires "
+                f"ON {self.table} (expires)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                "name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self.connection = connection
+        return self.connection
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        # one transaction for every key missing from memory
+        now = self.clock()
+        with self.lock:
+            values: List[Optional[Any]] = []
+            on_disk = []
+            for key in keys:
+                entry = self.memory.get(key)
+                if entry is not None and entry[0] > now:
+                    self.memory.move_to_end(key)
+                    self.__count("memory_hits")
+                    values.append(entry[1])
+                    continue
+                if entry is not None:
+                    del self.memory[key]
+                values.append(None)
+                on_disk.append(len(values) - 1)
+
+            if not on_disk:
+                return values
+            if self.path is None:
+                for _ in on_disk:
+                    self.__count("misses")
+                return values
+
+            connection = self.__connect()
+            hits = []
+            for i in on_disk:
+                row = connection.execute(
+                    f"SELECT value, expires FROM {self.table} WHERE key = ?",
+                    (keys[i],),
+                ).fetchone()
+                if row is None or row[1] <= now:
+                    self.__count("misses")
+                    continue
+
+                self.__count("disk_hits")
+                values[i] = self.loads(row[0])
+                self.__remember(keys[i], row[1], values[i])
+                hits.append((now, keys[i]))
+            connection.executemany(
+                f"UPDATE {self.table} SET last_used = ? WHERE key = ?", hits
+            )
+            self.__flush_counts()
+            return values
+
+    def put(self, key: str, value: Any):
+        self.put_many([(key, value)])
+
+    def put_many(self, items: List[Tuple[str, Any]]):
+        now = self.clock()
+        expires = now + self.ttl if self.ttl is not None else float("inf")
+        with self.lock:
+            for key, value in items:
+                self.__remember(key, expires, value)
+            if self.path is None:
+                return
+
+            connection = self.__connect()
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                [(key, self.dumps(value), expires, now) for key, value in items],
+            )
+            connection.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (now,))
+            (n_entries,) = connection.execute(
+                f"SELECT COUNT(*) FROM {self.table}"
+            ).fetchone()
+            if n_entries > self.disk_size:
+                connection.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+                    (n_entries - self.disk_size,),
+                )
+            self.__flush_counts()
+
+    def clear_memory(self):
+        with self.lock:
+            self.memory.clear()
+
+    def __remember(self, key: str, expires: float, value: Any):
+        self.memory[key] = (expires, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def __count(self, name: str):
+        count(f"{self.name}.{name}")
+        self.counters[name] += 1
+        self.pending[name] = self.pending.get(name, 0) + 1
+
+    def __flush_counts(self):
+        connection = self.__connect()
+        connection.executemany(
+            "INSERT INTO stats VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            # caches sharing the file count separately
+            [(f"{self.name}.{name}", n) for name, n in self.pending.items()],
+        )
+        connection.commit()
+        self.pending = {}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        # this process, and with a path the totals of every process using it
+        with self.lock:
+            stats = {"process": dict(self.counters, memory_entries=len(self.memory))}
+            if self.path is not None:
+                self.__flush_counts()
+                connection = self.__connect()
+                totals = {name: 0 for name in self.counters}
+                prefix = f"{self.name}."
+                for name, value in connection.execute("SELECT name, value FROM stats"):
+                    if name.startswith(prefix):
+                        totals[name[len(prefix) :]] = value
+                (entries,) = connection.execute(
+                    f"SELECT COUNT(*) FROM {self.table}"
+                ).fetchone()
+                stats["total"] = dict(totals, disk_entries=entries)
+
+        for counts in stats.values():
+            hits = counts["memory_hits"] + counts["disk_hits"]
+            lookups = hits + counts["misses"]
+            counts["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
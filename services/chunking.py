@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from services.indexing import InvertedIndex
+from services.processing import Tokenizer, load_movies
+
+from .semantic_search import SemanticSearch
+from .utils import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    IVF_NPROBE,
+    PASSAGE_CANDIDATE_MULTIPLIER,
+    PASSAGE_POOLING,
+    PASSAGE_POOLINGS,
+)
+
+load_dotenv()
+
+cache_dir = os.environ["CACHE_DIR"]
+passages_dir = f"{cache_dir}/passages"
+
+PASSAGES_FORMAT_VERSION = 1
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text: str) -> List[List[str]]:
+    sentences = (sentence.split() for sentence in SENTENCE_END.split(text.strip()))
+    return [words for words in sentences if words]
+
+
+def chunk_text(
+    text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP
+) -> List[str]:
+    # Windows of at most `size` words that end on sentence boundaries. The
+    # trailing sentences of a window, up to `overlap` words, start the next
+    # one. A sentence longer than a window is cut into windows of its own,
+    # overlapping by `overlap` words.
+    if not 0 <= overlap < size:
+        raise ValueError("overlap must be at least 0 and less than the chunk size")
+
+    step = size - overlap
+    units: List[List[str]] = []
+    for words in split_sentences(text):
+        for start in range(0, max(len(words) - overlap, 1), step):
+            units.append(words[start : start + size])
+
+    windows: List[List[List[str]]] = []
+    current: List[List[str]] = []
+    length = 0
+    for unit in units:
+        if current and length + len(unit) > size:
+            windows.append(current)
+            carried: List[List[str]] = []
+            length = 0
+            for previous in reversed(current):
+                if length + len(previous) > overlap:
+                    break
+                carried.insert(0, previous)
+                length += len(previous)
+            while carried and length + len(unit) > size:
+                length -= len(carried.pop(0))
+            current = carried
+        current.append(unit)
+        length += len(unit)
+    if current:
+        windows.append(current)
+
+    return [" ".join(word for unit in window for word in unit) for window in windows]
+
+
+def chunk_documents(
+    documents: Sequence[Dict], size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP
+) -> List[Dict]:
+    # Passages are documents of their own to both engines: the title of the
+    # parent, repeated for context, and one window of its description. Ids
+    # number the passages in document order.
+    passages = []
+    for doc in documents:
+        # a document with no description still gets its title indexed
+        chunks = chunk_text(doc["description"], size, overlap) or [""]
+        for n, chunk in enumerate(chunks):
+            passages.append(
+                {
+                    "id": len(passages),
+                    "doc_id": doc["id"],
+                    "chunk": n,
+                    "title": doc["title"],
+                    "description": chunk,
+                }
+            )
+    return passages
+
+
+def documents_fingerprint(documents: Sequence[Dict], size: int, overlap: int) -> str:
+    digest = hashlib.sha1(f"{size}\0{overlap}".encode())
+    for doc in documents:
+        digest.update(f"{doc['id']}\0{doc['title']}\0{doc['description']}\0".encode())
+    return digest.hexdigest()
+
+
+def pool_passages(
+    passage_scores: Mapping[int, float], passages: Sequence[Dict], pooling: str
+) -> Tuple[Dict[int, float], Dict[int, int]]:
+    # document scores from the scores of their passages, and the best
+    # passage of each document
+    if pooling not in PASSAGE_POOLINGS:
+        raise ValueError(f"Unknown pooling: {pooling}")
+
+    scores: Dict[int, float] = {}
+    best: Dict[int, int] = {}
+    for passage_id, score in passage_scores.items():
+        doc_id = passages[passage_id]["doc_id"]
+        if doc_id not in best or score > passage_scores[best[doc_id]]:
+            best[doc_id] = passage_id
+        if pooling == "sum":
+            scores[doc_id] = scores.get(doc_id, 0.0) + score
+        else:
+            scores[doc_id] = max(scores.get(doc_id, score), score)
+    return scores, best
+
+
+class PassageStore:
+    # The passages of the documents, chunked once and shared by the passage
+    # BM25 index and embedding store under the same directory. A store made
+    # from other documents or chunk settings is rebuilt, with a new build id
+    # that tells the indexes built from the old passages apart.
+    def __init__(
+        self,
+        directory: str = passages_dir,
+        size: int = CHUNK_SIZE,
+        overlap: int = CHUNK_OVERLAP,
+    ):
+        self.directory = directory
+        self.passages_dir = f"{directory}/passages.json"
+        self.size = size
+        self.overlap = overlap
+        self.passages: List[Dict] = []
+        self.documents: Dict[int, Dict] = {}
+        self.build_id: Optional[str] = None
+
+    def load_or_build(self, documents: Sequence[Dict]) -> bool:
+        # True when the passages were rebuilt
+        self.documents = {doc["id"]: doc for doc in documents}
+        fingerprint = documents_fingerprint(documents, self.size, self.overlap)
+        if os.path.exists(self.passages_dir):
+            with open(self.passages_dir, "r") as f:
+                stored = json.load(f)
+            if (
+                stored.get("version") == PASSAGES_FORMAT_VERSION
+                and stored.get("fingerprint") == fingerprint
+            ):
+                self.passages = stored["passages"]
+                self.build_id = stored["build_id"]
+                return False
+
+        self.passages = chunk_documents(documents, self.size, self.overlap)
+        self.build_id = uuid.uuid4().hex
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_dir = f"{self.passages_dir}.tmp"
+        with open(tmp_dir, "w") as f:
+            json.dump(
+                {
+                    "version": PASSAGES_FORMAT_VERSION,
+                    "fingerprint": fingerprint,
+                    "build_id": self.build_id,
+                    "size": self.size,
+                    "overlap": self.overlap,
+                    "passages": self.passages,
+                },
+                f,
+            )
+        os.replace(tmp_dir, self.passages_dir)
+        return True
+
+
+class PassageSearch:
+    # Both engines over the passages of a store. Each search fetches limit *
+    # candidate_multiplier passages and collapses them to documents: "max"
+    # scores a document by its best passage, "sum" by all of its passages
+    # among the candidates.
+    def __init__(
+        self,
+        store: PassageStore,
+        tokenizer: Optional[Tokenizer] = None,
+        pooling: str = PASSAGE_POOLING,
+        candidate_multiplier: int = PASSAGE_CANDIDATE_MULTIPLIER,
+    ):
+        if pooling not in PASSAGE_POOLINGS:
+            raise ValueError(f"Unknown pooling: {pooling}")
+        self.store = store
+        self.tokenizer = tokenizer
+        self.pooling = pooling
+        self.candidate_multiplier = candidate_multiplier
+        self.index_dir = f"{store.directory}/bm25"
+        self.source_dir = f"{self.index_dir}/source.json"
+        self.index: Optional[InvertedIndex] = None
+        self.semantic: Optional[SemanticSearch] = None
+
+    def load_or_create_index(self) -> InvertedIndex:
+        index = InvertedIndex(self.tokenizer, self.index_dir)
+        source = None
+        if os.path.exists(self.source_dir):
+            with open(self.source_dir, "r") as f:
+                source = json.load(f).get("build_id")
+
+        if source == self.store.build_id:
+            index.load()
+        else:
+            print("Building passage index...")
+            index.build(self.store.passages)
+            index.save()
+            with open(self.source_dir, "w") as f:
+                json.dump({"build_id": self.store.build_id}, f)
+        self.index = index
+        return self.index
+
+    def load_or_create_embeddings(self, **kwargs) -> SemanticSearch:
+        # the embedding rows are keyed by passage text, so a rechunked store
+        # only encodes the passages that changed
+        semantic = SemanticSearch(
+            prefix=f"{self.store.directory}/passage_embeddings", **kwargs
+        )
+        semantic.load_or_create_embeddings(self.store.passages)
+        self.semantic = semantic
+        return self.semantic
+
+    def bm25_search(self, query: str, limit: int) -> List[Dict]:
+        if self.index is None:
+            raise ValueError("No passage index loaded. Call 'load_or_create_index'.")
+        scores = self.index.bm25_search(query, limit * self.candidate_multiplier)
+        return self.__collapse(scores, limit)
+
+    def semantic_search(
+        self, query: str, limit: int, exact: bool = False, nprobe: int = IVF_NPROBE
+    ) -> List[Dict]:
+        if self.semantic is None:
+            raise ValueError(
+                "No passage embeddings loaded. Call 'load_or_create_embeddings'."
+            )
+        n_candidates = limit * self.candidate_multiplier
+        results = self.semantic.search(query, n_candidates, exact, nprobe)
+        return self.__collapse(
+            {result["id"]: result["score"] for result in results}, limit
+        )
+
+    def __collapse(self, passage_scores: Mapping[int, float], limit: int) -> List[Dict]:
+        scores, best = pool_passages(passage_scores, self.store.passages, self.pooling)
+        ordered = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        results = []
+        for doc_id, score in ordered[:limit]:
+            doc = self.store.documents[doc_id]
+            passage = self.store.passages[best[doc_id]]
+            results.append(
+                {
+                    "id": doc_id,
+                    "score": score,
+                    "title": doc["title"],
+                    "description": doc["description"],
+                    "passage_id": passage["id"],
+                    "passage": passage["description"],
+                }
+            )
+        return results
+
+
+def load_passage_search(pooling: str = PASSAGE_POOLING) -> PassageSearch:
+    store = PassageStore()
+    store.load_or_build(load_movies())
+    return PassageSearch(store, pooling=pooling)
@@ -0,0 +1,191 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .postings import PostingLists
+
+# Posting lists coded in blocks of block_size postings. Doc ids are stored as
+# gaps, tfs as tf - 1, both with one of the integer codecs below. The gaps
+# run on across blocks, and a skip table keeps every block's last doc id and
+# byte offsets, so a single posting is found by decoding one block.
+
+
+def varint_encode(values: np.ndarray) -> bytes:
+    # LEB128: 7 bits a byte, low bits first, the high bit set on every byte
+    # but a value's last
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        n_bytes += values >= (1 << shift)
+
+    owner = np.repeat(np.arange(len(values)), n_bytes)
+    starts = np.cumsum(n_bytes) - n_bytes
+    k = np.arange(len(owner)) - starts[owner]
+    data = ((values[owner] >> (7 * k).astype(np.uint64)) & 0x7F).astype(np.uint8)
+    data[k < n_bytes[owner] - 1] |= 0x80
+    return data.tobytes()
+
+
+def varint_decode(data: memoryview, count: int) -> np.ndarray:
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == count:
+        # every value fits in one byte
+        return data.astype(np.uint32)
+
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    owner = np.repeat(np.arange(count), ends - starts + 1)
+    k = (np.arange(len(data)) - starts[owner]).astype(np.uint64)
+    parts = (data & 0x7F).astype(np.uint64) << (7 * k)
+    return np.add.reduceat(parts, starts).astype(np.uint32)
+
+
+def bitpack_encode(values: np.ndarray) -> bytes:
+    # one byte of bit width, then every value in exactly that many bits
+    values = np.asarray(values, dtype=np.uint32)
+    width = int(values.max()).bit_length() if len(values) else 0
+    bits = (values[:, None] >> np.arange(width, dtype=np.uint32)) & 1
+    packed = np.packbits(bits.astype(np.uint8).ravel(), bitorder="little")
+    return bytes([width]) + packed.tobytes()
+
+
+def bitpack_decode(data: memoryview, count: int) -> np.ndarray:
+    width = data[0]
+    if width == 0:
+        return np.zeros(count, dtype=np.uint32)
+
+    bits = np.unpackbits(
+        np.frombuffer(data, dtype=np.uint8, offset=1),
+        count=count * width,
+        bitorder="little",
+    ).reshape(count, width)
+    weights = np.left_shift(1, np.arange(width, dtype=np.uint32), dtype=np.uint32)
+    return (bits * weights).sum(axis=1, dtype=np.uint32)
+
+
+CODECS = {
+    "varint": (varint_encode, varint_decode),
+    "bitpack": (bitpack_encode, bitpack_decode),
+}
+
+
+def encode_postings(
+    codec: str, doc_ids: memoryview, tfs: memoryview, block_size: int
+) -> Tuple[List[bytes], List[bytes], List[int]]:
+    # the coded doc id and tf blocks of one term, and each block's last doc id
+    encode, _ = CODECS[codec]
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    gaps = np.diff(doc_ids, prepend=0)
+    tfs = np.asarray(tfs, dtype=np.uint32) - 1
+
+    doc_blocks, tf_blocks, last_doc_ids = [], [], []
+    for start in range(0, len(doc_ids), block_size):
+        end = min(start + block_size, len(doc_ids))
+        doc_blocks.append(encode(gaps[start:end]))
+        tf_blocks.append(encode(tfs[start:end]))
+        last_doc_ids.append(int(doc_ids[end - 1]))
+    return doc_blocks, tf_blocks, last_doc_ids
+
+
+class BlockPostingLists(PostingLists):
+    # doc_ids and tfs hold the coded blocks here; block_offsets[t] is the
+    # first block of term t, and the block_* tables are per block (plus one
+    # for the byte offsets)
+    def __init__(
+        self,
+        terms: Dict[str, int],
+        offsets: memoryview,
+        doc_ids: memoryview,
+        tfs: memoryview,
+        doc_lengths: memoryview,
+        n_docs: int,
+        total_doc_length: int,
+        codec: str,
+        block_size: int,
+        block_offsets: memoryview,
+        block_last_doc_ids: memoryview,
+        block_doc_offsets: memoryview,
+        block_tf_offsets: memoryview,
+    ):
+        super().__init__(
+            terms, offsets, doc_ids, tfs, doc_lengths, n_docs, total_doc_length
+        )
+        self.codec = codec
+        self.decode = CODECS[codec][1]
+        self.block_size = block_size
+        self.block_offsets = block_offsets
+        self.block_last_doc_ids = block_last_doc_ids
+        self.block_doc_offsets = block_doc_offsets
+        self.block_tf_offsets = block_tf_offsets
+
+    def postings(self, term: str) -> Tuple[memoryview, memoryview]:
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return memoryview(array("I")), memoryview(array("I"))
+
+        first, last = self.block_offsets[term_id], self.block_offsets[term_id + 1]
+        count = self.offsets[term_id + 1] - self.offsets[term_id]
+        gaps = self.__decode_blocks(
+            self.doc_ids, self.block_doc_offsets, first, last, count
+        )
+        tfs = self.__decode_blocks(self.tfs, self.block_tf_offsets, first, last, count)
+        doc_ids = np.cumsum(gaps, dtype=np.uint32)
+        return memoryview(doc_ids), memoryview(tfs + 1)
+
+    def __decode_blocks(
+        self,
+        data: memoryview,
+        byte_offsets: memoryview,
+        first: int,
+        last: int,
+        count: int,
+    ) -> np.ndarray:
+        if self.codec == "varint":
+            # a term's blocks are contiguous, and varints need no block header
+            return self.decode(data[byte_offsets[first] : byte_offsets[last]], count)
+
+        block_size = self.block_size
+        return np.concatenate(
+            [
+                self.decode(
+                    data[byte_offsets[block] : byte_offsets[block + 1]],
+                    min(block_size, count - (block - first) * block_size),
+                )
+                for block in range(first, last)
+            ]
+        )
+
+    def get_tf(self, doc_id: int, term: str) -> int:
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return 0
+
+        # the skip table leads to the only block that can hold doc_id
+        first, last = self.block_offsets[term_id], self.block_offsets[term_id + 1]
+        block = bisect_left(self.block_last_doc_ids, doc_id, first, last)
+        if block == last:
+            return 0
+
+        count = self.offsets[term_id + 1] - self.offsets[term_id]
+        count = min(self.block_size, count - (block - first) * self.block_size)
+        base = self.block_last_doc_ids[block - 1] if block > first else 0
+        gaps = self.decode(
+            self.doc_ids[
+                self.block_doc_offsets[block] : self.block_doc_offsets[block + 1]
+            ],
+            count,
+        )
+        doc_ids = np.cumsum(gaps, dtype=np.int64) + base
+        i = int(np.searchsorted(doc_ids, doc_id))
+        if i == count or doc_ids[i] != doc_id:
+            return 0
+
+        tfs = self.decode(
+            self.tfs[self.block_tf_offsets[block] : self.block_tf_offsets[block + 1]],
+            count,
+        )
+        return int(tfs[i]) + 1
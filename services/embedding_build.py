@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .ann import normalize
+from .index_build import bounded_map
+from .utils import EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL
+
+Encoder = Callable[[List[str]], np.ndarray]
+
+_worker_model = None
+
+
+def init_embedding_worker(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # the workers split the cores rather than each running one thread per core
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def encode_batch(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=len(texts))
+
+
+def length_sorted_batches(texts: List[str], batch_size: int) -> List[np.ndarray]:
+    # rows ordered by text length, so the texts of a batch pad to about the
+    # same number of tokens
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def inputs_fingerprint(texts: List[str], model_name: str, batch_size: int) -> str:
+    digest = hashlib.sha1(f"{model_name}\0{batch_size}".encode())
+    for text in texts:
+        digest.update(hashlib.sha1(text.encode()).digest())
+    return digest.hexdigest()
+
+
+def build_embedding_file(
+    texts: List[str],
+    path: str,
+    encode: Encoder,
+    model_name: str = EMBEDDING_MODEL,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    workers: int = 1,
+    initializer: Optional[Callable] = None,
+    initargs: Tuple = (),
+) -> Dict:
+    # Encodes texts in length sorted batches into a preallocated .npy mapped
+    # at path.partial, row i holding the normalized embedding of texts[i].
+    # After every batch the rows are flushed and the number of finished
+    # batches recorded in path.progress.json, so an interrupted build resumes
+    # where it stopped. With workers > 1, encode must be picklable and runs in
+    # a process pool set up by initializer; results are still written in
+    # batch order, so finished batches are always a prefix.
+    if not texts:
+        raise ValueError("No texts to embed")
+
+    partial_dir = f"{path}.partial"
+    progress_dir = f"{path}.progress.json"
+    fingerprint = inputs_fingerprint(texts, model_name, batch_size)
+    batches = length_sorted_batches(texts, batch_size)
+
+    embeddings = None
+    done = 0
+    if os.path.exists(progress_dir) and os.path.exists(partial_dir):
+        with open(progress_dir, "r") as f:
+            progress = json.load(f)
+        if progress.get("fingerprint") == fingerprint:
+            embeddings = np.load(partial_dir, mmap_mode="r+")
+            done = progress["batches"]
+            print(f"Resuming embeddings at batch {done}/{len(batches)}")
+
+    def save_progress(embeddings: np.ndarray, done: int):
+        embeddings.flush()
+        tmp_dir = f"{progress_dir}.tmp"
+        with open(tmp_dir, "w") as f:
+            json.dump({"fingerprint": fingerprint, "batches": done}, f)
+        os.replace(tmp_dir, progress_dir)
+
+    def results(pending: List[np.ndarray]) -> Iterator[np.ndarray]:
+        inputs = ([texts[i] for i in rows] for rows in pending)
+        if workers <= 1:
+            yield from map(encode, inputs)
+            return
+        with ProcessPoolExecutor(
+            workers, initializer=initializer, initargs=initargs
+        ) as executor:
+            yield from bounded_map(executor, encode, inputs, 2 * workers)
+
+    start = time.perf_counter()
+    n_encoded = 0
+    for rows, vectors in zip(batches[done:], results(batches[done:])):
+        vectors = normalize(vectors)
+        if embeddings is None:
+            # the dimension is only known once the first batch is encoded
+            embeddings = np.lib.format.open_memmap(
+                partial_dir,
+                mode="w+",
+                dtype=np.float32,
+                shape=(len(texts), vectors.shape[1]),
+            )
+        embeddings[rows] = vectors
+        done += 1
+        n_encoded += len(rows)
+        save_progress(embeddings, done)
+    elapsed = time.perf_counter() - start
+
+    del embeddings
+    # replace rather than truncate: the previous file may still be mapped
+    os.replace(partial_dir, path)
+    os.remove(progress_dir)
+    return {
+        "documents": len(texts),
+        "encoded": n_encoded,
+        "seconds": elapsed,
+        "docs_per_sec": n_encoded / elapsed if elapsed else 0.0,
+    }
@@ -0,0 +1,54 @@
+import hashlib
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .cache_store import CacheStore
+from .utils import QUERY_CACHE_DISK_SIZE, QUERY_CACHE_MEMORY_SIZE
+
+load_dotenv()
+
+cache_dir = os.environ["CACHE_DIR"]
+query_cache_dir = f"{cache_dir}/query_embeddings.sqlite"
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    # In-process LRU in front of a size-bounded SQLite store, so repeated
+    # queries skip the transformer within a process and across processes.
+    def __init__(
+        self,
+        model_name: str,
+        path: str = query_cache_dir,
+        memory_size: int = QUERY_CACHE_MEMORY_SIZE,
+        disk_size: int = QUERY_CACHE_DISK_SIZE,
+    ):
+        self.model_name = model_name
+        self.path = path
+        self.store = CacheStore(
+            "query_cache",
+            "query_embeddings",
+            memory_size,
+            disk_size,
+            path,
+            dumps=lambda embedding: embedding.tobytes(),
+            loads=lambda vector: np.frombuffer(vector, dtype=np.float32),
+        )
+
+    def key(self, text: str) -> str:
+        payload = f"{self.model_name}\0{normalize_query(text)}"
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.store.get(self.key(text))
+
+    def put(self, text: str, embedding: np.ndarray):
+        self.store.put(self.key(text), np.asarray(embedding, dtype=np.float32))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return self.store.stats()
@@ -0,0 +1,208 @@
+import heapq
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from services.processing import Tokenizer, get_tokenizer, iter_documents, movies_path
+
+from .bm25 import bm25_idf
+from .postings import PostingLists, PostingListsBuilder
+from .segment import Segment, write_segment
+from .utils import BM25_B, BM25_K1, POSTINGS_CODEC
+
+load_dotenv()
+
+cache_dir = os.environ["CACHE_DIR"]
+fields_dir = f"{cache_dir}/fields"
+
+FIELDS_FORMAT_VERSION = 1
+# fields are file names on disk, so only plain names are indexed
+FIELD_NAME = re.compile(r"^\w+$")
+
+
+def field_text(value) -> Optional[str]:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return " ".join(value)
+    return None
+
+
+def source_stamp(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class FieldIndex:
+    # One posting list segment per text field of the documents (title,
+    # description, and any other string field), and the documents in their
+    # own segment. Queries are scored with BM25F: a term's tf in each field
+    # is length normalized by that field's average and weighted, the sum
+    # goes through a single BM25 saturation, and idf counts the documents
+    # with the term in any of the queried fields.
+    def __init__(
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        directory: str = fields_dir,
+        source: str = movies_path,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ):
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.directory = directory
+        self.manifest_dir = f"{directory}/fields.json"
+        self.documents_dir = f"{directory}/documents.seg"
+        self.source = source
+        self.k1 = k1
+        self.b = b
+        self.fields: Dict[str, PostingLists] = {}
+        self.documents: Mapping[int, Dict] = {}
+        self.n_docs = 0
+        self.segments: List[Segment] = []
+        # (term, fields) -> idf, as df is a union over the fields
+        self.idf: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+
+    def field_path(self, field: str) -> str:
+        return f"{self.directory}/field.{field}.seg"
+
+    def build(self, documents: Optional[Iterable[Dict]] = None):
+        if documents is None:
+            documents = iter_documents(self.source)
+
+        builders: Dict[str, PostingListsBuilder] = {}
+        docmap: Dict[int, Dict] = {}
+        for doc in documents:
+            doc_id = doc["id"]
+            docmap[doc_id] = doc
+            for field, value in doc.items():
+                text = field_text(value)
+                if field == "id" or text is None or not FIELD_NAME.match(field):
+                    continue
+                builder = builders.setdefault(field, PostingListsBuilder(False))
+                builder.add(doc_id, self.tokenizer.tokenize(text))
+
+        self.fields = {}
+        for field, builder in sorted(builders.items()):
+            # a document without the field counts as an empty one in it
+            for doc_id in docmap:
+                builder.docs_length.setdefault(doc_id, 0)
+            self.fields[field] = builder.finish()
+        self.documents = docmap
+        self.n_docs = len(docmap)
+        self.idf = {}
+
+    def save(self, codec: str = POSTINGS_CODEC):
+        os.makedirs(self.directory, exist_ok=True)
+        for field, postings in self.fields.items():
+            write_segment(self.field_path(field), postings, {}, codec)
+        write_segment(
+            self.documents_dir, PostingListsBuilder(False).finish(), self.documents
+        )
+
+        manifest = {
+            "version": FIELDS_FORMAT_VERSION,
+            "fields": sorted(self.fields),
+            "source": source_stamp(self.source)
+            if os.path.exists(self.source)
+            else None,
+        }
+        tmp_dir = f"{self.manifest_dir}.tmp"
+        with open(tmp_dir, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_dir, self.manifest_dir)
+
+    def load(self):
+        if not os.path.exists(self.manifest_dir):
+            raise FileNotFoundError(f"Could not find {self.manifest_dir}")
+
+        with open(self.manifest_dir, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FIELDS_FORMAT_VERSION:
+            raise ValueError(f"Unsupported fields version in {self.manifest_dir}")
+
+        self.segments = [Segment(self.field_path(f)) for f in manifest["fields"]]
+        self.fields = {
+            field: segment.postings
+            for field, segment in zip(manifest["fields"], self.segments)
+        }
+        documents = Segment(self.documents_dir)
+        self.segments.append(documents)
+        self.documents = documents.documents
+        self.n_docs = len(self.documents)
+        self.idf = {}
+        return manifest
+
+    def load_or_build(self):
+        # rebuilt when the documents file changed since the last build
+        try:
+            manifest = self.load()
+            if manifest["source"] == source_stamp(self.source):
+                return
+        except FileNotFoundError:
+            pass
+
+        self.build()
+        self.save()
+        self.load()
+
+    def document(self, doc_id: int) -> Dict:
+        return self.documents[doc_id]
+
+    def term_idf(self, term: str, fields: Tuple[str, ...]) -> float:
+        idf = self.idf.get((term, fields))
+        if idf is None:
+            doc_ids = set()
+            for field in fields:
+                doc_ids.update(self.fields[field].postings(term)[0])
+            idf = bm25_idf(self.n_docs, len(doc_ids))
+            self.idf[(term, fields)] = idf
+        return idf
+
+    def search(
+        self, query: str, weights: Mapping[str, float], limit: int
+    ) -> List[Tuple[int, float]]:
+        unknown = [field for field in weights if field not in self.fields]
+        if unknown:
+            raise ValueError(f"Fields not in the index: {', '.join(unknown)}")
+
+        k1, b = self.k1, self.b
+        fields = tuple(sorted(weights))
+        scores: Dict[int, float] = {}
+        for token in self.tokenizer.tokenize(query):
+            # length normalized, weighted tf summed over the fields
+            tfs: Dict[int, float] = {}
+            for field in fields:
+                postings = self.fields[field]
+                weight = weights[field]
+                avg_doc_length = postings.avg_doc_length
+                doc_lengths = postings.doc_lengths
+                doc_ids, field_tfs = postings.postings(token)
+                for doc_id, tf in zip(doc_ids, field_tfs):
+                    length_norm = 1 - b + b * (doc_lengths[doc_id] / avg_doc_length)
+                    tfs[doc_id] = tfs.get(doc_id, 0.0) + weight * tf / length_norm
+
+            idf = self.term_idf(token, fields)
+            for doc_id, tf in tfs.items():
+                bm25_tf = (tf * (k1 + 1)) / (tf + k1)
+                scores[doc_id] = scores.get(doc_id, 0.0) + bm25_tf * idf
+
+        # one entry per document; ties by doc id
+        return heapq.nsmallest(
+            limit, scores.items(), key=lambda item: (-item[1], item[0])
+        )
+
+
+def search_fields(
+    query: str, weights: Mapping[str, float], limit: int = 5
+) -> List[Tuple[Dict, float]]:
+    field_index = FieldIndex()
+    field_index.load_or_build()
+    results = field_index.search(query, weights, limit)
+    return [(field_index.document(doc_id), score) for doc_id, score in results]
+
+
+def search_field(field: str, query: str, limit: int = 5) -> List[Dict]:
+    return [doc for doc, _ in search_fields(query, {field: 1.0}, limit)]
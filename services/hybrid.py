@@ -0,0 +1,145 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from services.indexing import InvertedIndex
+
+from .semantic_search import SemanticSearch
+from .tracing import span
+from .utils import HYBRID_ALPHA, HYBRID_CANDIDATE_MULTIPLIER, RRF_K
+
+HYBRID_MODES = ["weighted", "rrf"]
+
+
+def min_max_normalize(scores: Dict[int, float]) -> Dict[int, float]:
+    if not scores:
+        return {}
+
+    low = min(scores.values())
+    high = max(scores.values())
+    if high == low:
+        return {doc_id: 1.0 for doc_id in scores}
+    return {doc_id: (score - low) / (high - low) for doc_id, score in scores.items()}
+
+
+def ranks(scores: Dict[int, float]) -> Dict[int, int]:
+    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return {doc_id: rank for rank, (doc_id, _) in enumerate(ordered, start=1)}
+
+
+def weighted_fusion(
+    bm25_scores: Dict[int, float],
+    semantic_scores: Dict[int, float],
+    alpha: float = HYBRID_ALPHA,
+) -> Dict[int, float]:
+    # alpha weights the keyword side; a document missing from one retriever
+    # gets 0 for that side after normalization
+    bm25_normalized = min_max_normalize(bm25_scores)
+    semantic_normalized = min_max_normalize(semantic_scores)
+    return {
+        doc_id: alpha * bm25_normalized.get(doc_id, 0.0)
+        + (1 - alpha) * semantic_normalized.get(doc_id, 0.0)
+        for doc_id in bm25_scores.keys() | semantic_scores.keys()
+    }
+
+
+def rrf_fusion(
+    bm25_scores: Dict[int, float],
+    semantic_scores: Dict[int, float],
+    k: int = RRF_K,
+) -> Dict[int, float]:
+    fused: Dict[int, float] = {}
+    for scores in [bm25_scores, semantic_scores]:
+        for doc_id, rank in ranks(scores).items():
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (k + rank)
+    return fused
+
+
+class HybridSearch:
+    # BM25 and dense retrieval fused per query. Each side fetches
+    # limit * candidate_multiplier candidates; with restrict, the dense side
+    # only scores the BM25 candidates instead of the whole store.
+    def __init__(
+        self,
+        index: InvertedIndex,
+        semantic: SemanticSearch,
+        candidate_multiplier: int = HYBRID_CANDIDATE_MULTIPLIER,
+        workers: int = 1,
+    ):
+        self.index = index
+        self.semantic = semantic
+        self.candidate_multiplier = candidate_multiplier
+        # BM25 runs here while the calling thread does the dense side; the
+        # model and numpy release the GIL, so the two overlap
+        self.pool = ThreadPoolExecutor(workers)
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        mode: str = "rrf",
+        alpha: float = HYBRID_ALPHA,
+        k: int = RRF_K,
+        restrict: bool = False,
+        exact: bool = False,
+    ) -> List[Dict]:
+        if mode not in HYBRID_MODES:
+            raise ValueError(f"Unknown hybrid mode: {mode}")
+        if not 0 <= alpha <= 1:
+            raise ValueError("alpha must be between 0 and 1")
+
+        with span("retrieve"):
+            bm25_scores, semantic_scores = self.retrieve(query, limit, restrict, exact)
+        with span("fuse"):
+            if mode == "weighted":
+                fused = weighted_fusion(bm25_scores, semantic_scores, alpha)
+            else:
+                fused = rrf_fusion(bm25_scores, semantic_scores, k)
+
+        bm25_ranks = ranks(bm25_scores)
+        semantic_ranks = ranks(semantic_scores)
+        ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+        results = []
+        for doc_id, score in ordered[:limit]:
+            doc = self.semantic.document_map.get(doc_id) or self.index.docmap[doc_id]
+            results.append(
+                {
+                    "id": doc_id,
+                    "score": score,
+                    "title": doc["title"],
+                    "description": doc["description"],
+                    "bm25_score": bm25_scores.get(doc_id),
+                    "bm25_rank": bm25_ranks.get(doc_id),
+                    "semantic_score": semantic_scores.get(doc_id),
+                    "semantic_rank": semantic_ranks.get(doc_id),
+                }
+            )
+        return results
+
+    def retrieve(
+        self, query: str, limit: int, restrict: bool = False, exact: bool = False
+    ) -> Tuple[Dict[int, float], Dict[int, float]]:
+        n_candidates = limit * self.candidate_multiplier
+        # in a copy of this context, so a trace of the query covers both
+        bm25_future = self.pool.submit(
+            contextvars.copy_context().run,
+            self.index.bm25_search,
+            query,
+            n_candidates,
+        )
+
+        query_embedding = self.semantic.embed_query(query)
+        if restrict:
+            bm25_scores = bm25_future.result()
+            semantic_scores = self.semantic.score_documents(
+                query_embedding, list(bm25_scores)
+            )
+            return bm25_scores, semantic_scores
+
+        results = self.semantic.search_embedding(query_embedding, n_candidates, exact)
+        semantic_scores = {result["id"]: result["score"] for result in results}
+        return bm25_future.result(), semantic_scores
+
+    def close(self):
+        self.pool.shutdown()
@@ -0,0 +1,83 @@
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.processing import Tokenizer
+
+from .postings import PostingListsBuilder
+
+PartialIndex = Tuple[Dict[str, List[Tuple]], Dict[int, int]]
+
+_worker_tokenizer: Optional[Tokenizer] = None
+
+
+def document_text(movie: Dict) -> str:
+    return f"{movie['title']} {movie['description']}"
+
+
+def batched(items: Iterable, batch_size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def init_worker(stop_words: Iterable[str]):
+    global _worker_tokenizer
+    _worker_tokenizer = Tokenizer(stop_words=stop_words)
+
+
+def index_batch(
+    batch: List[Tuple[int, str]], tokenizer: Optional[Tokenizer] = None
+) -> PartialIndex:
+    tokenizer = tokenizer or _worker_tokenizer
+    builder = PostingListsBuilder()
+    doc_ids = [doc_id for doc_id, _ in batch]
+    texts = (text for _, text in batch)
+    for doc_id, tokens in zip(doc_ids, tokenizer.tokenize_many(texts)):
+        builder.add(doc_id, tokens)
+    return builder.postings, builder.docs_length
+
+
+def bounded_map(
+    executor: Executor, fn: Callable, items: Iterable, max_pending: int
+) -> Iterator:
+    # like executor.map, but only max_pending items are read ahead, so a
+    # streamed input is never fully materialized
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def build_postings(
+    documents: Iterable[Dict],
+    tokenizer: Tokenizer,
+    docmap: Dict[int, Dict],
+    workers: int = 1,
+    batch_size: int = 1000,
+) -> PostingListsBuilder:
+    # Documents are tokenized in batches; each batch becomes a partial index
+    # that is merged into one builder. finish() sorts every posting list, so
+    # the result does not depend on the order batches complete in.
+    def batches() -> Iterator[List[Tuple[int, str]]]:
+        for batch in batched(documents, batch_size):
+            for movie in batch:
+                docmap[movie["id"]] = movie
+            yield [(movie["id"], document_text(movie)) for movie in batch]
+
+    builder = PostingListsBuilder()
+    if workers <= 1:
+        for batch in batches():
+            builder.merge(*index_batch(batch, tokenizer))
+        return builder
+
+    with ProcessPoolExecutor(
+        workers, initializer=init_worker, initargs=(tokenizer.stop_words,)
+    ) as executor:
+        for partial in bounded_map(executor, index_batch, batches(), 2 * workers):
+            builder.merge(*partial)
+    return builder
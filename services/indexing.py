@@ -1,14 +1,37 @@
+import hashlib
 import math
 import os
+import uuid
 from collections import Counter
-from pickle import dump, load
-from typing import Dict, List
+from pickle import load
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 
-from services.processing import load_movies, tokenize
-
-from .utils import BM25_B, BM25_K1
+from services.processing import Tokenizer, get_tokenizer, iter_documents, load_movies
+
+from .bm25 import BM25Scorer, bm25_idf
+from .index_build import build_postings, document_text
+from .postings import PostingLists, PostingListsBuilder
+from .query import match_documents, parse_query, query_terms
+from .result_cache import ResultCache
+from .segment import (
+    Segment,
+    SegmentedDocuments,
+    SegmentedPostings,
+    merge_segments,
+    read_manifest,
+    write_manifest,
+    write_segment,
+)
+from .tracing import span
+from .utils import (
+    BM25_B,
+    BM25_K1,
+    BUILD_BATCH_SIZE,
+    POSTINGS_CODEC,
+    SEGMENT_MERGE_THRESHOLD,
+)
 
 load_dotenv()
 
@@ -17,49 +40,95 @@ index_dir = f"{cache_dir}/index.pkl"
 docmap_dir = f"{cache_dir}/docmap.pkl"
 tf_dir = f"{cache_dir}/term_frequencies.pkl"
 doc_lengths_dir = f"{cache_dir}/doc_lengths.pkl"
+postings_dir = f"{cache_dir}/postings.pkl"
+segment_dir = f"{cache_dir}/index.seg"
+manifest_dir = f"{cache_dir}/index.manifest.json"
 
 
-class InvertedIndex:
-    def __init__(self):
-        self.index: Dict[str, set] = {}
-        self.docmap: Dict[int, Dict] = {}
-        self.term_frequencies: dict[int, Counter] = {}
-        self.docs_length: Dict[int, int] = {}
+def load_legacy_pickles() -> Tuple[Dict[str, set], Dict[int, Counter], Dict[int, int]]:
+    dirs = [index_dir, tf_dir, doc_lengths_dir]
+    for dir in dirs:
+        if not os.path.exists(dir):
+            raise FileNotFoundError(f"Could not find {dir}")
+
+    with open(index_dir, "rb") as f:
+        index = load(f)
+
+    with open(tf_dir, "rb") as f:
+        term_frequencies = load(f)
 
-    def __add_document(self, doc_id: int, text: str):
-        text_tks = tokenize(text)
-        for tk in text_tks:
-            self.index.setdefault(tk, set()).add(doc_id)
+    with open(doc_lengths_dir, "rb") as f:
+        docs_length = load(f)
 
-        self.term_frequencies[doc_id] = Counter(text_tks)
-        self.docs_length[doc_id] = len(text_tks)
+    return index, term_frequencies, docs_length
+
+
+def file_version(path: str) -> str:
+    # stands in for a build id in files written before build ids, the same
+    # in every process until the file is rewritten
+    stat = os.stat(path)
+    payload = f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class InvertedIndex:
+    def __init__(
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        directory: str = cache_dir,
+        codec: str = POSTINGS_CODEC,
+    ):
+        self.tokenizer = tokenizer or get_tokenizer()
+        # where the segments and their manifest live; shards use their own
+        self.directory = directory
+        # how the postings of the segments written from here are coded
+        self.codec = codec
+        self.segment_dir = f"{directory}/index.seg"
+        self.manifest_dir = f"{directory}/index.manifest.json"
+        self.postings = PostingListsBuilder().finish()
+        self.docmap: Mapping[int, Dict] = {}
+        self.scorer: Optional[BM25Scorer] = None
+        # on-disk segments, oldest first, and the doc ids deleted from each
+        self.segments: List[Segment] = []
+        self.deleted: Dict[str, Set[int]] = {}
+        self.next_segment = 1
+        # what the loaded index is a version of: the manifest's build id, or
+        # a fresh one for an index built in memory
+        self.build_id = uuid.uuid4().hex
+        # bm25_search results are cached here when set
+        self.result_cache: Optional[ResultCache] = None
 
     def get_documents(self, term: str) -> List[int]:
         term = term.lower()
-        doc_ids = self.index.get(term, set())
-        return sorted(doc_ids)
-
-    def search(self, tokens: List[str], max_results: int = 5) -> List[Dict]:
-        matching_docs = []
-        for token in tokens:
-            doc_ids = self.get_documents(token)
-            for id in doc_ids:
-                matching_docs.append(self.docmap.get(id))
-                if len(matching_docs) == max_results:
-                    return matching_docs
-        return matching_docs
+        doc_ids, _ = self.postings.postings(term)
+        return doc_ids.tolist()
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict]:
+        results = self.boolean_search(query, max_results)
+        return [self.docmap[doc_id] for doc_id in results]
+
+    def boolean_search(self, query: str, limit: int) -> Dict[int, float]:
+        # documents matching AND / OR / NOT and "quoted phrases", ranked by
+        # BM25 of the query's terms; only the matches are scored
+        if self.scorer is None:
+            self.build_scorer()
+
+        with span("boolean_search"):
+            node = parse_query(query, self.tokenizer)
+            with span("match"):
+                doc_ids = match_documents(node, self.postings)
+            return self.scorer.score_documents(query_terms(node), doc_ids, limit)
 
     def get_tf(self, doc_id: int, term: str) -> int:
-        tokens = tokenize(term)
+        tokens = self.tokenizer.tokenize(term)
         if len(tokens) > 1:
             raise ValueError("term must be a single word!")
 
         token = tokens[0]
-        doc_counter = self.term_frequencies.get(doc_id, Counter())
-        return doc_counter.get(token, 0)
+        return self.postings.get_tf(doc_id, token)
 
     def get_idf(self, term: str) -> float:
-        tokens = tokenize(term)
+        tokens = self.tokenizer.tokenize(term)
         if len(tokens) > 1:
             raise ValueError("term must be a single word!")
 
@@ -70,7 +139,7 @@ class InvertedIndex:
         return idf
 
     def bm25(self, doc_id: int, term: str) -> float:
-        tokens = tokenize(term)
+        tokens = self.tokenizer.tokenize(term)
         if len(tokens) > 1:
             raise ValueError("term must be a single word!")
 
@@ -81,25 +150,32 @@ class InvertedIndex:
         return bm25_tf * bm25_idf
 
     def bm25_search(self, query: str, limit: int) -> Dict[int, float]:
-        tokens = tokenize(query)
-        scores: Dict[int, float] = {}
-        for token in tokens:
-            doc_ids = self.get_documents(token)
-            for doc_id in doc_ids:
-                scores[doc_id] = scores.get(doc_id, 0.0) + self.bm25(doc_id, token)
-
-        sorted_scores = sorted(
-            scores.items(),
-            key=lambda item: item[1],
-            reverse=True,
-        )
-        return dict(sorted_scores[:limit])
+        if self.scorer is None:
+            self.build_scorer()
+
+        with span("bm25_search"):
+            tokens = self.tokenizer.tokenize(query)
+            if self.result_cache is None:
+                return self.scorer.score(tokens, limit)
+
+            key = self.result_cache.key(
+                self.build_id, tokens, limit, k1=self.scorer.k1, b=self.scorer.b
+            )
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                return dict(cached)
+            results = self.scorer.score(tokens, limit)
+            self.result_cache.put(key, list(results.items()))
+            return results
+
+    def build_scorer(self):
+        self.scorer = BM25Scorer(self.postings, len(self.docmap))
 
     def get_bm25_tf(self, doc_id: int, term: str, k1=BM25_K1, b=BM25_B) -> float:
         raw_tf = self.get_tf(doc_id, term)
 
-        doc_length = self.docs_length.get(doc_id, 0)
-        avg_doc_length = self.__get_avg_doc_length()
+        doc_length = self.postings.doc_length(doc_id)
+        avg_doc_length = self.postings.avg_doc_length
 
         length_norm = 1 - b + b * (doc_length / avg_doc_length)
 
@@ -107,7 +183,7 @@ class InvertedIndex:
         return bm25_tf
 
     def get_bm25_idf(self, term: str) -> float:
-        tokens = tokenize(term)
+        tokens = self.tokenizer.tokenize(term)
         if len(tokens) > 1:
             raise ValueError("term must be a single word!")
 
@@ -116,59 +192,258 @@ class InvertedIndex:
         token = tokens[0]
         n_matching_docs = len(self.get_documents(token))
 
-        bm25_idf = math.log(
-            (n_docs - n_matching_docs + 0.5) / (n_matching_docs + 0.5) + 1
-        )
-        return bm25_idf
-
-    def __get_avg_doc_length(self) -> float:
-        if not self.docs_length:
-            return 0.0
+        return bm25_idf(n_docs, n_matching_docs)
 
-        total_doc_length = sum(self.docs_length.values())
-        avg_doc_length = total_doc_length / len(self.docs_length)
-        return avg_doc_length
-
-    def build(self):
-        movies = load_movies()
-        for movie in movies:
+    def build(self, movies: Optional[List[Dict]] = None):
+        if movies is None:
+            movies = load_movies()
+        builder = PostingListsBuilder()
+        self.docmap = {}
+        texts = (document_text(movie) for movie in movies)
+        for movie, text_tks in zip(movies, self.tokenizer.tokenize_many(texts)):
             id = movie["id"]
-            title = movie["title"]
-            description = movie["description"]
-
-            self.__add_document(id, text=f"{title} {description}")
+            builder.add(id, text_tks)
             self.docmap[id] = movie
 
-    def save(self):
-        if not os.path.exists(cache_dir):
-            os.mkdir(cache_dir)
-
-        with open(index_dir, "wb") as f:
-            dump(self.index, f)
-
-        with open(docmap_dir, "wb") as f:
-            dump(self.docmap, f)
-
-        with open(tf_dir, "wb") as f:
-            dump(self.term_frequencies, f)
+        self.postings = builder.finish()
+        self.build_id = uuid.uuid4().hex
+        self.build_scorer()
+
+    def build_streaming(
+        self,
+        documents: Optional[Iterable[Dict]] = None,
+        workers: int = 1,
+        batch_size: int = BUILD_BATCH_SIZE,
+    ) -> int:
+        if documents is None:
+            documents = iter_documents()
+        self.docmap = {}
+        builder = build_postings(
+            documents, self.tokenizer, self.docmap, workers, batch_size
+        )
+        self.postings = builder.finish()
+        self.build_id = uuid.uuid4().hex
+        self.build_scorer()
+        return len(self.docmap)
 
-        with open(doc_lengths_dir, "wb") as f:
-            dump(self.docs_length, f)
+    def save(self):
+        if isinstance(self.postings, SegmentedPostings):
+            # already on disk, as several segments
+            return self.merge()
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        stale = []
+        if os.path.exists(self.manifest_dir):
+            manifest = read_manifest(self.manifest_dir)
+            stale = [entry["name"] for entry in manifest["segments"]]
+            self.next_segment = max(self.next_segment, manifest["next_segment"])
+
+        write_segment(self.segment_dir, self.postings, self.docmap, self.codec)
+        base = os.path.basename(self.segment_dir)
+        self.build_id = write_manifest(self.manifest_dir, [base], {}, self.next_segment)
+        for name in stale:
+            if name != base:
+                os.remove(f"{self.directory}/{name}")
+
+        # the in-memory index is now the source of truth until reloaded
+        self.segments = []
+        self.deleted = {}
 
     def load(self):
-        dirs = [index_dir, docmap_dir, tf_dir, doc_lengths_dir]
-        for dir in dirs:
-            if not os.path.exists(dir):
-                raise FileNotFoundError(f"Could not find {dir}")
-
-        with open(index_dir, "rb") as f:
-            self.index = load(f)
-
-        with open(docmap_dir, "rb") as f:
-            self.docmap = load(f)
-
-        with open(tf_dir, "rb") as f:
-            self.term_frequencies = load(f)
+        with span("load"):
+            if os.path.exists(self.manifest_dir) or os.path.exists(self.segment_dir):
+                self.load_segment()
+            else:
+                self.load_pickles()
+
+    def load_segment(self):
+        if os.path.exists(self.manifest_dir):
+            manifest = read_manifest(self.manifest_dir)
+            manifest.setdefault("build_id", file_version(self.manifest_dir))
+        elif os.path.exists(self.segment_dir):
+            # a single segment written before manifests existed
+            manifest = {
+                "segments": [
+                    {"name": os.path.basename(self.segment_dir), "deleted": []}
+                ],
+                "next_segment": 1,
+                "build_id": file_version(self.segment_dir),
+            }
+        else:
+            raise FileNotFoundError(f"Could not find {self.segment_dir}")
+
+        self.segments = [
+            Segment(f"{self.directory}/{entry['name']}")
+            for entry in manifest["segments"]
+        ]
+        self.deleted = {
+            entry["name"]: set(entry["deleted"])
+            for entry in manifest["segments"]
+            if entry["deleted"]
+        }
+        self.next_segment = manifest["next_segment"]
+        self.build_id = manifest["build_id"]
+        if self.segments:
+            # updates and merges write with the codec the index was saved with
+            self.codec = self.segments[-1].postings.codec
+        with span("open_segments"):
+            self.__open_segments()
+
+    def __open_segments(self):
+        if len(self.segments) == 1 and not self.deleted:
+            # the common case reads the mapped segment directly
+            self.postings = self.segments[0].postings
+            self.docmap = self.segments[0].documents
+        else:
+            deleted = [
+                frozenset(self.deleted.get(segment.name, ()))
+                for segment in self.segments
+            ]
+            self.postings = SegmentedPostings(
+                [(s.postings, d) for s, d in zip(self.segments, deleted)]
+            )
+            self.docmap = SegmentedDocuments(
+                [(s.documents, d) for s, d in zip(self.segments, deleted)]
+            )
+        self.build_scorer()
+
+    def __open_for_update(self):
+        if self.segments:
+            return
+
+        on_disk = os.path.exists(self.manifest_dir) or os.path.exists(self.segment_dir)
+        if not len(self.docmap) and not on_disk and os.path.exists(docmap_dir):
+            # a cache from before segments: its pickles become the base segment
+            self.load_pickles()
+
+        if len(self.docmap):
+            # built in memory: persist it as the base segment first
+            self.save()
+
+        if os.path.exists(self.manifest_dir) or os.path.exists(self.segment_dir):
+            self.load_segment()
+
+    def __commit(self):
+        self.build_id = write_manifest(
+            self.manifest_dir,
+            [segment.name for segment in self.segments],
+            self.deleted,
+            self.next_segment,
+        )
+        self.__open_segments()
+
+    def __new_segment_path(self) -> str:
+        path = f"{self.directory}/index.{self.next_segment:06d}.seg"
+        self.next_segment += 1
+        return path
+
+    def __delete_live_copy(self, doc_id: int) -> bool:
+        for segment in self.segments:
+            deleted = self.deleted.get(segment.name, set())
+            if doc_id in segment.documents and doc_id not in deleted:
+                self.deleted.setdefault(segment.name, set()).add(doc_id)
+                return True
+        return False
+
+    def add_documents(
+        self,
+        documents: Iterable[Dict],
+        workers: int = 1,
+        batch_size: int = BUILD_BATCH_SIZE,
+    ) -> int:
+        # New documents go to a new segment; a document whose id is already
+        # indexed replaces the old copy, which is marked deleted.
+        self.__open_for_update()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        docmap: Dict[int, Dict] = {}
+        builder = build_postings(documents, self.tokenizer, docmap, workers, batch_size)
+        if not docmap:
+            return 0
+
+        for doc_id in docmap:
+            self.__delete_live_copy(doc_id)
+
+        path = self.__new_segment_path()
+        write_segment(path, builder.finish(), docmap, self.codec)
+        self.segments.append(Segment(path))
+        self.__commit()
+
+        if len(self.segments) > SEGMENT_MERGE_THRESHOLD:
+            # the base segment is usually most of the index, so only the
+            # small segments written since are compacted automatically
+            self.merge(self.segments[1:])
+        return len(docmap)
+
+    def update_document(self, document: Dict):
+        self.__open_for_update()
+        if document["id"] not in self.docmap:
+            raise ValueError(f"Document {document['id']} is not in the index")
+
+        self.add_documents([document])
+
+    def delete_document(self, doc_id: int):
+        self.__open_for_update()
+        if not self.__delete_live_copy(doc_id):
+            raise ValueError(f"Document {doc_id} is not in the index")
+
+        self.__commit()
+
+    def merge(self, segments: Optional[List[Segment]] = None):
+        # compacts segments (all of them by default) into one without their
+        # deleted documents
+        self.__open_for_update()
+        if segments is None:
+            segments = self.segments
+        if not segments or (
+            len(segments) == 1 and segments[0].name not in self.deleted
+        ):
+            return
+
+        documents = SegmentedDocuments(
+            [
+                (segment.documents, frozenset(self.deleted.get(segment.name, ())))
+                for segment in segments
+            ]
+        )
+        path = self.__new_segment_path()
+        write_segment(
+            path, merge_segments(segments, self.deleted), documents, self.codec
+        )
 
-        with open(doc_lengths_dir, "rb") as f:
-            self.docs_length = load(f)
+        merged = {segment.name for segment in segments}
+        self.segments = [s for s in self.segments if s.name not in merged]
+        self.segments.append(Segment(path))
+        for name in merged:
+            self.deleted.pop(name, None)
+        self.__commit()
+        # open maps of the old files stay valid after the unlink
+        for segment in segments:
+            os.remove(segment.path)
+
+    def load_pickles(self):
+        if not os.path.exists(docmap_dir):
+            raise FileNotFoundError(f"Could not find {docmap_dir}")
+
+        with span("unpickle"):
+            if os.path.exists(postings_dir):
+                with open(postings_dir, "rb") as f:
+                    self.postings = load(f)
+            else:
+                # cache written before the compact layout: convert on the fly
+                self.postings = PostingLists.from_dicts(*load_legacy_pickles())
+
+            with open(docmap_dir, "rb") as f:
+                self.docmap = load(f)
+        self.build_id = file_version(docmap_dir)
+
+        self.build_scorer()
+
+
+def convert_pickle_cache():
+    inverted_index = InvertedIndex()
+    inverted_index.load_pickles()
+    inverted_index.save()
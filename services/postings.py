@@ -0,0 +1,291 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .utils import BM25_B, BM25_K1
+
+NO_DELETIONS: AbstractSet[int] = frozenset()
+
+
+class PostingLists:
+    # unset on lists pickled before upper bounds were stored
+    max_scores: Optional[array] = None
+    max_score_params: Optional[Tuple[float, float]] = None
+    # doc ids and tfs are plain arrays; see BlockPostingLists for the others
+    codec = "raw"
+    # unset on lists built without positions
+    positions: Optional[bytes] = None
+    position_offsets: Optional[array] = None
+
+    def __init__(
+        self,
+        terms: Dict[str, int],
+        offsets: array,
+        doc_ids: array,
+        tfs: array,
+        doc_lengths: array,
+        n_docs: int,
+        total_doc_length: int,
+        max_scores: Optional[array] = None,
+        max_score_params: Optional[Tuple[float, float]] = None,
+        positions: Optional[bytes] = None,
+        position_offsets: Optional[array] = None,
+    ):
+        # term -> term id; postings of term id t live in [offsets[t], offsets[t + 1])
+        self.terms = terms
+        self.offsets = offsets
+        # doc ids are sorted within each term, tfs are aligned with doc_ids
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        # dense vector indexed by doc id, 0 for ids that are not in the index
+        self.doc_lengths = doc_lengths
+        self.n_docs = n_docs
+        self.total_doc_length = total_doc_length
+        # per term id, the highest BM25 tf component of any posting, for the
+        # (k1, b) in max_score_params and this list's avg_doc_length
+        self.max_scores = max_scores
+        self.max_score_params = max_score_params
+        # token positions of posting p, gap coded (see encode_positions) in
+        # positions[position_offsets[p]:position_offsets[p + 1]]
+        self.positions = positions
+        self.position_offsets = position_offsets
+
+    @property
+    def avg_doc_length(self) -> float:
+        if not self.n_docs:
+            return 0.0
+        return self.total_doc_length / self.n_docs
+
+    def postings(self, term: str) -> Tuple[memoryview, memoryview]:
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return memoryview(array("I")), memoryview(array("I"))
+
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return memoryview(self.doc_ids)[start:end], memoryview(self.tfs)[start:end]
+
+    def segment_postings(
+        self, term: str
+    ) -> Iterator[Tuple[int, "PostingLists", memoryview, memoryview, AbstractSet[int]]]:
+        # a single segment without deletions; see SegmentedPostings
+        doc_ids, tfs = self.postings(term)
+        if doc_ids:
+            yield 0, self, doc_ids, tfs, NO_DELETIONS
+
+    def term_position_offsets(self, term: str) -> memoryview:
+        # aligned with postings(term) plus one: the positions of its i-th
+        # posting are coded in positions[offsets[i]:offsets[i + 1]]
+        if self.position_offsets is None:
+            raise ValueError("The index has no positions, rebuild it to use phrases")
+
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return memoryview(array("Q", [0]))
+
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return memoryview(self.position_offsets)[start : end + 1]
+
+    def doc_positions(self, term: str, doc_id: int) -> List[int]:
+        doc_ids, _ = self.postings(term)
+        i = bisect_left(doc_ids, doc_id)
+        if i == len(doc_ids) or doc_ids[i] != doc_id:
+            return []
+
+        offsets = self.term_position_offsets(term)
+        return decode_positions(self.positions[offsets[i] : offsets[i + 1]])
+
+    def max_score(self, term: str, k1: float, b: float) -> Optional[float]:
+        # None when no bound was stored for these parameters
+        if self.max_scores is None or self.max_score_params != (k1, b):
+            return None
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return 0.0
+        return self.max_scores[term_id]
+
+    def document_frequency(self, term: str) -> int:
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return 0
+        return self.offsets[term_id + 1] - self.offsets[term_id]
+
+    def get_tf(self, doc_id: int, term: str) -> int:
+        doc_ids, tfs = self.postings(term)
+        i = bisect_left(doc_ids, doc_id)
+        if i < len(doc_ids) and doc_ids[i] == doc_id:
+            return tfs[i]
+        return 0
+
+    def doc_length(self, doc_id: int) -> int:
+        if 0 <= doc_id < len(self.doc_lengths):
+            return self.doc_lengths[doc_id]
+        return 0
+
+    def doc_length_items(self) -> Iterable[Tuple[int, int]]:
+        for doc_id, doc_length in enumerate(self.doc_lengths):
+            if doc_length:
+                yield doc_id, doc_length
+
+    @classmethod
+    def from_dicts(
+        cls,
+        index: Dict[str, set],
+        term_frequencies: Dict[int, Counter],
+        docs_length: Dict[int, int],
+    ) -> "PostingLists":
+        builder = PostingListsBuilder(positional=False)
+        for doc_id in sorted(term_frequencies):
+            builder.add_counts(
+                doc_id, term_frequencies[doc_id], docs_length.get(doc_id, 0)
+            )
+        return builder.finish()
+
+
+def encode_positions(positions: List[int]) -> bytes:
+    # gaps between the sorted positions, 7 bits a byte, with the high bit set
+    # on every byte but the last of a gap
+    data = bytearray()
+    previous = 0
+    for position in positions:
+        gap = position - previous
+        previous = position
+        while gap >= 0x80:
+            data.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        data.append(gap)
+    return bytes(data)
+
+
+def decode_positions(data: bytes) -> List[int]:
+    if not data or max(data) < 0x80:
+        # every gap fits in one byte, the common case
+        return list(accumulate(data))
+
+    positions = []
+    position = gap = shift = 0
+    for byte in data:
+        gap |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            position += gap
+            positions.append(position)
+            gap = shift = 0
+    return positions
+
+
+def max_tf_score(
+    doc_ids: Iterable[int],
+    tfs: Iterable[int],
+    doc_lengths: array,
+    avg_doc_length: float,
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+) -> float:
+    # same arithmetic as BM25Scorer, so the bound equals the best posting's
+    # tf component exactly
+    k1_plus_one = k1 + 1
+    best = 0.0
+    for doc_id, tf in zip(doc_ids, tfs):
+        length_norm = 1 - b + b * (doc_lengths[doc_id] / avg_doc_length)
+        bm25_tf = (tf * k1_plus_one) / (tf + k1 * length_norm)
+        if bm25_tf > best:
+            best = bm25_tf
+    return best
+
+
+def compute_max_scores(
+    postings: PostingLists, k1: float = BM25_K1, b: float = BM25_B
+) -> array:
+    doc_ids, tfs = memoryview(postings.doc_ids), memoryview(postings.tfs)
+    offsets = postings.offsets
+    return array(
+        "d",
+        (
+            max_tf_score(
+                doc_ids[offsets[t] : offsets[t + 1]],
+                tfs[offsets[t] : offsets[t + 1]],
+                postings.doc_lengths,
+                postings.avg_doc_length,
+                k1,
+                b,
+            )
+            for t in range(len(offsets) - 1)
+        ),
+    )
+
+
+class PostingListsBuilder:
+    def __init__(self, positional: bool = True):
+        # a posting is (doc id, tf), plus its coded positions when positional
+        self.postings: Dict[str, List[Tuple]] = {}
+        self.docs_length: Dict[int, int] = {}
+        self.positional = positional
+
+    def add(self, doc_id: int, tokens: List[str]):
+        if not self.positional:
+            self.add_counts(doc_id, Counter(tokens), len(tokens))
+            return
+
+        token_positions: Dict[str, List[int]] = {}
+        for position, token in enumerate(tokens):
+            token_positions.setdefault(token, []).append(position)
+        for term, positions in token_positions.items():
+            self.postings.setdefault(term, []).append(
+                (doc_id, len(positions), encode_positions(positions))
+            )
+        self.docs_length[doc_id] = len(tokens)
+
+    def add_counts(self, doc_id: int, counts: Dict[str, int], doc_length: int):
+        if self.positional:
+            raise ValueError("Term counts have no positions, add the tokens instead")
+
+        for term, tf in counts.items():
+            self.postings.setdefault(term, []).append((doc_id, tf))
+        self.docs_length[doc_id] = doc_length
+
+    def merge(self, postings: Dict[str, List[Tuple]], docs_length: Dict[int, int]):
+        for term, term_postings in postings.items():
+            self.postings.setdefault(term, []).extend(term_postings)
+        self.docs_length.update(docs_length)
+
+    def finish(self) -> PostingLists:
+        terms: Dict[str, int] = {}
+        offsets = array("Q", [0])
+        doc_ids = array("I")
+        tfs = array("I")
+        positions = bytearray()
+        position_offsets = array("Q", [0])
+        for term_id, term in enumerate(sorted(self.postings)):
+            terms[term] = term_id
+            # doc ids are unique within a term, so the positions never compare
+            for posting in sorted(self.postings[term]):
+                doc_ids.append(posting[0])
+                tfs.append(posting[1])
+                if self.positional:
+                    positions += posting[2]
+                    position_offsets.append(len(positions))
+            offsets.append(len(doc_ids))
+
+        max_doc_id = max(self.docs_length, default=-1)
+        doc_lengths = array("I", bytes(4 * (max_doc_id + 1)))
+        for doc_id, doc_length in self.docs_length.items():
+            doc_lengths[doc_id] = doc_length
+
+        postings = PostingLists(
+            terms,
+            offsets,
+            doc_ids,
+            tfs,
+            doc_lengths,
+            n_docs=len(self.docs_length),
+            total_doc_length=sum(self.docs_length.values()),
+        )
+        if self.positional:
+            postings.positions = bytes(positions)
+            postings.position_offsets = position_offsets
+        postings.max_scores = compute_max_scores(postings)
+        postings.max_score_params = (BM25_K1, BM25_B)
+        return postings
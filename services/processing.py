@@ -1,10 +1,14 @@
 import json
-from nltk import PorterStemmer
-from typing import Any, List, Dict
+import re
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, List, Dict, Optional
 from string import punctuation
 import os
 from dotenv import load_dotenv
 
+from .tracing import span
+from .utils import STEM_CACHE_SIZE
+
 load_dotenv()
 
 movies_path = os.environ["MOVIES_JSON"]
@@ -21,6 +25,59 @@ def load_movies() -> List[Dict]:
     return movies["movies"]
 
 
+def iter_documents(
+    json_path: str = movies_path, key: str = "movies", chunk_size: int = 1 << 16
+) -> Iterator[Dict]:
+    # yields the objects of a JSONL file, or of the `key` array of a JSON file,
+    # one at a time without reading the whole file
+    if json_path.endswith(".jsonl"):
+        with open(json_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    with open(json_path, "r") as f:
+        buffer = ""
+        while True:
+            match = array_start.search(buffer)
+            if match:
+                pos = match.end()
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError(f"No '{key}' array in {json_path}")
+            buffer += chunk
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                buffer, pos = f.read(chunk_size), 0
+                if not buffer:
+                    raise ValueError(f"Unterminated '{key}' array in {json_path}")
+                continue
+
+            if buffer[pos] == "]":
+                return
+
+            try:
+                doc, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the object runs past the end of the buffer
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+
+            yield doc
+            if pos > chunk_size:
+                buffer, pos = buffer[pos:], 0
+
+
 def load_file(file_path: str) -> List[str]:
     with open(file_path, "r") as f:
         content = f.read()
@@ -28,20 +85,45 @@ def load_file(file_path: str) -> List[str]:
         return lines
 
 
-def search_field(field: str, query: str) -> List[dict]:
-    map_list = load_movies()
-    search_results = []
-    query_tks = tokenize(query)
+class Tokenizer:
+    def __init__(
+        self,
+        stop_words: Optional[Iterable[str]] = None,
+        stem_cache_size: int = STEM_CACHE_SIZE,
+    ):
+        if stop_words is None:
+            stop_words = load_file(os.environ["STOP_WORDS"])
+
+        # deferred: importing nltk costs ~0.5s, and callers that only load
+        # movies (e.g. the semantic CLI) never need it
+        from nltk import PorterStemmer
 
-    for hash_map in map_list:
-        val_tks = tokenize(hash_map.get(field, ""))
+        self.stop_words = frozenset(stop_words)
+        self.stemmer = PorterStemmer()
+        # token -> stem, bounded so an unbounded vocabulary can't grow it forever
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+        self.trans_table = str.maketrans("", "", punctuation)
 
-        for q_tk in query_tks:
-            if q_tk in val_tks:
-                search_results.append(hash_map)
+    def tokenize(self, value: str) -> List[str]:
+        with span("tokenize"):
+            tokens = value.translate(self.trans_table).split()
+            stop_words = self.stop_words
+            stem = self.stem
+            return [stem(token) for token in tokens if token not in stop_words]
 
-    search_results.sort(key=lambda x: x["id"])
-    return search_results
+    def tokenize_many(self, texts: Iterable[str]) -> Iterator[List[str]]:
+        for text in texts:
+            yield self.tokenize(text)
+
+
+_tokenizer: Optional[Tokenizer] = None
+
+
+def get_tokenizer() -> Tokenizer:
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = Tokenizer()
+    return _tokenizer
 
 
 def remove_punctuation(value: str) -> str:
@@ -50,21 +132,16 @@ def remove_punctuation(value: str) -> str:
 
 
 def tokenize(value: str) -> List[str]:
-    value = remove_punctuation(value)
-    tokens = value.split()
-    removed = remove_stop_words(tokens)
-    stemmed = stem(removed)
-    return stemmed
+    return get_tokenizer().tokenize(value)
 
 
 def remove_stop_words(tokens: List[str]) -> List[str]:
-    STOP_WORDS_PATH = os.environ["STOP_WORDS"]
-    stop_words = load_file(STOP_WORDS_PATH)
+    stop_words = get_tokenizer().stop_words
     filtered = [token for token in tokens if token and token not in stop_words]
     return filtered
 
 
 def stem(tokens: List[str]) -> List[str]:
-    stemmer = PorterStemmer()
-    stemmed = [stemmer.stem(token) for token in tokens]
+    stem_token = get_tokenizer().stem
+    stemmed = [stem_token(token) for token in tokens]
     return stemmed
@@ -0,0 +1,243 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from .utils import PQ_CENTROIDS, PQ_SUBSPACES
+
+QUANTIZATION_FORMAT_VERSION = 1
+
+# rows scored per step, so the float32 upcast of the codes stays bounded
+SCORE_CHUNK_ROWS = 65536
+
+
+def kmeans(
+    vectors: np.ndarray, n_clusters: int, n_iterations: int = 20, seed: int = 0
+) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iterations):
+        # argmin ||x - c||^2 == argmin ||c||^2 - 2 x.c
+        distances = (centroids**2).sum(axis=1) - 2 * vectors @ centroids.T
+        assignments = np.argmin(distances, axis=1)
+        # per-dimension bincount is much faster than np.add.at for low dims
+        sums = np.stack(
+            [
+                np.bincount(assignments, weights=vectors[:, d], minlength=n_clusters)
+                for d in range(vectors.shape[1])
+            ],
+            axis=1,
+        )
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        empty = counts == 0
+        centroids = sums / np.maximum(counts, 1)[:, None]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids.astype(np.float32)
+
+
+class Int8Quantizer:
+    # Per-dimension affine quantization: x ~= (code + 128) * scale + offset
+    def __init__(self, scale: np.ndarray, offset: np.ndarray):
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray) -> "Int8Quantizer":
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        scale = (high - low) / 255
+        scale[scale == 0] = 1.0
+        return cls(scale.astype(np.float32), low.astype(np.float32))
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.offset) / self.scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128) * self.scale + self.offset
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # asymmetric: the query stays float32 and the dequantization is folded
+        # into it, so codes are only ever cast, never decoded
+        scaled_query = (query * self.scale).astype(np.float32)
+        bias = float(np.dot(128 * self.scale + self.offset, query))
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start : start + SCORE_CHUNK_ROWS].astype(np.float32)
+            out[start : start + len(chunk)] = chunk @ scaled_query + bias
+        return out
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                version=QUANTIZATION_FORMAT_VERSION,
+                scale=self.scale,
+                offset=self.offset,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "Int8Quantizer":
+        with np.load(path) as data:
+            _check_version(data, path)
+            return cls(data["scale"], data["offset"])
+
+
+class ProductQuantizer:
+    # Splits vectors into subspaces and stores the id of the nearest of
+    # n_centroids centroids per subspace, one uint8 per subspace.
+    def __init__(self, centroids: np.ndarray):
+        # (n_subspaces, n_centroids, subspace dimensions)
+        self.centroids = centroids
+
+    @property
+    def n_subspaces(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def fit(
+        cls,
+        vectors: np.ndarray,
+        n_subspaces: int = PQ_SUBSPACES,
+        n_centroids: int = PQ_CENTROIDS,
+        max_training_points: int = 65536,
+        seed: int = 0,
+    ) -> "ProductQuantizer":
+        dimensions = vectors.shape[1]
+        if dimensions % n_subspaces:
+            raise ValueError(
+                f"{dimensions} dimensions cannot be split into {n_subspaces} subspaces"
+            )
+        if n_centroids > 256:
+            raise ValueError("n_centroids must fit in one byte")
+
+        rng = np.random.default_rng(seed)
+        n_training = min(len(vectors), max_training_points)
+        training = np.asarray(
+            vectors[np.sort(rng.choice(len(vectors), n_training, replace=False))],
+            dtype=np.float32,
+        )
+
+        sub_dimensions = dimensions // n_subspaces
+        # no more centroids than training points, or encode could pick the
+        # unused ones
+        n_centroids = min(n_centroids, n_training)
+        centroids = np.empty(
+            (n_subspaces, n_centroids, sub_dimensions), dtype=np.float32
+        )
+        for j in range(n_subspaces):
+            sub_vectors = np.ascontiguousarray(
+                training[:, j * sub_dimensions : (j + 1) * sub_dimensions]
+            )
+            centroids[j] = kmeans(sub_vectors, n_centroids, seed=seed + j)
+        return cls(centroids)
+
+    def __split(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.reshape(len(vectors), self.n_subspaces, -1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.n_subspaces), dtype=np.uint8)
+        for start in range(0, len(vectors), SCORE_CHUNK_ROWS):
+            chunk = self.__split(
+                np.asarray(vectors[start : start + SCORE_CHUNK_ROWS], np.float32)
+            )
+            for j in range(self.n_subspaces):
+                sub_centroids = self.centroids[j]
+                distances = (sub_centroids**2).sum(axis=1) - 2 * (
+                    chunk[:, j] @ sub_centroids.T
+                )
+                codes[start : start + len(chunk), j] = np.argmin(distances, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        subspaces = np.arange(self.n_subspaces)
+        return self.centroids[subspaces, codes].reshape(len(codes), -1)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # asymmetric distance computation: one lookup table of query/centroid
+        # inner products per subspace, then a sum of table lookups per row
+        tables = np.einsum(
+            "jcd,jd->jc", self.centroids, query.reshape(self.n_subspaces, -1)
+        ).astype(np.float32)
+        subspaces = np.arange(self.n_subspaces)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start : start + SCORE_CHUNK_ROWS]
+            out[start : start + len(chunk)] = tables[subspaces, chunk].sum(axis=1)
+        return out
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, version=QUANTIZATION_FORMAT_VERSION, centroids=self.centroids)
+
+    @classmethod
+    def load(cls, path: str) -> "ProductQuantizer":
+        with np.load(path) as data:
+            _check_version(data, path)
+            return cls(data["centroids"])
+
+
+QUANTIZERS = {"int8": Int8Quantizer, "pq": ProductQuantizer}
+
+
+class QuantizedStore:
+    def __init__(self, mode: str, quantizer, codes: np.ndarray, source_build_id: str):
+        self.mode = mode
+        self.quantizer = quantizer
+        self.codes = codes
+        self.source_build_id = source_build_id
+
+    @classmethod
+    def build(
+        cls, mode: str, embeddings: np.ndarray, source_build_id: str
+    ) -> "QuantizedStore":
+        if mode not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+
+        quantizer = QUANTIZERS[mode].fit(embeddings)
+        return cls(mode, quantizer, quantizer.encode(embeddings), source_build_id)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.quantizer.scores(self.codes, query)
+
+    def save(self, path_prefix: str):
+        # replace rather than truncate: the previous codes may still be mapped.
+        # The build id goes last, so a store cut short mid-save is rebuilt
+        # rather than loaded with codes that do not match it.
+        codes_path = f"{path_prefix}.{self.mode}.npy"
+        params_path = f"{path_prefix}.{self.mode}.params.npz"
+        build_id_path = f"{path_prefix}.{self.mode}.build_id"
+        if os.path.exists(build_id_path):
+            os.remove(build_id_path)
+
+        with open(f"{codes_path}.tmp", "wb") as f:
+            np.save(f, self.codes)
+        os.replace(f"{codes_path}.tmp", codes_path)
+        self.quantizer.save(f"{params_path}.tmp")
+        os.replace(f"{params_path}.tmp", params_path)
+        with open(f"{build_id_path}.tmp", "w") as f:
+            f.write(self.source_build_id)
+        os.replace(f"{build_id_path}.tmp", build_id_path)
+
+    @classmethod
+    def load(cls, mode: str, path_prefix: str) -> Optional["QuantizedStore"]:
+        codes_path = f"{path_prefix}.{mode}.npy"
+        params_path = f"{path_prefix}.{mode}.params.npz"
+        build_id_path = f"{path_prefix}.{mode}.build_id"
+        if not all(os.path.exists(p) for p in [codes_path, params_path, build_id_path]):
+            return None
+
+        with open(build_id_path, "r") as f:
+            source_build_id = f.read().strip()
+
+        quantizer = QUANTIZERS[mode].load(params_path)
+        codes = np.load(codes_path, mmap_mode="r")
+        return cls(mode, quantizer, codes, source_build_id)
+
+
+def _check_version(data, path: str):
+    if int(data["version"]) != QUANTIZATION_FORMAT_VERSION:
+        raise ValueError(f"Unsupported quantization params version in {path}")
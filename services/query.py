@@ -0,0 +1,249 @@
+import re
+from bisect import bisect_left
+from typing import AbstractSet, List, Optional, Sequence, Tuple, Union
+
+from services.processing import Tokenizer
+
+from .postings import NO_DELETIONS, PostingLists, decode_positions
+from .segment import SegmentedPostings
+
+# parentheses, quoted phrases (an unclosed quote runs to the end) and words
+QUERY_TOKEN = re.compile(r'\(|\)|"[^"]*"?|[^\s()"]+')
+# below this length ratio, intersect() uses a set instead of galloping
+GALLOP_RATIO = 32
+
+
+class Term:
+    def __init__(self, token: str):
+        self.token = token
+
+
+class Phrase:
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+
+
+class And:
+    def __init__(self, children: List["Query"]):
+        self.children = children
+
+
+class Or:
+    def __init__(self, children: List["Query"]):
+        self.children = children
+
+
+class Not:
+    def __init__(self, child: "Query"):
+        self.child = child
+
+
+Query = Union[Term, Phrase, And, Or, Not]
+
+
+class QueryParser:
+    # query := or; or := and ("OR" and)*; and := not ("AND"? not)*;
+    # not := "NOT" not | "(" or ")" | '"phrase"' | word
+    # Adjacent words are ANDed. Words and phrases go through the index's
+    # tokenizer, so stop words drop out and a phrase matches the token
+    # positions the index recorded.
+    def __init__(self, tokenizer: Tokenizer):
+        self.tokenizer = tokenizer
+
+    def parse(self, query: str) -> Optional[Query]:
+        self.tokens = QUERY_TOKEN.findall(query)
+        self.pos = 0
+        node = self.__or()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in query")
+        return node
+
+    def __peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def __or(self) -> Optional[Query]:
+        children = [self.__and()]
+        while self.__peek() == "OR":
+            self.pos += 1
+            children.append(self.__and())
+        return _combine(Or, children)
+
+    def __and(self) -> Optional[Query]:
+        children = [self.__not()]
+        while self.__peek() not in (None, ")", "OR"):
+            if self.__peek() == "AND":
+                self.pos += 1
+            children.append(self.__not())
+        return _combine(And, children)
+
+    def __not(self) -> Optional[Query]:
+        token = self.__peek()
+        if token is None or token in (")", "AND", "OR"):
+            raise ValueError(f"Expected a term in query, got '{token or 'end'}'")
+        self.pos += 1
+
+        if token == "NOT":
+            child = self.__not()
+            return None if child is None else Not(child)
+        if token == "(":
+            node = self.__or()
+            if self.__peek() != ")":
+                raise ValueError("Unbalanced parentheses in query")
+            self.pos += 1
+            return node
+
+        tokens = self.tokenizer.tokenize(token.strip('"'))
+        if not tokens:
+            return None
+        if len(tokens) == 1:
+            return Term(tokens[0])
+        return Phrase(tokens)
+
+
+def _combine(cls, children: List[Optional[Query]]) -> Optional[Query]:
+    # terms that were only stop words match nothing and are left out
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return cls(children)
+
+
+def parse_query(query: str, tokenizer: Tokenizer) -> Optional[Query]:
+    return QueryParser(tokenizer).parse(query)
+
+
+def query_terms(node: Optional[Query]) -> List[str]:
+    # the tokens a match is ranked by: every term outside a NOT
+    if node is None or isinstance(node, Not):
+        return []
+    if isinstance(node, Term):
+        return [node.token]
+    if isinstance(node, Phrase):
+        return list(node.tokens)
+    return [token for child in node.children for token in query_terms(child)]
+
+
+def intersect(a: Sequence[int], b: Sequence[int]) -> List[int]:
+    # Galloping: each doc id of the shorter list is found in the longer one
+    # by doubling steps from the previous match and a binary search within
+    # the last step, O(m log(n / m)) rather than O(m + n) for a scan. For
+    # lists of similar length the O(m + n) set intersection, which runs in C,
+    # is faster than any Python loop.
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) * GALLOP_RATIO >= len(b):
+        return sorted(set(a).intersection(b))
+
+    result = []
+    lo, end = 0, len(b)
+    for doc_id in a:
+        step = 1
+        while lo + step < end and b[lo + step] < doc_id:
+            step *= 2
+        lo = bisect_left(b, doc_id, lo + step // 2, min(lo + step + 1, end))
+        if lo == end:
+            break
+        if b[lo] == doc_id:
+            result.append(doc_id)
+            lo += 1
+    return result
+
+
+def difference(a: Sequence[int], b: Sequence[int]) -> List[int]:
+    excluded = set(b)
+    return [doc_id for doc_id in a if doc_id not in excluded]
+
+
+def union(lists: List[Sequence[int]]) -> List[int]:
+    return sorted(set().union(*lists))
+
+
+class PartMatcher:
+    # Evaluates a query against the postings of one segment, to sorted doc
+    # ids. Deleted documents are only dropped from the final result.
+    def __init__(self, postings: PostingLists, deleted: AbstractSet[int]):
+        self.postings = postings
+        self.deleted = deleted
+        self.all_docs: Optional[List[int]] = None
+
+    def match(self, node: Optional[Query]) -> List[int]:
+        if node is None:
+            return []
+        doc_ids = self.__match(node)
+        if self.deleted:
+            return [doc_id for doc_id in doc_ids if doc_id not in self.deleted]
+        return list(doc_ids)
+
+    def __universe(self) -> List[int]:
+        # only needed by a NOT that is not ANDed with anything positive
+        if self.all_docs is None:
+            self.all_docs = [doc_id for doc_id, _ in self.postings.doc_length_items()]
+        return self.all_docs
+
+    def __match(self, node: Query) -> Sequence[int]:
+        if isinstance(node, Term):
+            doc_ids, _ = self.postings.postings(node.token)
+            return doc_ids
+        if isinstance(node, Phrase):
+            return self.__phrase(node.tokens)
+        if isinstance(node, Or):
+            return union([self.__match(child) for child in node.children])
+        if isinstance(node, Not):
+            return difference(self.__universe(), self.__match(node.child))
+
+        # AND: intersect the positive children shortest first, so the
+        # candidate list only shrinks, then subtract the negated ones
+        positive = [child for child in node.children if not isinstance(child, Not)]
+        negative = [child.child for child in node.children if isinstance(child, Not)]
+        lists = sorted((self.__match(child) for child in positive), key=len)
+        doc_ids = lists[0] if lists else self.__universe()
+        for other in lists[1:]:
+            if not doc_ids:
+                break
+            doc_ids = intersect(doc_ids, other)
+        for child in negative:
+            if not doc_ids:
+                break
+            doc_ids = difference(doc_ids, self.__match(child))
+        return doc_ids
+
+    def __phrase(self, tokens: List[str]) -> List[int]:
+        term_postings: List[Tuple[str, memoryview]] = [
+            (token, self.postings.postings(token)[0]) for token in tokens
+        ]
+        lists = sorted((doc_ids for _, doc_ids in term_postings), key=len)
+        candidates = lists[0]
+        for other in lists[1:]:
+            candidates = intersect(candidates, other)
+        if not len(candidates):
+            return []
+
+        offsets = [self.postings.term_position_offsets(token) for token in tokens]
+        positions = self.postings.positions
+        matches = []
+        for doc_id in candidates:
+            # phrase start positions consistent with every token so far
+            starts = None
+            for k, (_, doc_ids) in enumerate(term_postings):
+                i = bisect_left(doc_ids, doc_id)
+                coded = positions[offsets[k][i] : offsets[k][i + 1]]
+                token_starts = {position - k for position in decode_positions(coded)}
+                starts = token_starts if starts is None else starts & token_starts
+                if not starts:
+                    break
+            if starts:
+                matches.append(doc_id)
+        return matches
+
+
+def match_documents(
+    node: Optional[Query], postings: Union[PostingLists, SegmentedPostings]
+) -> List[int]:
+    if isinstance(postings, SegmentedPostings):
+        parts = postings.parts
+    else:
+        parts = [(postings, NO_DELETIONS)]
+    # a document is live in at most one segment
+    return union([PartMatcher(p, deleted).match(node) for p, deleted in parts])
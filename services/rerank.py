@@ -0,0 +1,132 @@
+import hashlib
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .cache_store import CacheStore
+from .embedding_cache import normalize_query
+from .tracing import span
+from .utils import (
+    RERANK_BATCH_SIZE,
+    RERANK_BUDGET_MS,
+    RERANK_CACHE_DISK_SIZE,
+    RERANK_CACHE_SIZE,
+    RERANK_MODEL,
+)
+
+load_dotenv()
+
+cache_dir = os.environ["CACHE_DIR"]
+rerank_cache_dir = f"{cache_dir}/rerank_scores.sqlite"
+
+
+def rerank_text(doc: Dict) -> str:
+    # a passage result is judged on its passage, a movie on its description
+    return f"{doc['title']}: {doc.get('passage') or doc['description']}"
+
+
+class Reranker:
+    # Rescores first stage candidates (dicts with an "id", in first stage
+    # order) with a cross-encoder. Candidates are scored in batches from the
+    # top down until the budget runs out, or would run out during the next
+    # batch at the pace of the last one; the scored prefix is reordered by
+    # cross-encoder score and the rest keeps its first stage order. Scores
+    # are cached per (query, document text), so a repeated query reranks
+    # for free and a changed document is scored again; with a path, in a
+    # SQLite store that every process shares. The budget covers scoring only:
+    # the model is loaded before the clock starts.
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        batch_size: int = RERANK_BATCH_SIZE,
+        budget_ms: float = RERANK_BUDGET_MS,
+        cache_size: int = RERANK_CACHE_SIZE,
+        path: Optional[str] = None,
+        disk_size: int = RERANK_CACHE_DISK_SIZE,
+        model=None,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.__model = model
+        self.clock = clock
+        self.cache = CacheStore(
+            "rerank_cache", "rerank_scores", cache_size, disk_size, path
+        )
+        self.counters = {"hits": 0, "misses": 0, "scored": 0, "over_budget": 0}
+
+    @property
+    def model(self):
+        # loaded on first use, like the bi-encoder, to keep torch out of
+        # commands that never rerank
+        if self.__model is None:
+            from sentence_transformers import CrossEncoder
+
+            self.__model = CrossEncoder(self.model_name)
+        return self.__model
+
+    def key(self, query: str, text: str) -> str:
+        payload = f"{self.model_name}\0{normalize_query(query)}\0{text}"
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def rerank(
+        self,
+        query: str,
+        candidates: List[Dict],
+        limit: int,
+        budget_ms: Optional[float] = None,
+    ) -> List[Dict]:
+        texts = [rerank_text(doc) for doc in candidates]
+        keys = [self.key(query, text) for text in texts]
+        scores: List[Optional[float]] = self.cache.get_many(keys)
+        misses = [i for i, score in enumerate(scores) if score is None]
+        self.counters["hits"] += len(keys) - len(misses)
+        if misses:
+            # a cold start is not charged to the budget
+            self.model
+
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        deadline = self.clock() + budget
+        last_batch = 0.0
+        for start in range(0, len(misses), self.batch_size):
+            now = self.clock()
+            if now + last_batch > deadline:
+                self.counters["over_budget"] += 1
+                break
+
+            batch = misses[start : start + self.batch_size]
+            with span("cross_encoder"):
+                predicted = self.model.predict(
+                    [(query, texts[i]) for i in batch], batch_size=len(batch)
+                )
+            for i, score in zip(batch, predicted):
+                scores[i] = float(score)
+            self.cache.put_many([(keys[i], scores[i]) for i in batch])
+            self.counters["misses"] += len(batch)
+            last_batch = self.clock() - now
+
+        # only the prefix with every score known is reordered
+        scored = next(
+            (i for i, score in enumerate(scores) if score is None), len(scores)
+        )
+        self.counters["scored"] += scored
+        order = sorted(range(scored), key=lambda i: -scores[i])
+        order += range(scored, len(candidates))
+
+        results = []
+        for i in order[:limit]:
+            results.append(
+                dict(candidates[i], rerank_score=scores[i] if i < scored else None)
+            )
+        return results
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return dict(
+            self.counters,
+            cached=len(self.cache.memory),
+            hit_rate=self.counters["hits"] / lookups if lookups else 0.0,
+        )
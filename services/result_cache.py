@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from .cache_store import CacheStore
+from .utils import RESULT_CACHE_DISK_SIZE, RESULT_CACHE_SIZE, RESULT_CACHE_TTL
+
+load_dotenv()
+
+cache_dir = os.environ["CACHE_DIR"]
+result_cache_dir = f"{cache_dir}/results.sqlite"
+
+
+class ResultCache:
+    # Search results by query, limit, engine parameters and the version of
+    # the index or embedding store they came from. A rebuilt or updated index
+    # has a new build id, so results from before it can never be hit; they
+    # age out of the in-process LRU and, with a path, the SQLite store that
+    # shares results between processes. Entries expire after ttl seconds
+    # either way. Values must be JSON serializable.
+    def __init__(
+        self,
+        engine: str,
+        path: Optional[str] = None,
+        memory_size: int = RESULT_CACHE_SIZE,
+        disk_size: int = RESULT_CACHE_DISK_SIZE,
+        ttl: Optional[float] = RESULT_CACHE_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.engine = engine
+        self.path = path
+        self.version: Optional[str] = None
+        self.store = CacheStore(
+            f"{engine}_result_cache",
+            "results",
+            memory_size,
+            disk_size,
+            path,
+            ttl,
+            clock,
+            dumps=json.dumps,
+            loads=json.loads,
+        )
+
+    def key(self, version: str, tokens: List[str], limit: int, **params) -> str:
+        if version != self.version:
+            # nothing cached for another version can be hit any more
+            self.store.clear_memory()
+            self.version = version
+        payload = json.dumps(
+            [self.engine, version, tokens, limit, sorted(params.items())]
+        )
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.store.get(key)
+
+    def put(self, key: str, value: Any):
+        self.store.put(key, value)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return self.store.stats()
@@ -0,0 +1,541 @@
+import json
+import mmap
+import os
+import struct
+import uuid
+from array import array
+from bisect import bisect_left
+from typing import AbstractSet, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from .postings import PostingLists, PostingListsBuilder, max_tf_score
+from .utils import (
+    BM25_B,
+    BM25_K1,
+    POSTINGS_BLOCK_SIZE,
+    POSTINGS_CODEC,
+    POSTINGS_CODECS,
+)
+
+SEGMENT_MAGIC = b"RAGSEG\x00\x00"
+SEGMENT_VERSION = 4
+MANIFEST_VERSION = 1
+
+# magic, version, n_terms, n_docs, doc table size, n_postings, total doc length,
+# the k1 and b of the stored max scores, the postings codec (an index into
+# POSTINGS_CODECS) and block size, then the byte offset of each section and
+# of the end of the file
+HEADER = struct.Struct("<8sIIIIQQddII16Q")
+SECTIONS = (
+    "term_offsets",
+    "term_bytes",
+    "postings_offsets",
+    "doc_ids",
+    "tfs",
+    "doc_lengths",
+    "stored_offsets",
+    "stored_docs",
+    "max_scores",
+    "position_offsets",
+    "positions",
+    "block_offsets",
+    "block_last_doc_ids",
+    "block_doc_offsets",
+    "block_tf_offsets",
+    "end",
+)
+BLOCK_SECTIONS = SECTIONS[-5:-1]
+
+# older segments, still read: version 3 has raw postings only, version 2 no
+# positions either, version 1 no max scores either
+HEADER_V3 = struct.Struct("<8sIIIIQQdd12Q")
+SECTIONS_V3 = tuple(name for name in SECTIONS if name not in BLOCK_SECTIONS)
+HEADER_V2 = struct.Struct("<8sIIIIQQdd10Q")
+SECTIONS_V2 = tuple(
+    name for name in SECTIONS_V3 if name not in ("position_offsets", "positions")
+)
+HEADER_V1 = struct.Struct("<8sIIIIQQ9Q")
+SECTIONS_V1 = tuple(name for name in SECTIONS_V2 if name != "max_scores")
+
+FORMATS = {
+    SEGMENT_VERSION: (HEADER, SECTIONS),
+    3: (HEADER_V3, SECTIONS_V3),
+    2: (HEADER_V2, SECTIONS_V2),
+    1: (HEADER_V1, SECTIONS_V1),
+}
+
+
+class TermDictionary(Mapping[str, int]):
+    # Sorted terms looked up by binary search directly in the mapped file, so
+    # a query only touches the pages on its search path.
+    def __init__(self, term_offsets: memoryview, term_bytes: memoryview):
+        self.term_offsets = term_offsets
+        self.term_bytes = term_bytes
+        self.lookups: Dict[str, Optional[int]] = {}
+
+    def term_at(self, term_id: int) -> bytes:
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.term_bytes[start:end].tobytes()
+
+    def get(self, term: str, default=None):
+        if term not in self.lookups:
+            self.lookups[term] = self.__find(term.encode())
+
+        term_id = self.lookups[term]
+        return default if term_id is None else term_id
+
+    def __find(self, key: bytes) -> Optional[int]:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.term_at(lo) == key:
+            return lo
+        return None
+
+    def __getitem__(self, term: str) -> int:
+        term_id = self.get(term)
+        if term_id is None:
+            raise KeyError(term)
+        return term_id
+
+    def __contains__(self, term) -> bool:
+        return self.get(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for term_id in range(len(self)):
+            yield self.term_at(term_id).decode()
+
+    def __len__(self) -> int:
+        return len(self.term_offsets) - 1
+
+
+class StoredDocuments(Mapping[int, Dict]):
+    def __init__(
+        self, stored_offsets: memoryview, stored_docs: memoryview, n_docs: int
+    ):
+        self.stored_offsets = stored_offsets
+        self.stored_docs = stored_docs
+        self.n_docs = n_docs
+
+    def __getitem__(self, doc_id: int) -> Dict:
+        if not 0 <= doc_id < len(self.stored_offsets) - 1:
+            raise KeyError(doc_id)
+
+        start, end = self.stored_offsets[doc_id], self.stored_offsets[doc_id + 1]
+        if start == end:
+            raise KeyError(doc_id)
+        return json.loads(self.stored_docs[start:end].tobytes())
+
+    def __contains__(self, doc_id) -> bool:
+        # offsets only, without decoding the stored document
+        if (
+            not isinstance(doc_id, int)
+            or not 0 <= doc_id < len(self.stored_offsets) - 1
+        ):
+            return False
+        return self.stored_offsets[doc_id] != self.stored_offsets[doc_id + 1]
+
+    def __iter__(self) -> Iterator[int]:
+        for doc_id in range(len(self.stored_offsets) - 1):
+            if self.stored_offsets[doc_id] != self.stored_offsets[doc_id + 1]:
+                yield doc_id
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+
+class Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        # the map keeps its own handle, and lives as long as any view into it
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mmap)
+
+        magic, version = struct.unpack_from("<8sI", buffer)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not an index segment")
+
+        if version not in FORMATS:
+            raise ValueError(f"Unsupported segment version {version} in {path}")
+
+        header_format, sections = FORMATS[version]
+        header = header_format.unpack_from(buffer)
+        fields = header[: -len(sections)]
+        offsets = dict(zip(sections, header[-len(sections) :]))
+        n_terms, n_docs, doc_table_size, n_postings, total_doc_length = fields[2:7]
+        max_score_params = fields[7:9] if len(fields) > 7 else None
+        codec, block_size = fields[9:11] if len(fields) > 9 else (0, 0)
+        codec = POSTINGS_CODECS[codec]
+
+        # sections are padded on disk, so slice them by their item count
+        def section(name: str, count: int, fmt: str = "B") -> memoryview:
+            start = offsets[name]
+            end = start + count * struct.calcsize(fmt)
+            return buffer[start:end].cast(fmt)
+
+        term_offsets = section("term_offsets", n_terms + 1, "Q")
+        stored_offsets = section("stored_offsets", doc_table_size + 1, "Q")
+
+        terms = TermDictionary(term_offsets, section("term_bytes", term_offsets[-1]))
+        postings_offsets = section("postings_offsets", n_terms + 1, "Q")
+        doc_lengths = section("doc_lengths", doc_table_size, "I")
+        if codec == "raw":
+            self.postings = PostingLists(
+                terms,
+                postings_offsets,
+                section("doc_ids", n_postings, "I"),
+                section("tfs", n_postings, "I"),
+                doc_lengths,
+                n_docs=n_docs,
+                total_doc_length=total_doc_length,
+            )
+        else:
+            # deferred like the codecs' numpy import, raw segments never need it
+            from .codecs import BlockPostingLists
+
+            block_offsets = section("block_offsets", n_terms + 1, "Q")
+            n_blocks = block_offsets[-1]
+            block_doc_offsets = section("block_doc_offsets", n_blocks + 1, "Q")
+            block_tf_offsets = section("block_tf_offsets", n_blocks + 1, "Q")
+            self.postings = BlockPostingLists(
+                terms,
+                postings_offsets,
+                section("doc_ids", block_doc_offsets[-1]),
+                section("tfs", block_tf_offsets[-1]),
+                doc_lengths,
+                n_docs,
+                total_doc_length,
+                codec,
+                block_size,
+                block_offsets,
+                section("block_last_doc_ids", n_blocks, "I"),
+                block_doc_offsets,
+                block_tf_offsets,
+            )
+        if max_score_params is not None:
+            self.postings.max_scores = section("max_scores", n_terms, "d")
+            self.postings.max_score_params = max_score_params
+        # an empty offsets section: written from postings without positions
+        if offsets.get("positions", 0) > offsets.get("position_offsets", 0):
+            position_offsets = section("position_offsets", n_postings + 1, "Q")
+            self.postings.position_offsets = position_offsets
+            self.postings.positions = section("positions", position_offsets[-1])
+        self.documents = StoredDocuments(
+            stored_offsets, section("stored_docs", stored_offsets[-1]), n_docs
+        )
+
+
+def write_segment(
+    path: str,
+    postings: PostingLists,
+    documents: Mapping[int, Dict],
+    codec: str = POSTINGS_CODEC,
+    block_size: int = POSTINGS_BLOCK_SIZE,
+):
+    if codec not in POSTINGS_CODECS:
+        raise ValueError(f"Unknown postings codec {codec}")
+    blocked = codec != "raw"
+    if blocked:
+        from .codecs import encode_postings
+
+    terms = sorted(postings.terms)
+    term_offsets = array("Q", [0])
+    term_bytes = bytearray()
+    postings_offsets = array("Q", [0])
+    # raw: the doc id and tf arrays; otherwise their coded blocks
+    doc_ids = bytearray() if blocked else array("I")
+    tfs = bytearray() if blocked else array("I")
+    block_offsets = array("Q", [0] if blocked else [])
+    block_last_doc_ids = array("I")
+    block_doc_offsets = array("Q", [0] if blocked else [])
+    block_tf_offsets = array("Q", [0] if blocked else [])
+    n_postings = 0
+    max_scores = array("d")
+    positional = postings.position_offsets is not None
+    positions = bytearray()
+    position_offsets = array("Q", [0] if positional else [])
+    for term in terms:
+        term_bytes += term.encode()
+        term_offsets.append(len(term_bytes))
+
+        term_doc_ids, term_tfs = postings.postings(term)
+        n_postings += len(term_doc_ids)
+        postings_offsets.append(n_postings)
+        if blocked:
+            doc_blocks, tf_blocks, last_doc_ids = encode_postings(
+                codec, term_doc_ids, term_tfs, block_size
+            )
+            for doc_block, tf_block in zip(doc_blocks, tf_blocks):
+                doc_ids += doc_block
+                tfs += tf_block
+                block_doc_offsets.append(len(doc_ids))
+                block_tf_offsets.append(len(tfs))
+            block_last_doc_ids.extend(last_doc_ids)
+            block_offsets.append(len(block_last_doc_ids))
+        else:
+            doc_ids.frombytes(term_doc_ids.tobytes())
+            tfs.frombytes(term_tfs.tobytes())
+
+        max_score = postings.max_score(term, BM25_K1, BM25_B)
+        if max_score is None:
+            max_score = max_tf_score(
+                term_doc_ids,
+                term_tfs,
+                postings.doc_lengths,
+                postings.avg_doc_length,
+            )
+        max_scores.append(max_score)
+
+        if positional:
+            coded_offsets = postings.term_position_offsets(term)
+            base = len(positions) - coded_offsets[0]
+            positions += postings.positions[coded_offsets[0] : coded_offsets[-1]]
+            position_offsets.extend(offset + base for offset in coded_offsets[1:])
+
+    doc_table_size = max(len(postings.doc_lengths), max(documents, default=-1) + 1)
+    doc_lengths = array("I", bytes(4 * doc_table_size))
+    for doc_id, doc_length in postings.doc_length_items():
+        doc_lengths[doc_id] = doc_length
+
+    stored_offsets = array("Q", [0])
+    stored_docs = bytearray()
+    for doc_id in range(doc_table_size):
+        if doc_id in documents:
+            stored_docs += json.dumps(documents[doc_id]).encode()
+        stored_offsets.append(len(stored_docs))
+
+    sections = [
+        term_offsets.tobytes(),
+        bytes(term_bytes),
+        postings_offsets.tobytes(),
+        bytes(doc_ids),
+        bytes(tfs),
+        doc_lengths.tobytes(),
+        stored_offsets.tobytes(),
+        bytes(stored_docs),
+        max_scores.tobytes(),
+        position_offsets.tobytes(),
+        bytes(positions),
+        block_offsets.tobytes(),
+        block_last_doc_ids.tobytes(),
+        block_doc_offsets.tobytes(),
+        block_tf_offsets.tobytes(),
+    ]
+
+    section_offsets = []
+    position = HEADER.size
+    for data in sections:
+        section_offsets.append(position)
+        position += _padded(len(data))
+    section_offsets.append(position)
+
+    header = HEADER.pack(
+        SEGMENT_MAGIC,
+        SEGMENT_VERSION,
+        len(terms),
+        # postings saved without their documents (a FieldIndex field) still
+        # need their N
+        len(documents) if documents else postings.n_docs,
+        doc_table_size,
+        n_postings,
+        postings.total_doc_length,
+        BM25_K1,
+        BM25_B,
+        POSTINGS_CODECS.index(codec),
+        block_size if blocked else 0,
+        *section_offsets,
+    )
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for data in sections:
+            f.write(data)
+            f.write(bytes(_padded(len(data)) - len(data)))
+    os.replace(tmp_path, path)
+
+
+class SegmentedPostings:
+    # The posting lists of several segments read as one index. Deleted doc ids
+    # are skipped everywhere, and N, df and avgdl cover the live documents of
+    # all segments, so BM25 scores match a single segment built from them.
+    def __init__(self, parts: List[Tuple[PostingLists, AbstractSet[int]]]):
+        self.parts = parts
+        self.n_docs = 0
+        self.total_doc_length = 0
+        for postings, deleted in parts:
+            self.n_docs += postings.n_docs - len(deleted)
+            self.total_doc_length += postings.total_doc_length - sum(
+                postings.doc_length(doc_id) for doc_id in deleted
+            )
+        self.frequencies: Dict[str, int] = {}
+
+    @property
+    def avg_doc_length(self) -> float:
+        if not self.n_docs:
+            return 0.0
+        return self.total_doc_length / self.n_docs
+
+    def segment_postings(
+        self, term: str
+    ) -> Iterator[Tuple[int, PostingLists, memoryview, memoryview, AbstractSet[int]]]:
+        for i, (postings, deleted) in enumerate(self.parts):
+            doc_ids, tfs = postings.postings(term)
+            if doc_ids:
+                yield i, postings, doc_ids, tfs, deleted
+
+    def postings(self, term: str) -> Tuple[memoryview, memoryview]:
+        live = sorted(
+            (doc_id, tf)
+            for _, _, doc_ids, tfs, deleted in self.segment_postings(term)
+            for doc_id, tf in zip(doc_ids, tfs)
+            if doc_id not in deleted
+        )
+        doc_ids = array("I", [doc_id for doc_id, _ in live])
+        tfs = array("I", [tf for _, tf in live])
+        return memoryview(doc_ids), memoryview(tfs)
+
+    def document_frequency(self, term: str) -> int:
+        frequency = self.frequencies.get(term)
+        if frequency is None:
+            frequency = 0
+            for _, _, doc_ids, _, deleted in self.segment_postings(term):
+                frequency += len(doc_ids)
+                if deleted:
+                    frequency -= sum(1 for doc_id in doc_ids if doc_id in deleted)
+            self.frequencies[term] = frequency
+        return frequency
+
+    def get_tf(self, doc_id: int, term: str) -> int:
+        for _, _, doc_ids, tfs, deleted in self.segment_postings(term):
+            if doc_id in deleted:
+                continue
+            i = bisect_left(doc_ids, doc_id)
+            if i < len(doc_ids) and doc_ids[i] == doc_id:
+                return tfs[i]
+        return 0
+
+    def doc_length(self, doc_id: int) -> int:
+        for postings, deleted in self.parts:
+            if doc_id not in deleted and postings.doc_length(doc_id):
+                return postings.doc_length(doc_id)
+        return 0
+
+    def doc_length_items(self) -> Iterator[Tuple[int, int]]:
+        for postings, deleted in self.parts:
+            for doc_id, doc_length in postings.doc_length_items():
+                if doc_id not in deleted:
+                    yield doc_id, doc_length
+
+
+class SegmentedDocuments(Mapping[int, Dict]):
+    def __init__(self, parts: List[Tuple[StoredDocuments, AbstractSet[int]]]):
+        self.parts = parts
+
+    def locate(self, doc_id: int) -> Optional[int]:
+        # index of the segment holding the live copy of doc_id
+        for i, (documents, deleted) in enumerate(self.parts):
+            if doc_id in documents and doc_id not in deleted:
+                return i
+        return None
+
+    def __getitem__(self, doc_id: int) -> Dict:
+        i = self.locate(doc_id)
+        if i is None:
+            raise KeyError(doc_id)
+        return self.parts[i][0][doc_id]
+
+    def __contains__(self, doc_id) -> bool:
+        return self.locate(doc_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        for documents, deleted in self.parts:
+            for doc_id in documents:
+                if doc_id not in deleted:
+                    yield doc_id
+
+    def __len__(self) -> int:
+        return sum(len(documents) - len(deleted) for documents, deleted in self.parts)
+
+
+def merge_segments(
+    segments: List[Segment], deleted: Mapping[str, AbstractSet[int]]
+) -> PostingLists:
+    # rewrites the live postings of every segment into one, from the stored
+    # term frequencies and positions, so nothing is tokenized again
+    positional = all(segment.postings.positions is not None for segment in segments)
+    builder = PostingListsBuilder(positional)
+    for segment in segments:
+        segment_deleted = deleted.get(segment.name, frozenset())
+        postings = segment.postings
+        partial = {}
+        for term in postings.terms:
+            doc_ids, tfs = postings.postings(term)
+            if positional:
+                offsets = postings.term_position_offsets(term)
+                live = [
+                    (doc_id, tfs[i], bytes(postings.positions[start:end]))
+                    for i, (doc_id, start, end) in enumerate(
+                        zip(doc_ids, offsets, offsets[1:])
+                    )
+                    if doc_id not in segment_deleted
+                ]
+            else:
+                live = [
+                    (doc_id, tf)
+                    for doc_id, tf in zip(doc_ids, tfs)
+                    if doc_id not in segment_deleted
+                ]
+            if live:
+                partial[term] = live
+        docs_length = {
+            doc_id: postings.doc_length(doc_id)
+            for doc_id in segment.documents
+            if doc_id not in segment_deleted
+        }
+        builder.merge(partial, docs_length)
+    return builder.finish()
+
+
+def read_manifest(path: str) -> Dict:
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in {path}")
+    return manifest
+
+
+def write_manifest(
+    path: str,
+    segments: List[str],
+    deleted: Mapping[str, AbstractSet[int]],
+    next_segment: int,
+) -> str:
+    # the manifest is the commit point: segments and tombstones it does not
+    # list are not part of the index. Every commit gets a new build id, which
+    # caches of results from the index are keyed by.
+    build_id = uuid.uuid4().hex
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "build_id": build_id,
+        "segments": [
+            {"name": name, "deleted": sorted(deleted.get(name, ()))}
+            for name in segments
+        ],
+        "next_segment": next_segment,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    return build_id
+
+
+def _padded(size: int) -> int:
+    # keep every section 8-byte aligned so it can be cast in place
+    return (size + 7) & ~7
@@ -1,48 +1,323 @@
+import hashlib
+import json
 import os
-from turtle import Pen
-from typing import Dict, List, Tuple
+import uuid
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 
 from services.processing import load_movies
 
+from .ann import IVFIndex, normalize, top_k
+from .embedding_build import build_embedding_file, encode_batch, init_embedding_worker
+from .embedding_cache import QueryEmbeddingCache, normalize_query
+from .quantization import QuantizedStore
+from .result_cache import ResultCache
+from .tracing import count, span
+from .utils import EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL, IVF_NPROBE, QUANTIZED_RERANK
+
 load_dotenv()
 
 cache_dir = os.environ["CACHE_DIR"]
 
-embedding_store_dir = f"{cache_dir}/movie_embeddings.npy"
+# Every file of a store is named after one prefix: <prefix>.npy, .meta.json,
+# .rows.npz, .ivf.npz and the quantized codes. The movie store uses this one,
+# the passage store (see chunking.py) its own.
+embedding_prefix = f"{cache_dir}/movie_embeddings"
+
+# Stored vectors are L2-normalized float32 so cosine similarity is a plain dot
+# product. Files without this marker predate it and are migrated on load.
+EMBEDDING_FORMAT = "normalized-float32"
+EMBEDDING_FORMAT_VERSION = 2
+
+
+def embedding_text(doc: Dict) -> str:
+    return f"{doc['title']}:{doc['description']}"
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha1(text.encode()).hexdigest().encode()
+
+
+def save_embedding_store(
+    embeddings: np.ndarray, prefix: str = embedding_prefix
+) -> Dict:
+    # replace rather than truncate: the previous file may still be mapped
+    tmp_dir = f"{prefix}.npy.tmp"
+    with open(tmp_dir, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(tmp_dir, f"{prefix}.npy")
+    return write_embedding_meta(embeddings, prefix)
+
+
+def write_embedding_meta(
+    embeddings: np.ndarray, prefix: str = embedding_prefix
+) -> Dict:
+    # derived files (ANN index, quantized codes) record the build id they were
+    # made from, so a rebuild of the store invalidates them
+    meta = {
+        "format": EMBEDDING_FORMAT,
+        "version": EMBEDDING_FORMAT_VERSION,
+        "count": len(embeddings),
+        "dimensions": int(embeddings.shape[1]),
+        "build_id": uuid.uuid4().hex,
+    }
+    with open(f"{prefix}.meta.json", "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_embedding_store(prefix: str = embedding_prefix) -> Tuple[np.ndarray, Dict]:
+    store_dir = f"{prefix}.npy"
+    meta_dir = f"{prefix}.meta.json"
+    meta = {}
+    if os.path.exists(meta_dir):
+        with open(meta_dir, "r") as f:
+            meta = json.load(f)
+
+    if (
+        meta.get("format") != EMBEDDING_FORMAT
+        or meta.get("version") != EMBEDDING_FORMAT_VERSION
+    ):
+        print("Migrating embeddings to normalized float32...")
+        with open(store_dir, "rb") as f:
+            embeddings = np.load(f)
+        meta = save_embedding_store(normalize(embeddings), prefix)
+    elif "build_id" not in meta:
+        meta["build_id"] = uuid.uuid4().hex
+        with open(meta_dir, "w") as f:
+            json.dump(meta, f)
+
+    # mapped read-only so workers on one host share the page cache
+    embeddings = np.load(store_dir, mmap_mode="r")
+    return embeddings, meta
+
+
+# Row i of the store holds the embedding of document row_doc_ids[i], made from
+# text with content hash row_hashes[i]. Rows of deleted documents are -1 until
+# a new document reuses them.
+def save_embedding_rows(
+    row_doc_ids: np.ndarray, row_hashes: np.ndarray, prefix: str = embedding_prefix
+):
+    tmp_dir = f"{prefix}.rows.npz.tmp"
+    with open(tmp_dir, "wb") as f:
+        np.savez(f, doc_ids=row_doc_ids, hashes=row_hashes)
+    os.replace(tmp_dir, f"{prefix}.rows.npz")
+
+
+def load_embedding_rows(
+    prefix: str = embedding_prefix,
+) -> Tuple[np.ndarray, np.ndarray]:
+    with np.load(f"{prefix}.rows.npz") as data:
+        return data["doc_ids"], data["hashes"]
 
 
 class SemanticSearch:
-    def __init__(self):
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(
+        self,
+        quantization: Optional[str] = None,
+        rerank: int = QUANTIZED_RERANK,
+        use_query_cache: bool = True,
+        prefix: str = embedding_prefix,
+        model=None,
+    ):
+        # any object with SentenceTransformer's encode(), e.g. a stub in
+        # benchmarks; the query cache is keyed by EMBEDDING_MODEL, so it
+        # should be off for anything else
+        self.__model = model
+        self.prefix = prefix
+        self.store_dir = f"{prefix}.npy"
+        self.rows_dir = f"{prefix}.rows.npz"
+        self.ann_index_dir = f"{prefix}.ivf.npz"
+        self.query_cache = (
+            QueryEmbeddingCache(EMBEDDING_MODEL) if use_query_cache else None
+        )
         self.embeddings = None
+        self.embeddings_meta = dict()
         self.documents = None
         self.document_map = dict()
+        self.row_doc_ids = None
+        self.free_rows = 0
+        self.__doc_rows: Dict[int, int] = {}
+        self.__doc_rows_source = None
+        self.ann_index = None
+        # "int8" or "pq" to score against quantized codes, reranking the best
+        # `rerank` candidates with the float32 vectors (0 disables the rerank)
+        self.quantization = quantization
+        self.rerank = rerank
+        self.quantized_store = None
+        # search results are cached here when set
+        self.result_cache: Optional[ResultCache] = None
+
+    @property
+    def model(self):
+        # loaded on first encode: importing sentence-transformers pulls in
+        # torch, which commands that only read the store never need
+        if self.__model is None:
+            with span("load_model"):
+                from sentence_transformers import SentenceTransformer
+
+                self.__model = SentenceTransformer(EMBEDDING_MODEL)
+        return self.__model
+
+    def search(
+        self, query: str, limit: int, exact: bool = False, nprobe: int = IVF_NPROBE
+    ):
+        if self.embeddings is None or self.documents is None:
+            raise ValueError(
+                "No embeddings loaded. Call 'load_or_create_embeddings' first."
+            )
 
-    def search(self, query: str, limit: int):
+        with span("semantic_search"):
+            if self.result_cache is None:
+                return self.search_embedding(
+                    self.embed_query(query), limit, exact, nprobe
+                )
+
+            # the query text rather than its tokens: stop words and word order
+            # change the embedding
+            use_ann = self.ann_index is not None and not exact
+            key = self.result_cache.key(
+                self.embeddings_meta["build_id"],
+                [normalize_query(query)],
+                limit,
+                model=EMBEDDING_MODEL,
+                nprobe=nprobe if use_ann else None,
+                ann=self.ann_index.nlist if use_ann else None,
+                quantization=None if use_ann else self.quantization,
+                rerank=self.rerank,
+            )
+            results = self.result_cache.get(key)
+            if results is None:
+                results = self.search_embedding(
+                    self.embed_query(query), limit, exact, nprobe
+                )
+                self.result_cache.put(key, results)
+            return results
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return normalize(self.generate_embedding(query))
+
+    def search_many(
+        self,
+        queries: List[str],
+        limit: int,
+        exact: bool = False,
+        nprobe: int = IVF_NPROBE,
+    ) -> List[List[Dict]]:
         if self.embeddings is None or self.documents is None:
             raise ValueError(
                 "No embeddings loaded. Call 'load_or_create_embeddings' first."
             )
 
-        query_embedding = self.generate_embedding(query)
+        texts = [query.strip() for query in queries]
+        if not all(texts):
+            raise ValueError("text cannot be whitespace or empty")
 
-        dot_products = np.dot(self.embeddings, query_embedding)
-        norms = np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(
-            query_embedding
-        )
-        cos_similarities = dot_products / norms
-        top_indices = np.argsort(cos_similarities)[::-1][:limit]
+        query_embeddings = normalize(self.__encode_queries(texts))
+        use_ann = self.ann_index is not None and not exact
+        if use_ann or self.quantized_store is not None:
+            return [
+                self.search_embedding(query_embedding, limit, exact, nprobe)
+                for query_embedding in query_embeddings
+            ]
+
+        # one matrix-matrix product scores every query against every document
+        with span("matmul"):
+            similarities = query_embeddings @ self.embeddings.T
+        count("docs_scored", similarities.size)
+        all_results = []
+        for cos_similarities in similarities:
+            with span("top_k"):
+                top_indices = top_k(cos_similarities, limit + self.free_rows)
+            all_results.append(
+                self.__results(top_indices, cos_similarities[top_indices], limit)
+            )
+        return all_results
+
+    def search_embedding(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        exact: bool = False,
+        nprobe: int = IVF_NPROBE,
+    ) -> List[Dict]:
+        if self.ann_index is not None and not exact:
+            with span("ann"):
+                top_indices, sorted_values = self.ann_index.search(
+                    query_embedding, limit + self.free_rows, nprobe
+                )
+            return self.__results(top_indices, sorted_values, limit)
+
+        if self.quantized_store is not None:
+            return self.__search_quantized(query_embedding, limit)
+
+        with span("matmul"):
+            cos_similarities = self.embeddings @ query_embedding
+        count("docs_scored", len(cos_similarities))
+        with span("top_k"):
+            top_indices = top_k(cos_similarities, limit + self.free_rows)
 
         sorted_values = cos_similarities[top_indices]
+        return self.__results(top_indices, sorted_values, limit)
+
+    def score_documents(
+        self, query_embedding: np.ndarray, doc_ids: List[int]
+    ) -> Dict[int, float]:
+        # exact cosine similarity for the given documents only, without
+        # touching the rest of the store
+        if self.row_doc_ids is not self.__doc_rows_source:
+            self.__doc_rows = {
+                doc_id: row
+                for row, doc_id in enumerate(self.row_doc_ids.tolist())
+                if doc_id >= 0
+            }
+            self.__doc_rows_source = self.row_doc_ids
+
+        doc_ids = [doc_id for doc_id in doc_ids if doc_id in self.__doc_rows]
+        if not doc_ids:
+            return {}
+
+        rows = np.array([self.__doc_rows[doc_id] for doc_id in doc_ids])
+        order = np.argsort(rows)
+        scores = np.empty(len(rows), dtype=np.float32)
+        # sorted rows keep the reads from the mapped store sequential
+        scores[order] = self.embeddings[rows[order]] @ query_embedding
+        return dict(zip(doc_ids, scores.tolist()))
+
+    def __search_quantized(self, query_embedding: np.ndarray, limit: int) -> List[Dict]:
+        with span("quantized_scores"):
+            approx_similarities = self.quantized_store.scores(query_embedding)
+        count("docs_scored", len(approx_similarities))
+        fetch = limit + self.free_rows
+        if not self.rerank:
+            with span("top_k"):
+                top_indices = top_k(approx_similarities, fetch)
+            return self.__results(top_indices, approx_similarities[top_indices], limit)
+
+        # sorted rows keep the reads from the mapped float32 store sequential
+        with span("top_k"):
+            candidates = np.sort(top_k(approx_similarities, max(fetch, self.rerank)))
+        with span("rescore"):
+            cos_similarities = self.embeddings[candidates] @ query_embedding
+        best = top_k(cos_similarities, fetch)
+        return self.__results(candidates[best], cos_similarities[best], limit)
+
+    def __results(self, top_indices, sorted_values, limit: int) -> List[Dict]:
         top_results = []
         for idx, score in zip(top_indices, sorted_values):
-            doc = self.documents[idx]
+            doc_id = int(self.row_doc_ids[idx])
+            if doc_id < 0:
+                continue
+
+            if len(top_results) == limit:
+                break
+
+            doc = self.document_map[doc_id]
             top_results.append(
                 {
+                    "id": doc_id,
                     "score": float(score),
                     "title": doc["title"],
                     "description": doc["description"],
@@ -55,8 +330,28 @@ class SemanticSearch:
         if not text:
             raise ValueError("text cannot be whitespace or empty")
 
-        embeddings = self.model.encode([text])
-        return embeddings[0]
+        with span("generate_embedding"):
+            return self.__encode_queries([text])[0]
+
+    def __encode_queries(self, texts: List[str]) -> np.ndarray:
+        if self.query_cache is None:
+            with span("encode"):
+                return self.model.encode(texts)
+
+        cached = [self.query_cache.get(text) for text in texts]
+        misses = [i for i, embedding in enumerate(cached) if embedding is None]
+        if misses:
+            # every miss goes through the model in one batch
+            with span("encode"):
+                encoded = self.model.encode([texts[i] for i in misses])
+            for i, embedding in zip(misses, encoded):
+                self.query_cache.put(texts[i], embedding)
+                cached[i] = embedding
+        return np.array(cached)
+
+    def __encode_documents(self, texts: List[str]) -> np.ndarray:
+        # the batches come sorted by length, so they are encoded as they are
+        return self.model.encode(texts, batch_size=len(texts))
 
     def load_or_create_embeddings(self, documents: List[Dict]):
         self.documents = documents
@@ -64,36 +359,188 @@ class SemanticSearch:
         for doc in self.documents:
             self.document_map[doc["id"]] = doc
 
-        if os.path.exists(embedding_store_dir):
-            with open(embedding_store_dir, "rb") as f:
-                self.embeddings = np.load(f)
+        if not os.path.exists(self.store_dir):
+            return self.build_embeddings(documents)
 
-            if len(self.embeddings) == len(self.documents):
-                return self.embeddings
-            else:
-                return self.build_embeddings(documents)
+        with span("load_embeddings"):
+            self.embeddings, self.embeddings_meta = load_embedding_store(self.prefix)
+        if os.path.exists(self.rows_dir):
+            row_doc_ids, row_hashes = load_embedding_rows(self.prefix)
+        elif len(self.embeddings) == len(self.documents):
+            # store from before the rows sidecar: rows follow document order
+            row_doc_ids = np.array([doc["id"] for doc in documents], dtype=np.int64)
+            row_hashes = np.array(
+                [content_hash(embedding_text(doc)) for doc in documents], dtype="S40"
+            )
+            save_embedding_rows(row_doc_ids, row_hashes, self.prefix)
         else:
             return self.build_embeddings(documents)
 
-    def build_embeddings(self, documents: List[Dict]):
+        if len(row_doc_ids) != len(self.embeddings):
+            return self.build_embeddings(documents)
+
+        self.__update_embeddings(row_doc_ids, row_hashes)
+        self.load_or_create_quantized_store()
+        return self.embeddings
+
+    def __update_embeddings(self, row_doc_ids: np.ndarray, row_hashes: np.ndarray):
+        texts = {doc["id"]: embedding_text(doc) for doc in self.documents}
+        hashes = {doc_id: content_hash(text) for doc_id, text in texts.items()}
+
+        doc_rows = {}
+        free_rows = []
+        deleted_rows = []
+        for row, doc_id in enumerate(row_doc_ids.tolist()):
+            if doc_id in hashes:
+                doc_rows[doc_id] = row
+            else:
+                free_rows.append(row)
+                if doc_id >= 0:
+                    deleted_rows.append(row)
+
+        changed = [
+            doc_id
+            for doc_id, row in doc_rows.items()
+            if row_hashes[row] != hashes[doc_id]
+        ]
+        added = [doc_id for doc_id in hashes if doc_id not in doc_rows]
+
+        if changed or added or deleted_rows:
+            print(
+                f"Updating embeddings: {len(added)} new, {len(changed)} changed, "
+                f"{len(deleted_rows)} deleted"
+            )
+
+        to_encode = changed + added
+        rows = [doc_rows[doc_id] for doc_id in changed]
+        free_rows.reverse()
+        n_appended = 0
+        for _ in added:
+            if free_rows:
+                rows.append(free_rows.pop())
+            else:
+                rows.append(len(row_doc_ids) + n_appended)
+                n_appended += 1
+
+        self.row_doc_ids = row_doc_ids
+        self.free_rows = len(free_rows)
+        if not (to_encode or deleted_rows):
+            return
+
+        vectors = np.zeros((0, self.embeddings.shape[1]), dtype=np.float32)
+        if to_encode:
+            vectors = normalize(self.model.encode([texts[d] for d in to_encode]))
+
+        row_doc_ids = np.concatenate(
+            [row_doc_ids, np.full(n_appended, -1, dtype=np.int64)]
+        )
+        row_hashes = np.concatenate([row_hashes, np.zeros(n_appended, dtype="S40")])
+        row_doc_ids[deleted_rows] = -1
+        row_hashes[deleted_rows] = b""
+        row_doc_ids[rows] = to_encode
+        row_hashes[rows] = [hashes[doc_id] for doc_id in to_encode]
+
+        # a new store replaces the old one rather than writing the changed rows
+        # in place: other processes may have the file mapped
+        embeddings = np.zeros((len(row_doc_ids), vectors.shape[1]), np.float32)
+        embeddings[: len(self.embeddings)] = self.embeddings
+        # deleted rows first: added documents may reuse them
+        embeddings[deleted_rows] = 0
+        embeddings[rows] = vectors
+        self.embeddings_meta = save_embedding_store(embeddings, self.prefix)
+
+        save_embedding_rows(row_doc_ids, row_hashes, self.prefix)
+        self.embeddings = np.load(self.store_dir, mmap_mode="r")
+        self.row_doc_ids = row_doc_ids
+        self.ann_index = None
+
+    def build_embeddings(
+        self,
+        documents: List[Dict],
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        workers: int = 1,
+    ):
         self.documents = documents
         strs_to_embed = []
         for doc in self.documents:
             self.document_map[doc["id"]] = doc
-            str_to_embed = f"{doc['title']}:{doc['description']}"
-            strs_to_embed.append(str_to_embed)
+            strs_to_embed.append(embedding_text(doc))
 
         print("Generating embeddings...")
-        embeddings = self.model.encode(strs_to_embed, show_progress_bar=True)
-        self.embeddings = embeddings
-
-        print("Saving embeddings...")
-        with open(embedding_store_dir, "wb") as f:
-            np.save(f, self.embeddings)
+        if workers <= 1:
+            encode, initializer, initargs = self.__encode_documents, None, ()
+        else:
+            # every worker loads its own copy of the model
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            encode, initializer = encode_batch, init_embedding_worker
+            initargs = (EMBEDDING_MODEL, threads)
+        stats = build_embedding_file(
+            strs_to_embed,
+            self.store_dir,
+            encode,
+            EMBEDDING_MODEL,
+            batch_size,
+            workers,
+            initializer,
+            initargs,
+        )
+        print(
+            f"Embedded {stats['encoded']} documents in {stats['seconds']:.2f}s "
+            f"({stats['docs_per_sec']:.0f} docs/s)"
+        )
+        self.embeddings = np.load(self.store_dir, mmap_mode="r")
+        self.ann_index = None
+
+        self.embeddings_meta = write_embedding_meta(self.embeddings, self.prefix)
+        self.row_doc_ids = np.array([doc["id"] for doc in documents], dtype=np.int64)
+        self.free_rows = 0
+        save_embedding_rows(
+            self.row_doc_ids,
+            np.array([content_hash(text) for text in strs_to_embed], dtype="S40"),
+            self.prefix,
+        )
+        self.load_or_create_quantized_store()
 
-        print(f"Embeddings stored at {embedding_store_dir}")
+        print(f"Embeddings stored at {self.store_dir}")
         return self.embeddings
 
+    def load_or_create_ann_index(self, nlist: Optional[int] = None) -> IVFIndex:
+        if self.embeddings is None:
+            raise ValueError(
+                "No embeddings loaded. Call 'load_or_create_embeddings' first."
+            )
+
+        if os.path.exists(self.ann_index_dir):
+            ann_index = IVFIndex.load(self.ann_index_dir)
+            build_id = self.embeddings_meta.get("build_id")
+            stale = ann_index.source_fingerprint != build_id
+            if not stale and (nlist is None or ann_index.nlist == nlist):
+                self.ann_index = ann_index
+                return self.ann_index
+
+        print("Building ANN index...")
+        self.ann_index = IVFIndex.build(
+            self.embeddings, nlist, source_fingerprint=self.embeddings_meta["build_id"]
+        )
+        self.ann_index.save(self.ann_index_dir)
+        print(f"ANN index stored at {self.ann_index_dir}")
+        return self.ann_index
+
+    def load_or_create_quantized_store(self) -> Optional[QuantizedStore]:
+        self.quantized_store = None
+        if self.quantization is None:
+            return None
+
+        build_id = self.embeddings_meta["build_id"]
+        store = QuantizedStore.load(self.quantization, self.prefix)
+        if store is None or store.source_build_id != build_id:
+            print(f"Quantizing embeddings ({self.quantization})...")
+            store = QuantizedStore.build(self.quantization, self.embeddings, build_id)
+            store.save(self.prefix)
+
+        self.quantized_store = store
+        return self.quantized_store
+
 
 def verify_model():
     ss = SemanticSearch()
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from services import tracing
+from services.indexing import InvertedIndex
+from services.processing import load_movies
+from services.result_cache import ResultCache, result_cache_dir
+
+from .utils import HYBRID_ALPHA, RRF_K, SERVER_HOST, SERVER_MAX_LIMIT, SERVER_PORT
+
+ENDPOINTS = {"/bm25": "bm25", "/semantic": "semantic", "/hybrid": "hybrid"}
+
+# Engines of the current process. With a thread pool they are loaded once in
+# the server process; with a process pool every worker loads its own copy.
+_engines: Dict[str, object] = {}
+
+
+def load_engines(
+    semantic: bool = True,
+    ann: bool = False,
+    workers: int = 1,
+    result_cache: bool = True,
+):
+    index = InvertedIndex()
+    index.load()
+    if result_cache:
+        # on disk, so worker processes share what any of them computed
+        index.result_cache = ResultCache("bm25", result_cache_dir)
+    _engines["index"] = index
+
+    if semantic:
+        from services.hybrid import HybridSearch
+        from services.semantic_search import SemanticSearch
+
+        ss = SemanticSearch()
+        ss.load_or_create_embeddings(load_movies())
+        if ann:
+            ss.load_or_create_ann_index()
+        if result_cache:
+            ss.result_cache = ResultCache("semantic", result_cache_dir)
+        # load the model now rather than on the first request
+        ss.model
+        _engines["semantic"] = ss
+        _engines["hybrid"] = HybridSearch(index, ss, workers=workers)
+
+
+def bm25_results(query: str, limit: int) -> List[Dict]:
+    index: InvertedIndex = _engines["index"]
+    results = []
+    for doc_id, score in index.bm25_search(query, limit).items():
+        results.append(
+            {"id": doc_id, "score": score, "title": index.docmap[doc_id]["title"]}
+        )
+    return results
+
+
+def semantic_results(query: str, limit: int) -> List[Dict]:
+    if "semantic" not in _engines:
+        raise LookupError("semantic search is not enabled on this server")
+
+    results = _engines["semantic"].search(query, limit)
+    return [
+        {"id": result["id"], "score": result["score"], "title": result["title"]}
+        for result in results
+    ]
+
+
+def hybrid_results(
+    query: str,
+    limit: int,
+    mode: str = "rrf",
+    alpha: float = HYBRID_ALPHA,
+    k: int = RRF_K,
+    restrict: bool = False,
+) -> List[Dict]:
+    if "hybrid" not in _engines:
+        raise LookupError("semantic search is not enabled on this server")
+
+    results = _engines["hybrid"].search(query, limit, mode, alpha, k, restrict)
+    return [
+        {
+            "id": result["id"],
+            "score": result["score"],
+            "title": result["title"],
+            "bm25_rank": result["bm25_rank"],
+            "semantic_rank": result["semantic_rank"],
+        }
+        for result in results
+    ]
+
+
+def run_query(endpoint: str, query: str, limit: int, options: Tuple = ()) -> List[Dict]:
+    # with tracing on, every query writes its own breakdown
+    with tracing.trace(endpoint, query=query, limit=limit) as current:
+        results = endpoint_results(endpoint, query, limit, options)
+    if current is not None:
+        tracing.write_trace(current, tracing.profile_output())
+    return results
+
+
+def endpoint_results(
+    endpoint: str, query: str, limit: int, options: Tuple = ()
+) -> List[Dict]:
+    match endpoint:
+        case "bm25":
+            return bm25_results(query, limit)
+        case "semantic":
+            return semantic_results(query, limit)
+        case "hybrid":
+            return hybrid_results(query, limit, **dict(options))
+    raise LookupError(f"Unknown endpoint: {endpoint}")
+
+
+def hybrid_options(params: Dict) -> Tuple:
+    options = []
+    if "mode" in params:
+        options.append(("mode", str(params["mode"])))
+    if "alpha" in params:
+        options.append(("alpha", float(params["alpha"])))
+    if "k" in params:
+        options.append(("k", int(params["k"])))
+    if "restrict" in params:
+        options.append(("restrict", str(params["restrict"]).lower() in TRUE_VALUES))
+    return tuple(options)
+
+
+TRUE_VALUES = {"1", "true", "yes"}
+
+
+class SearchServer:
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        # identical queries in flight share one computation
+        self.in_flight: Dict[Tuple[str, str, int, Tuple], asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def search(
+        self, endpoint: str, query: str, limit: int, options: Tuple = ()
+    ) -> List[Dict]:
+        key = (endpoint, query, limit, options)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor, run_query, endpoint, query, limit, options
+        )
+        self.in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, Dict]:
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        if method == "POST" and body:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                return 400, {"error": "body must be a JSON object"}
+            params.update(payload)
+
+        if url.path == "/health":
+            return 200, {"status": "ok", "coalesced": self.coalesced}
+
+        endpoint = ENDPOINTS.get(url.path)
+        if endpoint is None:
+            return 404, {"error": f"Unknown path: {url.path}"}
+
+        query = str(params.get("q", params.get("query", ""))).strip()
+        if not query:
+            return 400, {"error": "missing query parameter 'q'"}
+
+        try:
+            limit = int(params.get("limit", 5))
+            if limit < 1:
+                return 400, {"error": "limit must be at least 1"}
+            # a larger limit would only sort and serialize most of the corpus
+            limit = min(limit, SERVER_MAX_LIMIT)
+            options = hybrid_options(params) if endpoint == "hybrid" else ()
+        except (TypeError, ValueError):
+            return 400, {"error": "limit, alpha and k must be numbers"}
+
+        try:
+            results = await self.search(endpoint, query, limit, options)
+        except KeyError:
+            # a bug rather than an engine that is not enabled: a 500
+            raise
+        except LookupError as e:
+            return 503, {"error": str(e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        return 200, {"query": query, "results": results}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                keep_alive = False
+                try:
+                    method, target, version = request_line.decode().split()
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, value = line.decode().split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get("content-length", 0))
+                    body = await reader.readexactly(length)
+                except ValueError:
+                    # the rest of the stream cannot be trusted, so close it
+                    status, payload = 400, {"error": "malformed HTTP request"}
+                else:
+                    keep_alive = (
+                        version == "HTTP/1.1"
+                        and headers.get("connection", "").lower() != "close"
+                    )
+                    try:
+                        status, payload = await self.dispatch(method, target, body)
+                    except Exception:
+                        traceback.print_exc()
+                        status, payload = 500, {"error": "internal server error"}
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    "\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+def make_executor(
+    executor: str, workers: int, semantic: bool, ann: bool, result_cache: bool = True
+) -> Executor:
+    if executor == "process":
+        return ProcessPoolExecutor(
+            workers,
+            initializer=load_engines,
+            initargs=(semantic, ann, 1, result_cache),
+        )
+
+    load_engines(semantic, ann, workers, result_cache)
+    return ThreadPoolExecutor(workers)
+
+
+async def serve_forever(
+    host: str, port: int, executor: Executor, ready: Optional[asyncio.Event] = None
+):
+    server = SearchServer(executor)
+    async with await asyncio.start_server(server.handle, host, port) as tcp_server:
+        print(f"Serving on http://{host}:{port} (/bm25, /semantic, /hybrid)")
+        if ready is not None:
+            ready.set()
+        await tcp_server.serve_forever()
+
+
+def serve(
+    host: str = SERVER_HOST,
+    port: int = SERVER_PORT,
+    workers: int = 4,
+    executor: str = "thread",
+    semantic: bool = True,
+    ann: bool = False,
+    result_cache: bool = True,
+):
+    print("Loading engines...")
+    pool = make_executor(executor, workers, semantic, ann, result_cache)
+    try:
+        asyncio.run(serve_forever(host, port, pool))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown(cancel_futures=True)
@@ -0,0 +1,241 @@
+import json
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from services.processing import Tokenizer, get_tokenizer, iter_documents
+
+from .bm25 import BM25Scorer, bm25_idf
+from .indexing import InvertedIndex
+from .utils import BUILD_BATCH_SIZE
+
+load_dotenv()
+
+cache_dir = os.environ["CACHE_DIR"]
+shards_dir = f"{cache_dir}/shards"
+
+SHARDS_FORMAT_VERSION = 1
+
+# per-process state of a shard worker: the tokenizer for builds and the
+# shards opened so far, kept open across queries
+_worker_tokenizer: Optional[Tokenizer] = None
+_worker_shards: Dict[str, InvertedIndex] = {}
+# one scorer per shard and global statistics, so the score bounds a shard
+# computes against the collection's avgdl are reused by later queries
+_worker_scorers: Dict[Tuple[str, int, float], BM25Scorer] = {}
+
+
+def shard_of(doc_id: int, n_shards: int) -> int:
+    return doc_id % n_shards
+
+
+def shard_path(directory: str, shard: int) -> str:
+    return f"{directory}/shard_{shard:03d}"
+
+
+def init_shard_worker(stop_words: Iterable[str]):
+    global _worker_tokenizer
+    _worker_tokenizer = Tokenizer(stop_words=stop_words)
+    _worker_shards.clear()
+    _worker_scorers.clear()
+
+
+def open_shard(path: str) -> InvertedIndex:
+    index = _worker_shards.get(path)
+    if index is None:
+        index = InvertedIndex(tokenizer=_worker_tokenizer, directory=path)
+        index.load_segment()
+        _worker_shards[path] = index
+    return index
+
+
+def build_shard(
+    path: str,
+    shard: int,
+    n_shards: int,
+    documents: Optional[List[Dict]] = None,
+    batch_size: int = BUILD_BATCH_SIZE,
+) -> int:
+    # without documents, every shard streams the corpus and keeps its own ids
+    if documents is None:
+        documents = (
+            doc for doc in iter_documents() if shard_of(doc["id"], n_shards) == shard
+        )
+
+    index = InvertedIndex(tokenizer=_worker_tokenizer, directory=path)
+    n_docs = index.build_streaming(documents, batch_size=batch_size)
+    index.save()
+    return n_docs
+
+
+def shard_stats(path: str) -> Tuple[int, int]:
+    postings = open_shard(path).postings
+    return postings.n_docs, postings.total_doc_length
+
+
+def shard_document_frequencies(path: str, terms: List[str]) -> List[int]:
+    postings = open_shard(path).postings
+    return [postings.document_frequency(term) for term in terms]
+
+
+def shard_search(
+    path: str,
+    tokens: List[str],
+    limit: int,
+    n_docs: int,
+    avg_doc_length: float,
+    idf: Dict[str, float],
+) -> List[Tuple[int, float]]:
+    key = (path, n_docs, avg_doc_length)
+    scorer = _worker_scorers.get(key)
+    if scorer is None:
+        scorer = BM25Scorer(
+            open_shard(path).postings, n_docs, avg_doc_length=avg_doc_length
+        )
+        _worker_scorers[key] = scorer
+    # global idf from the coordinator, so the shard never uses its local df
+    scorer.idf.update(idf)
+    return list(scorer.score(tokens, limit).items())
+
+
+class ShardedIndex:
+    # Documents partitioned by id over n_shards saved indexes, queried by
+    # scatter-gather over a process pool. BM25 statistics are exchanged in two
+    # phases: N and total length once on load, df of the query terms per
+    # query. Every shard then scores with the collection's N, avgdl and idf,
+    # so the merged top-k matches the unsharded index.
+    def __init__(
+        self,
+        directory: str = shards_dir,
+        workers: Optional[int] = None,
+        tokenizer: Optional[Tokenizer] = None,
+    ):
+        self.directory = directory
+        self.manifest_dir = f"{directory}/shards.json"
+        self.workers = workers
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.n_shards = 0
+        self.n_docs = 0
+        self.avg_doc_length = 0.0
+        self.idf: Dict[str, float] = {}
+        self.executor: Optional[Executor] = None
+        self.documents: Dict[int, InvertedIndex] = {}
+
+    @property
+    def shard_paths(self) -> List[str]:
+        return [shard_path(self.directory, i) for i in range(self.n_shards)]
+
+    def __start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                self.workers or self.n_shards,
+                initializer=init_shard_worker,
+                initargs=(self.tokenizer.stop_words,),
+            )
+
+    def build(
+        self,
+        n_shards: int,
+        documents: Optional[Iterable[Dict]] = None,
+        batch_size: int = BUILD_BATCH_SIZE,
+    ) -> int:
+        if n_shards < 1:
+            raise ValueError("n_shards must be at least 1")
+
+        partitions: List[Optional[List[Dict]]] = [None] * n_shards
+        if documents is not None:
+            partitions = [[] for _ in range(n_shards)]
+            for doc in documents:
+                partitions[shard_of(doc["id"], n_shards)].append(doc)
+
+        self.close()
+        self.n_shards = n_shards
+        self.__start()
+        futures = [
+            self.executor.submit(
+                build_shard, path, i, n_shards, partitions[i], batch_size
+            )
+            for i, path in enumerate(self.shard_paths)
+        ]
+        n_docs = sum(future.result() for future in futures)
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.manifest_dir, "w") as f:
+            json.dump({"version": SHARDS_FORMAT_VERSION, "n_shards": n_shards}, f)
+
+        self.load()
+        return n_docs
+
+    def load(self):
+        if not os.path.exists(self.manifest_dir):
+            raise FileNotFoundError(f"Could not find {self.manifest_dir}")
+
+        with open(self.manifest_dir, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != SHARDS_FORMAT_VERSION:
+            raise ValueError(f"Unsupported shards version in {self.manifest_dir}")
+
+        if manifest["n_shards"] != self.n_shards:
+            self.close()
+        self.n_shards = manifest["n_shards"]
+        self.__start()
+
+        stats = list(self.executor.map(shard_stats, self.shard_paths))
+        self.n_docs = sum(n_docs for n_docs, _ in stats)
+        total_doc_length = sum(total for _, total in stats)
+        self.avg_doc_length = total_doc_length / self.n_docs if self.n_docs else 0.0
+        self.idf = {}
+        self.documents = {}
+
+    def term_idf(self, terms: List[str]) -> Dict[str, float]:
+        missing = sorted({term for term in terms if term not in self.idf})
+        if missing:
+            per_shard = self.executor.map(
+                shard_document_frequencies,
+                self.shard_paths,
+                [missing] * self.n_shards,
+            )
+            frequencies = [sum(counts) for counts in zip(*per_shard)]
+            for term, frequency in zip(missing, frequencies):
+                self.idf[term] = bm25_idf(self.n_docs, frequency)
+        return {term: self.idf[term] for term in terms}
+
+    def bm25_search(self, query: str, limit: int) -> Dict[int, float]:
+        if self.executor is None:
+            raise ValueError("No shards loaded. Call 'load' or 'build' first.")
+
+        tokens = self.tokenizer.tokenize(query)
+        idf = self.term_idf(tokens)
+        futures = [
+            self.executor.submit(
+                shard_search,
+                path,
+                tokens,
+                limit,
+                self.n_docs,
+                self.avg_doc_length,
+                idf,
+            )
+            for path in self.shard_paths
+        ]
+        # each shard returns its own top-k, so the global top-k is among them
+        candidates = {doc_id: score for f in futures for doc_id, score in f.result()}
+        return dict(BM25Scorer.top_k(candidates, limit))
+
+    def document(self, doc_id: int) -> Dict:
+        shard = shard_of(doc_id, self.n_shards)
+        index = self.documents.get(shard)
+        if index is None:
+            index = InvertedIndex(
+                tokenizer=self.tokenizer, directory=self.shard_paths[shard]
+            )
+            index.load_segment()
+            self.documents[shard] = index
+        return index.docmap[doc_id]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,222 @@
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# SEARCH_PROFILE=1 traces every command and server query, and is inherited by
+# worker processes. SEARCH_PROFILE_OUTPUT is where traces go (see write_trace).
+PROFILE_ENV = "SEARCH_PROFILE"
+PROFILE_OUTPUT_ENV = "SEARCH_PROFILE_OUTPUT"
+
+_enabled = os.environ.get(PROFILE_ENV, "") not in ("", "0")
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+# the open spans of this context, outermost first
+_path: ContextVar[Tuple[str, ...]] = ContextVar("trace_path", default=())
+
+
+class Trace:
+    # Wall time per span path and counters for one query or command. Paths
+    # follow the context, so a thread running in a copy of the trace's
+    # context (contextvars.copy_context) nests its spans under the span that
+    # submitted it.
+    def __init__(
+        self,
+        name: str,
+        clock: Callable[[], float] = time.perf_counter,
+        **attributes,
+    ):
+        self.name = name
+        self.clock = clock
+        self.attributes = attributes
+        self.start = clock()
+        self.end: Optional[float] = None
+        # path -> [calls, seconds]
+        self.spans: Dict[Tuple[str, ...], List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add(self, path: Tuple[str, ...], seconds: float):
+        with self.lock:
+            entry = self.spans.get(path)
+            if entry is None:
+                entry = self.spans[path] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        if self.end is None:
+            self.end = self.clock()
+
+    @property
+    def total(self) -> float:
+        return (self.end if self.end is not None else self.clock()) - self.start
+
+    def self_time(self, path: Tuple[str, ...]) -> float:
+        # time in the span itself rather than in its children; children run
+        # in parallel threads can add up to more than their parent
+        seconds = self.spans[path][1] if path else self.total
+        for child, (_, child_seconds) in self.spans.items():
+            if len(child) == len(path) + 1 and child[: len(path)] == path:
+                seconds -= child_seconds
+        return max(seconds, 0.0)
+
+    def to_dict(self) -> Dict:
+        spans = [
+            {
+                "name": "/".join(path),
+                "calls": calls,
+                "ms": 1000 * seconds,
+                "self_ms": 1000 * self.self_time(path),
+            }
+            for path, (calls, seconds) in sorted(self.spans.items())
+        ]
+        trace = {"name": self.name, "total_ms": 1000 * self.total}
+        trace.update(self.attributes)
+        trace["spans"] = spans
+        trace["counters"] = dict(sorted(self.counters.items()))
+        return trace
+
+    def folded(self) -> List[str]:
+        # collapsed stacks ("trace;span;child <microseconds>" of self time),
+        # the input of flamegraph.pl, inferno and speedscope
+        lines = []
+        for path in [()] + sorted(self.spans):
+            micros = round(1_000_000 * self.self_time(path))
+            if micros:
+                lines.append(f"{';'.join((self.name,) + path)} {micros}")
+        return lines
+
+
+class Span:
+    __slots__ = ("name", "start", "token", "trace")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.token = _path.set(_path.get() + (self.name,))
+        self.start = self.trace.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = self.trace.clock() - self.start
+        path = _path.get()
+        _path.reset(self.token)
+        self.trace.add(path, seconds)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+def span(name: str):
+    # outside a trace this is one context variable lookup and a shared no-op
+    current = _current.get()
+    if current is None:
+        return _null_span
+    return Span(current, name)
+
+
+def count(name: str, n: int = 1):
+    current = _current.get()
+    if current is not None:
+        current.count(name, n)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(flag: bool = True):
+    global _enabled
+    _enabled = flag
+    # worker processes started from here trace too
+    os.environ[PROFILE_ENV] = "1" if flag else "0"
+
+
+def profile_output() -> Optional[str]:
+    return os.environ.get(PROFILE_OUTPUT_ENV) or None
+
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Optional[Trace]]:
+    # a new trace for the block when tracing is enabled, else None
+    if not _enabled:
+        yield None
+        return
+
+    current = Trace(name, **attributes)
+    token = _current.set(current)
+    path_token = _path.set(())
+    try:
+        yield current
+    finally:
+        _path.reset(path_token)
+        _current.reset(token)
+        current.finish()
+
+
+def write_trace(current: Trace, output: Optional[str] = None):
+    # no output: indented JSON on stderr. "*.folded": collapsed stacks
+    # appended for a flamegraph. Anything else: one JSON line per trace
+    # appended, so a server logs a breakdown per query.
+    if output is None:
+        print(json.dumps(current.to_dict(), indent=2), file=sys.stderr)
+        return
+
+    with open(output, "a") as f:
+        if output.endswith(".folded"):
+            f.writelines(f"{line}\n" for line in current.folded())
+        else:
+            f.write(json.dumps(current.to_dict()) + "\n")
+
+
+def profile_command(name: str, profile: bool = False, output: Optional[str] = None):
+    # Traces the rest of the process as one command and writes the trace at
+    # exit, exit() included. A "*.prof" output gets cProfile statistics of
+    # the whole run instead (python -m pstats, snakeviz), with the span
+    # breakdown on stderr.
+    if profile or output:
+        enable()
+    if not _enabled:
+        return
+
+    output = output or profile_output()
+    current = Trace(name)
+    _current.set(current)
+    profiler = None
+    if output is not None and output.endswith(".prof"):
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish():
+        current.finish()
+        if profiler is None:
+            write_trace(current, output)
+            return
+
+        profiler.disable()
+        profiler.dump_stats(output)
+        write_trace(current)
+
+    atexit.register(finish)
@@ -1,2 +1,37 @@
 BM25_K1 = 1.5
 BM25_B = 0.75
+STEM_CACHE_SIZE = 65536
+IVF_NPROBE = 8
+IVF_KMEANS_ITERATIONS = 20
+PQ_SUBSPACES = 48
+PQ_CENTROIDS = 256
+QUANTIZED_RERANK = 100
+QUERY_CACHE_MEMORY_SIZE = 1024
+QUERY_CACHE_DISK_SIZE = 100_000
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64
+RRF_K = 60
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_MAX_LIMIT = 100
+HYBRID_ALPHA = 0.5
+HYBRID_CANDIDATE_MULTIPLIER = 10
+BUILD_BATCH_SIZE = 1000
+SEGMENT_MERGE_THRESHOLD = 10
+POSTINGS_CODECS = ("raw", "varint", "bitpack")
+POSTINGS_CODEC = "raw"
+POSTINGS_BLOCK_SIZE = 128
+CHUNK_SIZE = 128
+CHUNK_OVERLAP = 32
+PASSAGE_POOLINGS = ("max", "sum")
+PASSAGE_POOLING = "max"
+PASSAGE_CANDIDATE_MULTIPLIER = 5
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 50
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_MS = 250
+RERANK_CACHE_SIZE = 10_000
+RERANK_CACHE_DISK_SIZE = 1_000_000
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_DISK_SIZE = 100_000
+RESULT_CACHE_TTL = 600
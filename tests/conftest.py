@@ -0,0 +1,85 @@
+import random
+from typing import Callable, Dict, List
+
+import numpy as np
+import pytest
+
+from services.ann import normalize
+from services.indexing import InvertedIndex
+from services.processing import Tokenizer
+
+STOP_WORDS = ["the", "a", "of", "and", "in"]
+VOCABULARY = (
+    "the a of and in space alien robot detective murder king queen dragon "
+    "magic love story war ship ocean island ghost house train heist city"
+).split()
+QUERIES = [
+    "alien robot",
+    "detective murder in the city",
+    "love love story",
+    "dragon magic king queen",
+    "ghost",
+    "unknownterm",
+    "the",
+]
+
+
+def generate_movies(n_docs: int, seed: int = 7) -> List[Dict]:
+    rng = random.Random(seed)
+    movies = []
+    for doc_id in range(1, n_docs + 1):
+        words = rng.choices(VOCABULARY, k=rng.randint(3, 60))
+        movies.append(
+            {
+                "id": doc_id,
+                "title": " ".join(words[:2]).title(),
+                "description": " ".join(words[2:]),
+            }
+        )
+    return movies
+
+
+def generate_embeddings(n_rows: int, dimensions: int = 96, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # clustered, like real embeddings, so the top hits are well separated
+    centers = rng.standard_normal((20, dimensions))
+    rows = centers[rng.integers(0, 20, n_rows)] + 0.3 * rng.standard_normal(
+        (n_rows, dimensions)
+    )
+    return normalize(rows.astype(np.float32))
+
+
+@pytest.fixture
+def stop_words() -> List[str]:
+    return list(STOP_WORDS)
+
+
+@pytest.fixture
+def queries() -> List[str]:
+    return list(QUERIES)
+
+
+@pytest.fixture
+def tokenizer() -> Tokenizer:
+    return Tokenizer(stop_words=STOP_WORDS)
+
+
+@pytest.fixture
+def make_movies() -> Callable[..., List[Dict]]:
+    return generate_movies
+
+
+@pytest.fixture
+def make_embeddings() -> Callable[..., np.ndarray]:
+    return generate_embeddings
+
+
+@pytest.fixture
+def make_index(tokenizer: Tokenizer) -> Callable[..., InvertedIndex]:
+    # an in-memory index of generate_movies(n_docs)
+    def make(n_docs: int = 300) -> InvertedIndex:
+        index = InvertedIndex(tokenizer=tokenizer)
+        index.build(generate_movies(n_docs))
+        return index
+
+    return make
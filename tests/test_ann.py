@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from services.ann import IVFIndex, top_k
+
+
+def test_top_k_matches_a_full_sort():
+    scores = np.random.default_rng(0).standard_normal(1000)
+    for k in (1, 10, 999, 1000, 2000):
+        assert top_k(scores, k).tolist() == np.argsort(-scores)[:k].tolist()
+
+
+def test_ivf_recall_and_exhaustive_probe(make_embeddings):
+    embeddings = make_embeddings(3000)
+    queries = make_embeddings(30, seed=1)
+    index = IVFIndex.build(embeddings, nlist=40)
+    assert index.nlist == 40
+    assert sorted(index.list_rows.tolist()) == list(range(3000))
+
+    recalls = []
+    for query in queries:
+        exact = top_k(embeddings @ query, 10)
+        rows, scores = index.search(query, 10, nprobe=8)
+        recalls.append(len(set(rows.tolist()) & set(exact.tolist())) / 10)
+
+        # probing every list is the exact search
+        rows, scores = index.search(query, 10, nprobe=index.nlist)
+        assert rows.tolist() == exact.tolist()
+        assert np.allclose(scores, (embeddings @ query)[exact])
+    assert np.mean(recalls) >= 0.9
+
+
+def test_ivf_save_and_load(tmp_path, make_embeddings):
+    embeddings = make_embeddings(500)
+    index = IVFIndex.build(embeddings, nlist=10, source_fingerprint="build")
+    path = str(tmp_path / "index.ivf.npz")
+    index.save(path)
+
+    loaded = IVFIndex.load(path)
+    assert loaded.source_fingerprint == "build"
+    query = embeddings[3]
+    for actual, expected in zip(loaded.search(query, 5, 3), index.search(query, 5, 3)):
+        assert np.array_equal(actual, expected)
+
+    with pytest.raises(FileNotFoundError):
+        IVFIndex.load(str(tmp_path / "missing.npz"))
@@ -0,0 +1,74 @@
+import numpy as np
+
+from benchmarks.corpus_generator import StubEmbedder, make_queries, synthetic_corpus
+from benchmarks.suite_benchmark import compare, run_suite
+
+
+def test_synthetic_corpus_is_deterministic_and_scales(make_movies):
+    movies = make_movies(50)
+    corpus = list(synthetic_corpus(movies, 400, seed=3))
+    assert corpus[:50] == movies
+    assert len({doc["id"] for doc in corpus}) == 400
+    assert corpus == list(synthetic_corpus(movies, 400, seed=3))
+    assert corpus != list(synthetic_corpus(movies, 400, seed=4))
+    assert list(synthetic_corpus(movies, 20)) == movies[:20]
+
+    # sampled text only uses source words
+    vocabulary = {word for movie in movies for word in movie["description"].split()}
+    assert set(corpus[-1]["description"].split()) <= vocabulary
+
+    queries = make_queries(movies, 30, seed=1)
+    assert len(queries) == 30 and all(queries)
+    assert queries == make_queries(movies, 30, seed=1)
+
+
+def test_stub_embedder_is_deterministic():
+    texts = ["Dragon king", "the dragon queen", "space ship"]
+    embeddings = StubEmbedder(32).encode(texts)
+    assert embeddings.shape == (3, 32)
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1)
+    assert np.array_equal(embeddings, StubEmbedder(32).encode(texts))
+    # shared words make texts similar
+    assert embeddings[0] @ embeddings[1] > embeddings[0] @ embeddings[2]
+
+
+def test_suite_reports_and_flags_regressions(tmp_path, tokenizer, make_movies):
+    movies = make_movies(100)
+    queries = make_queries(movies, 12)
+    report = run_suite(
+        movies,
+        queries,
+        300,
+        str(tmp_path),
+        runs=1,
+        dimensions=16,
+        batch_size=5,
+        tokenizer=tokenizer,
+    )
+    assert report["config"]["documents"] == 300
+    for engine, operations in [
+        ("inverted_index", {"search", "bm25_search"}),
+        ("semantic", {"exact", "batched"}),
+    ]:
+        metrics = report["engines"][engine]
+        assert metrics["documents"] == 300
+        assert metrics["index_mb"] > 0
+        assert set(metrics["queries"]) == operations
+        for stats in metrics["queries"].values():
+            assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+            assert stats["qps"] > 0
+
+    assert not any(row["regressed"] for row in compare(report, report))
+
+    # twice as slow and half the throughput on bm25 only
+    slower = {"engines": {"inverted_index": {"queries": {"bm25_search": {}}}}}
+    bm25 = report["engines"]["inverted_index"]["queries"]["bm25_search"]
+    slower_bm25 = slower["engines"]["inverted_index"]["queries"]["bm25_search"]
+    slower_bm25.update(bm25, p50_ms=2 * bm25["p50_ms"], qps=bm25["qps"] / 2)
+    rows = {row["metric"]: row for row in compare(report, slower)}
+    assert set(rows) == {f"inverted_index.queries.bm25_search.{m}" for m in bm25}
+    regressed = {metric for metric, row in rows.items() if row["regressed"]}
+    assert regressed == {
+        "inverted_index.queries.bm25_search.p50_ms",
+        "inverted_index.queries.bm25_search.qps",
+    }
@@ -0,0 +1,74 @@
+import random
+from collections import Counter
+from typing import Dict
+
+from services.bm25 import BM25Scorer
+from services.indexing import InvertedIndex
+from services.postings import PostingLists
+
+
+# Exhaustive scoring exactly as bm25_search did it before BM25Scorer, with
+# equal scores ranked by doc id
+def exhaustive_bm25_search(
+    index: InvertedIndex, query: str, limit: int
+) -> Dict[int, float]:
+    scores: Dict[int, float] = {}
+    for token in index.tokenizer.tokenize(query):
+        for doc_id in index.get_documents(token):
+            scores[doc_id] = scores.get(doc_id, 0.0) + index.bm25(doc_id, token)
+
+    sorted_scores = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return dict(sorted_scores[:limit])
+
+
+def test_bm25_search_matches_exhaustive_scoring(make_index, queries):
+    index = make_index()
+    for query in queries:
+        for limit in (1, 5, 20, 1000):
+            expected = exhaustive_bm25_search(index, query, limit)
+            actual = index.bm25_search(query, limit)
+            assert list(actual.items()) == list(expected.items())
+
+
+def test_scorer_idf_and_avg_doc_length_match_per_term_methods(make_index):
+    index = make_index()
+    scorer = index.scorer
+    doc_lengths = dict(index.postings.doc_length_items())
+    assert scorer.avg_doc_length == sum(doc_lengths.values()) / len(doc_lengths)
+    for term in index.postings.terms:
+        if index.tokenizer.tokenize(term) != [term]:
+            # e.g. a capitalised stop word that only survived via the title
+            continue
+        assert scorer.term_idf(term) == index.get_bm25_idf(term)
+
+
+def test_posting_lists_from_legacy_dicts_match_built_index(make_index, make_movies):
+    index = make_index()
+    legacy_index: Dict[str, set] = {}
+    term_frequencies: Dict[int, Counter] = {}
+    docs_length: Dict[int, int] = {}
+    for movie in make_movies(300):
+        tokens = index.tokenizer.tokenize(f"{movie['title']} {movie['description']}")
+        for token in tokens:
+            legacy_index.setdefault(token, set()).add(movie["id"])
+        term_frequencies[movie["id"]] = Counter(tokens)
+        docs_length[movie["id"]] = len(tokens)
+
+    converted = PostingLists.from_dicts(legacy_index, term_frequencies, docs_length)
+    assert converted.terms == index.postings.terms
+    assert converted.offsets == index.postings.offsets
+    assert converted.doc_ids == index.postings.doc_ids
+    assert converted.tfs == index.postings.tfs
+    assert converted.doc_lengths == index.postings.doc_lengths
+
+
+def test_pruned_top_k_matches_exhaustive_scoring(make_index):
+    index = make_index(1000)
+    scorer = index.scorer
+    rng = random.Random(3)
+    vocabulary = sorted(index.postings.terms)
+    for _ in range(100):
+        tokens = rng.choices(vocabulary, k=rng.randint(2, 8))
+        for limit in (1, 3, 10, 50):
+            expected = BM25Scorer.top_k(scorer.score_all(tokens), limit)
+            assert scorer.score_pruned(tokens, limit) == expected
@@ -0,0 +1,94 @@
+import pytest
+
+from services.chunking import (
+    PassageSearch,
+    PassageStore,
+    chunk_text,
+    pool_passages,
+    split_sentences,
+)
+
+
+def sentence(n: int, words: int) -> str:
+    return " ".join(f"s{n}w{i}" for i in range(words)) + "."
+
+
+def test_chunks_end_on_sentences_and_overlap():
+    text = " ".join(sentence(n, 10) for n in range(12))
+    chunks = chunk_text(text, size=35, overlap=10)
+    words = [chunk.split() for chunk in chunks]
+    assert all(len(chunk) <= 35 for chunk in words)
+    assert all(chunk[-1].endswith(".") for chunk in words)
+    # each chunk starts with the last sentence of the one before
+    for previous, chunk in zip(words, words[1:]):
+        assert chunk[:10] == previous[-10:]
+    covered = {word for chunk in words for word in chunk}
+    assert covered == set(text.split())
+
+
+def test_long_sentences_are_split_into_windows():
+    text = sentence(0, 100)
+    chunks = [chunk.split() for chunk in chunk_text(text, size=30, overlap=5)]
+    assert all(len(chunk) <= 30 for chunk in chunks)
+    assert chunks[0][-5:] == chunks[1][:5]
+    assert {word for chunk in chunks for word in chunk} == set(text.split())
+    assert chunk_text("", 30, 5) == []
+    with pytest.raises(ValueError):
+        chunk_text(text, size=10, overlap=10)
+
+
+def test_split_sentences():
+    assert split_sentences("One two. Three? Four!  Five") == [
+        ["One", "two."],
+        ["Three?"],
+        ["Four!"],
+        ["Five"],
+    ]
+
+
+def test_pooling():
+    passages = [{"id": i, "doc_id": doc_id} for i, doc_id in enumerate([1, 1, 2])]
+    scores = {0: 1.0, 1: 3.0, 2: 2.5}
+    assert pool_passages(scores, passages, "max") == ({1: 3.0, 2: 2.5}, {1: 1, 2: 2})
+    assert pool_passages(scores, passages, "sum")[0] == {1: 4.0, 2: 2.5}
+    with pytest.raises(ValueError):
+        pool_passages(scores, passages, "mean")
+
+
+def test_passage_search_returns_documents(tmp_path, tokenizer, queries, make_movies):
+    movies = make_movies(200)
+    for movie in movies:
+        words = movie["description"].split()
+        movie["description"] = ". ".join(
+            " ".join(words[i : i + 6]) for i in range(0, len(words), 6)
+        )
+
+    store = PassageStore(str(tmp_path / "passages"), size=12, overlap=6)
+    assert store.load_or_build(movies)
+    assert len(store.passages) > len(movies)
+    assert {p["doc_id"] for p in store.passages} == {m["id"] for m in movies}
+
+    for pooling in ("max", "sum"):
+        search = PassageSearch(store, tokenizer, pooling)
+        search.load_or_create_index()
+        for query in queries:
+            results = search.bm25_search(query, 5)
+            doc_ids = [result["id"] for result in results]
+            assert len(doc_ids) == len(set(doc_ids))
+            for result in results:
+                passage = store.passages[result["passage_id"]]
+                assert passage["doc_id"] == result["id"]
+                assert passage["description"] in result["description"]
+
+    # unchanged documents reuse the stored passages and index
+    reloaded = PassageStore(str(tmp_path / "passages"), size=12, overlap=6)
+    assert not reloaded.load_or_build(movies)
+    assert reloaded.passages == store.passages
+    search = PassageSearch(reloaded, tokenizer)
+    assert len(search.load_or_create_index().docmap) == len(store.passages)
+
+    # other chunk settings rebuild the passages
+    rechunked = PassageStore(str(tmp_path / "passages"), size=24, overlap=6)
+    assert rechunked.load_or_build(movies)
+    search = PassageSearch(rechunked, tokenizer)
+    assert len(search.load_or_create_index().docmap) == len(rechunked.passages)
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(statements: str, names):
+    # a fresh interpreter, so nothing imported by other tests is counted
+    code = (
+        f"import sys; {statements}; "
+        f"print(' '.join(name for name in {list(names)!r} if name in sys.modules))"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, f"{ROOT}/cli"]))
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return set(output.split())
+
+
+def test_keyword_cli_does_not_import_numpy():
+    heavy = ["numpy", "services.chunking", "services.rerank", "services.sharding"]
+    assert imported_modules("import keyword_search_cli", heavy) == set()
+
+
+def test_semantic_cli_loads_the_model_lazily():
+    heavy = ["sentence_transformers", "torch", "turtle", "tkinter"]
+    statements = (
+        "import semantic_search_cli; "
+        "from services.semantic_search import SemanticSearch; "
+        "SemanticSearch(use_query_cache=False)"
+    )
+    assert imported_modules(statements, heavy) == set()
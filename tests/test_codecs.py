@@ -0,0 +1,52 @@
+import numpy as np
+
+from services.codecs import CODECS
+from services.indexing import InvertedIndex
+
+
+def test_codecs_round_trip():
+    rng = np.random.default_rng(3)
+    for encode, decode in CODECS.values():
+        for high in (1, 2, 200, 70000, 2**32 - 1):
+            for count in (1, 7, 128):
+                values = rng.integers(0, high, count, dtype=np.uint64)
+                decoded = decode(memoryview(encode(values)), count)
+                assert decoded.tolist() == values.tolist()
+
+
+def test_compressed_segments_match_raw_postings(
+    tmp_path, tokenizer, queries, make_movies, make_index
+):
+    index = make_index(600)
+    for codec in CODECS:
+        directory = tmp_path / codec
+        saved = InvertedIndex(index.tokenizer, str(directory), codec=codec)
+        saved.build(make_movies(600))
+        saved.save()
+
+        loaded = InvertedIndex(tokenizer, str(directory))
+        loaded.load()
+        assert loaded.postings.codec == codec
+        for term in index.postings.terms:
+            expected_doc_ids, expected_tfs = index.postings.postings(term)
+            doc_ids, tfs = loaded.postings.postings(term)
+            assert doc_ids.tolist() == expected_doc_ids.tolist()
+            assert tfs.tolist() == expected_tfs.tolist()
+            for doc_id in (0, 1, 300, 599, 600, 601):
+                assert loaded.postings.get_tf(doc_id, term) == index.postings.get_tf(
+                    doc_id, term
+                )
+        for query in queries:
+            assert loaded.bm25_search(query, 10) == index.bm25_search(query, 10)
+        assert loaded.boolean_search('"love story"', 10) == index.boolean_search(
+            '"love story"', 10
+        )
+
+        # segments written by updates keep the codec, merging decodes them
+        movie = make_movies(1)[0]
+        loaded.add_documents([dict(movie, id=700)])
+        assert loaded.segments[-1].postings.codec == codec
+        loaded.merge()
+        assert loaded.postings.codec == codec
+        for term in index.tokenizer.tokenize(movie["description"]):
+            assert loaded.postings.get_tf(700, term) == index.postings.get_tf(1, term)
@@ -0,0 +1,76 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from services.ann import normalize
+from services.embedding_build import build_embedding_file, length_sorted_batches
+
+
+def stub_encode(texts):
+    return np.array(
+        [
+            np.random.default_rng(
+                int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+            ).normal(size=16)
+            for text in texts
+        ],
+        dtype=np.float32,
+    )
+
+
+def make_texts(n):
+    return [f"movie {i} " + "word " * (i * 7 % 23) for i in range(n)]
+
+
+def test_batches_are_sorted_by_length():
+    texts = make_texts(50)
+    batches = length_sorted_batches(texts, 8)
+    rows = np.concatenate(batches)
+    assert sorted(rows.tolist()) == list(range(50))
+    lengths = [len(texts[i]) for i in rows]
+    assert lengths == sorted(lengths)
+    assert [len(batch) for batch in batches] == [8] * 6 + [2]
+
+
+def test_build_matches_direct_encoding(tmp_path):
+    texts = make_texts(100)
+    path = str(tmp_path / "embeddings.npy")
+    for workers in (1, 2):
+        stats = build_embedding_file(texts, path, stub_encode, "stub", 16, workers)
+        assert stats["encoded"] == 100
+        embeddings = np.load(path)
+        assert np.allclose(embeddings, normalize(stub_encode(texts)), atol=1e-6)
+
+
+def test_interrupted_build_resumes(tmp_path):
+    texts = make_texts(100)
+    path = str(tmp_path / "embeddings.npy")
+    calls = []
+
+    def failing_encode(batch):
+        if len(calls) == 3:
+            raise RuntimeError("interrupted")
+        calls.append(batch)
+        return stub_encode(batch)
+
+    with pytest.raises(RuntimeError):
+        build_embedding_file(texts, path, failing_encode, "stub", 10)
+
+    encoded = []
+
+    def counting_encode(batch):
+        encoded.append(batch)
+        return stub_encode(batch)
+
+    stats = build_embedding_file(texts, path, counting_encode, "stub", 10)
+    assert stats["encoded"] == 70
+    assert len(encoded) == 7
+    assert np.allclose(np.load(path), normalize(stub_encode(texts)), atol=1e-6)
+
+    # other inputs do not pick up a stale partial build
+    with pytest.raises(RuntimeError):
+        calls.clear()
+        build_embedding_file(texts, path, failing_encode, "stub", 10)
+    stats = build_embedding_file(texts[:50], path, counting_encode, "stub", 10)
+    assert stats["encoded"] == 50
@@ -0,0 +1,56 @@
+import numpy as np
+
+from benchmarks.corpus_generator import StubEmbedder
+from services.embedding_cache import QueryEmbeddingCache
+from services.semantic_search import SemanticSearch
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "queries.sqlite")
+    cache = QueryEmbeddingCache("model", path, memory_size=2, disk_size=3)
+    vectors = {f"query {i}": np.full(4, i, dtype=np.float32) for i in range(4)}
+
+    assert cache.get("query 0") is None
+    for text, vector in vectors.items():
+        cache.put(text, vector)
+
+    # spacing is normalized away
+    assert np.array_equal(cache.get("  query   3 "), vectors["query 3"])
+    # evicted from memory, still on disk
+    assert np.array_equal(cache.get("query 1"), vectors["query 1"])
+    # the least recently used entry left the disk store too
+    assert cache.get("query 0") is None
+    stats = cache.stats()
+    assert stats["process"]["memory_hits"] == 1
+    assert stats["process"]["disk_hits"] == 1
+    assert stats["process"]["misses"] == 2
+    assert stats["total"]["disk_entries"] == 3
+
+    # another process shares the disk tier and the totals
+    other = QueryEmbeddingCache("model", path)
+    assert np.array_equal(other.get("query 2"), vectors["query 2"])
+    assert other.stats()["total"]["disk_hits"] == 2
+
+    # the model is part of the key
+    assert QueryEmbeddingCache("other model", path).get("query 2") is None
+
+
+class RecordingEmbedder(StubEmbedder):
+    def __init__(self):
+        super().__init__(16)
+        self.encoded = []
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        self.encoded.extend(texts)
+        return super().encode(texts, batch_size, **kwargs)
+
+
+def test_repeated_queries_skip_the_model(tmp_path):
+    model = RecordingEmbedder()
+    search = SemanticSearch(use_query_cache=False, model=model)
+    search.query_cache = QueryEmbeddingCache("stub", str(tmp_path / "q.sqlite"))
+
+    first = search.generate_embedding("dragon king")
+    assert np.array_equal(search.generate_embedding("dragon king "), first)
+    assert model.encoded == ["dragon king"]
+    assert search.query_cache.stats()["process"]["memory_hits"] == 1
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from services.fields import FieldIndex
+from services.indexing import InvertedIndex
+from services.processing import Tokenizer
+
+
+def make_field_index(tmp_path, movies, tokenizer: Tokenizer) -> FieldIndex:
+    source = tmp_path / "movies.json"
+    source.write_text(json.dumps({"movies": movies}))
+    return FieldIndex(tokenizer, str(tmp_path / "fields"), str(source))
+
+
+def test_single_field_bm25f_matches_bm25_over_that_field(
+    tmp_path, tokenizer, queries, make_movies
+):
+    movies = make_movies(300)
+    field_index = make_field_index(tmp_path, movies, tokenizer)
+    field_index.load_or_build()
+    assert sorted(field_index.fields) == ["description", "title"]
+
+    # an index of the descriptions alone scores what the field index does
+    index = InvertedIndex(tokenizer)
+    index.build([dict(movie, title="") for movie in movies])
+    for query in queries:
+        results = field_index.search(query, {"description": 1.0}, 1000)
+        expected = index.bm25_search(query, 1000)
+        assert [doc_id for doc_id, _ in results] == sorted(
+            expected, key=lambda doc_id: (-expected[doc_id], doc_id)
+        )
+        for doc_id, score in results:
+            assert score == pytest.approx(expected[doc_id])
+
+
+def test_bm25f_weights_fields_and_deduplicates(tmp_path, tokenizer, make_movies):
+    movies = make_movies(200)
+    movies[0].update(title="Dragon Dragon", description="a quiet story")
+    movies[1].update(title="Quiet", description="dragon dragon dragon story")
+    field_index = make_field_index(tmp_path, movies, tokenizer)
+    field_index.build()
+    field_index.save()
+    field_index.load()
+
+    both = {"title": 1.0, "description": 1.0}
+    results = field_index.search("Dragon dragon", both, 1000)
+    doc_ids = [doc_id for doc_id, _ in results]
+    assert len(doc_ids) == len(set(doc_ids))
+
+    title_heavy = dict(
+        field_index.search("dragon", {"title": 10.0, "description": 1.0}, 5)
+    )
+    body_heavy = dict(
+        field_index.search("dragon", {"title": 0.1, "description": 1.0}, 1000)
+    )
+    assert title_heavy[1] > title_heavy.get(2, 0.0)
+    assert body_heavy[2] > body_heavy[1]
+
+    with pytest.raises(ValueError):
+        field_index.search("dragon", {"genre": 1.0}, 5)
+
+
+def test_field_index_rebuilds_when_source_changes(tmp_path, make_movies, tokenizer):
+    movies = make_movies(50)
+    field_index = make_field_index(tmp_path, movies, tokenizer)
+    field_index.load_or_build()
+    assert field_index.n_docs == 50
+
+    source = tmp_path / "movies.json"
+    source.write_text(json.dumps({"movies": make_movies(60)}))
+    reopened = FieldIndex(field_index.tokenizer, field_index.directory, str(source))
+    reopened.load_or_build()
+    assert reopened.n_docs == 60
+    assert reopened.document(60) == make_movies(60)[59]
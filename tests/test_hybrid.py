@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from benchmarks.corpus_generator import StubEmbedder
+from services.hybrid import HybridSearch, rrf_fusion, weighted_fusion
+from services.indexing import InvertedIndex
+from services.semantic_search import SemanticSearch
+
+
+def test_fusion_scores():
+    bm25 = {1: 10.0, 2: 5.0, 3: 0.0}
+    semantic = {2: 0.9, 4: 0.5}
+
+    fused = rrf_fusion(bm25, semantic, k=60)
+    assert fused == pytest.approx({1: 1 / 61, 2: 1 / 62 + 1 / 61, 3: 1 / 63, 4: 1 / 62})
+
+    fused = weighted_fusion(bm25, semantic, alpha=0.25)
+    assert fused == pytest.approx({1: 0.25, 2: 0.125 + 0.75, 3: 0.0, 4: 0.0})
+    assert weighted_fusion(bm25, semantic, alpha=1.0) == pytest.approx(
+        {1: 1.0, 2: 0.5, 3: 0.0, 4: 0.0}
+    )
+
+
+def test_hybrid_search_fuses_both_retrievers(tmp_path, tokenizer, make_movies):
+    movies = make_movies(200)
+    index = InvertedIndex(tokenizer)
+    index.build(movies)
+    semantic = SemanticSearch(
+        use_query_cache=False,
+        prefix=str(tmp_path / "embeddings"),
+        model=StubEmbedder(32),
+    )
+    semantic.load_or_create_embeddings(movies)
+    hybrid = HybridSearch(index, semantic, candidate_multiplier=4, workers=2)
+    try:
+        for query in ["alien robot", "ghost ship ocean", "love story"]:
+            bm25 = index.bm25_search(query, 20)
+            dense = {
+                doc["id"]: doc["score"] for doc in semantic.search(query, 20, True)
+            }
+            expected = rrf_fusion(bm25, dense)
+            results = hybrid.search(query, 5, exact=True)
+            assert [doc["score"] for doc in results] == pytest.approx(
+                sorted(expected.values(), reverse=True)[:5]
+            )
+            for doc in results:
+                assert doc["score"] == pytest.approx(expected[doc["id"]])
+                assert doc["bm25_score"] == bm25.get(doc["id"])
+
+            # restricted, the dense side scores exactly the BM25 candidates
+            bm25_scores, semantic_scores = hybrid.retrieve(query, 5, restrict=True)
+            assert bm25_scores == bm25
+            assert set(semantic_scores) == set(bm25)
+            query_embedding = semantic.embed_query(query)
+            for doc_id, score in semantic_scores.items():
+                row = list(semantic.row_doc_ids).index(doc_id)
+                assert np.isclose(score, semantic.embeddings[row] @ query_embedding)
+
+        with pytest.raises(ValueError):
+            hybrid.search("alien", 5, mode="max")
+        with pytest.raises(ValueError):
+            hybrid.search("alien", 5, mode="weighted", alpha=1.5)
+    finally:
+        hybrid.close()
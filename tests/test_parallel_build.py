@@ -0,0 +1,43 @@
+import json
+
+from services.indexing import InvertedIndex
+from services.postings import PostingLists
+from services.processing import iter_documents
+
+
+def assert_same_postings(a: PostingLists, b: PostingLists):
+    assert a.terms == b.terms
+    assert a.offsets == b.offsets
+    assert a.doc_ids == b.doc_ids
+    assert a.tfs == b.tfs
+    assert a.doc_lengths == b.doc_lengths
+    assert a.n_docs == b.n_docs
+    assert a.total_doc_length == b.total_doc_length
+
+
+def test_streaming_parallel_build_matches_serial_build(
+    tmp_path, tokenizer, make_movies
+):
+    movies = make_movies(500)
+    path = tmp_path / "movies.json"
+    path.write_text(json.dumps({"movies": movies}, indent=2))
+
+    serial = InvertedIndex(tokenizer)
+    serial.build(movies)
+
+    for workers, batch_size in [(1, 64), (3, 37)]:
+        index = InvertedIndex(tokenizer)
+        n_docs = index.build_streaming(
+            iter_documents(str(path), chunk_size=256), workers, batch_size
+        )
+        assert n_docs == len(movies)
+        assert_same_postings(index.postings, serial.postings)
+        assert index.docmap == serial.docmap
+
+
+def test_iter_documents_reads_jsonl(tmp_path, make_movies):
+    movies = make_movies(20)
+    path = tmp_path / "movies.jsonl"
+    path.write_text("".join(json.dumps(movie) + "\n" for movie in movies))
+
+    assert list(iter_documents(str(path))) == movies
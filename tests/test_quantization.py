@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from services.quantization import QuantizedStore
+
+
+@pytest.mark.parametrize("mode, min_recall", [("int8", 0.95), ("pq", 0.8)])
+def test_quantized_scores_recall_exact_top_k(mode, min_recall, make_embeddings):
+    embeddings = make_embeddings(2000)
+    queries = make_embeddings(20, seed=1)
+    store = QuantizedStore.build(mode, embeddings, "build")
+
+    recalls = []
+    for query in queries:
+        exact = set(np.argsort(-(embeddings @ query))[:10].tolist())
+        approx = set(np.argsort(-store.scores(query))[:50].tolist())
+        recalls.append(len(exact & approx) / 10)
+    assert np.mean(recalls) >= min_recall
+
+
+def test_pq_codebook_of_a_small_corpus(make_embeddings):
+    embeddings = make_embeddings(100)
+    store = QuantizedStore.build("pq", embeddings, "build")
+
+    # one centroid per training point, so every document is its own code
+    assert store.quantizer.centroids.shape[1] == 100
+    assert int(store.codes.max()) < 100
+    decoded = store.quantizer.decode(store.codes)
+    assert np.allclose(decoded, embeddings, atol=1e-6)
+
+
+def test_quantized_store_round_trip(tmp_path, make_embeddings):
+    embeddings = make_embeddings(500)
+    prefix = str(tmp_path / "embeddings")
+    assert QuantizedStore.load("int8", prefix) is None
+    with pytest.raises(ValueError):
+        QuantizedStore.build("float16", embeddings, "build")
+
+    for mode in ("int8", "pq"):
+        store = QuantizedStore.build(mode, embeddings, "first")
+        store.save(prefix)
+        loaded = QuantizedStore.load(mode, prefix)
+        assert loaded.source_build_id == "first"
+        assert np.array_equal(loaded.codes, store.codes)
+        assert np.allclose(loaded.scores(embeddings[0]), store.scores(embeddings[0]))
+
+
+def test_save_does_not_change_mapped_codes(tmp_path, make_embeddings):
+    prefix = str(tmp_path / "embeddings")
+    first = QuantizedStore.build("int8", make_embeddings(500), "first")
+    first.save(prefix)
+    mapped = QuantizedStore.load("int8", prefix)
+
+    second = QuantizedStore.build("int8", make_embeddings(500, seed=2), "second")
+    second.save(prefix)
+    # a reader that mapped the old codes keeps seeing them
+    assert np.array_equal(mapped.codes, first.codes)
+    reloaded = QuantizedStore.load("int8", prefix)
+    assert reloaded.source_build_id == "second"
+    assert np.array_equal(reloaded.codes, second.codes)
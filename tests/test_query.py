@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from services.indexing import InvertedIndex
+from services.postings import decode_positions, encode_positions
+from services.processing import Tokenizer
+from services.query import intersect, parse_query
+
+
+class Tokens:
+    # a document's tokens, asked about in unstemmed words
+    def __init__(self, tokens, tokenizer: Tokenizer):
+        self.tokens = tokens
+        self.tokenizer = tokenizer
+
+    def __contains__(self, word):
+        return self.tokenizer.tokenize(word)[0] in self.tokens
+
+    def has_phrase(self, text):
+        phrase = self.tokenizer.tokenize(text)
+        n = len(phrase)
+        tokens = self.tokens
+        return any(tokens[i : i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+BOOLEAN_queries = {
+    "alien robot": lambda t: "alien" in t and "robot" in t,
+    "alien AND robot": lambda t: "alien" in t and "robot" in t,
+    "alien OR robot": lambda t: "alien" in t or "robot" in t,
+    "alien NOT robot": lambda t: "alien" in t and "robot" not in t,
+    "NOT ghost": lambda t: "ghost" not in t,
+    "(king OR queen) AND NOT (dragon OR magic)": lambda t: (
+        ("king" in t or "queen" in t) and "dragon" not in t and "magic" not in t
+    ),
+    "ghost OR NOT house": lambda t: "ghost" in t or "house" not in t,
+    '"love story"': lambda t: t.has_phrase("love story"),
+    '"love story" OR "war ship"': lambda t: (
+        t.has_phrase("love story") or t.has_phrase("war ship")
+    ),
+    '"the king of the island" NOT train': lambda t: (
+        t.has_phrase("king island") and "train" not in t
+    ),
+    "the": lambda t: False,
+}
+
+
+def description_tokens(index: InvertedIndex, movies):
+    return {
+        movie["id"]: Tokens(
+            index.tokenizer.tokenize(f"{movie['title']} {movie['description']}"),
+            index.tokenizer,
+        )
+        for movie in movies
+    }
+
+
+def test_positions_round_trip():
+    rng = random.Random(5)
+    for _ in range(200):
+        positions = sorted(rng.sample(range(100000), rng.randint(0, 20)))
+        assert decode_positions(encode_positions(positions)) == positions
+
+
+def test_galloping_intersection_matches_sets():
+    rng = random.Random(11)
+    for _ in range(200):
+        a = sorted(rng.sample(range(5000), rng.randint(0, 50)))
+        b = sorted(rng.sample(range(5000), rng.randint(0, 2000)))
+        assert intersect(a, b) == sorted(set(a) & set(b))
+        assert intersect(b, a) == sorted(set(a) & set(b))
+
+
+def test_query_parser_rejects_malformed_queries(tokenizer):
+    for query in ["(alien", "alien)", "alien AND", "OR robot", "NOT"]:
+        with pytest.raises(ValueError):
+            parse_query(query, tokenizer)
+    assert parse_query("the AND a", tokenizer) is None
+
+
+def test_boolean_search_matches_brute_force(
+    tmp_path, tokenizer, make_movies, make_index
+):
+    movies = make_movies(400)
+    index = make_index(400)
+    tokens = description_tokens(index, movies)
+    for query, predicate in BOOLEAN_queries.items():
+        expected = {doc_id for doc_id, t in tokens.items() if predicate(t)}
+        results = index.boolean_search(query, 1000)
+        assert set(results) == expected, query
+
+        # ranked by BM25 of the positive terms, like bm25_search
+        positive = query.split("NOT")[0].replace("AND", "").replace("OR", "")
+        full = index.scorer.score_all(index.tokenizer.tokenize(positive))
+        for doc_id, score in results.items():
+            assert score == full.get(doc_id, 0.0)
+        assert list(results.values()) == sorted(results.values(), reverse=True)
+
+    # the same answers from saved segments, with an update and a deletion
+    saved = InvertedIndex(tokenizer, str(tmp_path))
+    saved.build(movies[:300])
+    saved.save()
+    saved.add_documents(movies[300:])
+    saved.delete_document(17)
+    saved.add_documents([dict(movies[4], description="love story of a war ship")])
+    tokens.pop(17)
+    tokens[5] = Tokens(
+        saved.tokenizer.tokenize(f"{movies[4]['title']} love story of a war ship"),
+        saved.tokenizer,
+    )
+    for query, predicate in BOOLEAN_queries.items():
+        expected = {doc_id for doc_id, t in tokens.items() if predicate(t)}
+        assert set(saved.boolean_search(query, 1000)) == expected, query
+
+    saved.merge()
+    assert saved.postings.positions is not None
+    for query, predicate in BOOLEAN_queries.items():
+        expected = {doc_id for doc_id, t in tokens.items() if predicate(t)}
+        assert set(saved.boolean_search(query, 1000)) == expected, query
@@ -0,0 +1,116 @@
+from typing import List
+
+from services.rerank import Reranker
+
+
+class StubCrossEncoder:
+    # scores a pair by query words in the text; every predict call takes
+    # `cost` seconds on the shared fake clock
+    def __init__(self, clock: List[float], cost: float = 0.0):
+        self.clock = clock
+        self.cost = cost
+        self.pairs = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.clock[0] += self.cost
+        self.pairs += len(pairs)
+        return [
+            float(len(set(query.split()) & set(text.lower().split())))
+            for query, text in pairs
+        ]
+
+
+def make_candidates(n: int):
+    # first stage order is by id; the text puts the best matches last
+    return [
+        {
+            "id": i,
+            "title": f"Movie {i}",
+            "description": " ".join(["dragon"] * (i % 4) + ["story"]),
+        }
+        for i in range(n)
+    ]
+
+
+def test_rerank_orders_by_cross_encoder_and_caches():
+    clock = [0.0]
+    model = StubCrossEncoder(clock)
+    reranker = Reranker(batch_size=4, model=model, clock=lambda: clock[0])
+    candidates = make_candidates(12)
+
+    results = reranker.rerank("dragon", candidates, 5)
+    assert [doc["id"] for doc in results] == [1, 2, 3, 5, 6]
+    assert all(doc["rerank_score"] == 1.0 for doc in results)
+    assert model.pairs == 12
+
+    # the same query is answered from the cache
+    assert reranker.rerank("  dragon ", candidates, 5) == results
+    assert model.pairs == 12
+    stats = reranker.stats()
+    assert stats["hits"] == 12 and stats["misses"] == 12
+    assert stats["hit_rate"] == 0.5
+
+    # a changed document is scored again
+    candidates[0]["description"] = "dragon story"
+    reranker.rerank("dragon", candidates, 5)
+    assert model.pairs == 13
+
+
+def test_budget_keeps_first_stage_order_for_the_rest():
+    clock = [0.0]
+    model = StubCrossEncoder(clock, cost=0.004)
+    reranker = Reranker(batch_size=4, budget_ms=10, model=model, clock=lambda: clock[0])
+    candidates = make_candidates(12)[::-1]
+
+    # two batches fit in 10ms at 4ms each; a third would overrun
+    results = reranker.rerank("dragon", candidates, 12)
+    assert model.pairs == 8
+    assert reranker.stats()["over_budget"] == 1
+    reranked, rest = results[:8], results[8:]
+    assert [doc["id"] for doc in rest] == [3, 2, 1, 0]
+    assert all(doc["rerank_score"] is None for doc in rest)
+    scores = [doc["rerank_score"] for doc in reranked]
+    assert scores == sorted(scores, reverse=True)
+    assert {doc["id"] for doc in reranked} == set(range(4, 12))
+
+    # with no budget left the first stage order comes back untouched
+    results = reranker.rerank("ghost", candidates, 12, budget_ms=0)
+    assert [doc["id"] for doc in results] == [doc["id"] for doc in candidates]
+
+
+class ColdReranker(Reranker):
+    # loading the model takes a second on the fake clock
+    def __init__(self, clock: List[float], **kwargs):
+        super().__init__(clock=lambda: clock[0], **kwargs)
+        self.fake_clock = clock
+        self.loaded = None
+
+    @property
+    def model(self):
+        if self.loaded is None:
+            self.fake_clock[0] += 1
+            self.loaded = StubCrossEncoder(self.fake_clock)
+        return self.loaded
+
+
+def test_model_load_is_not_charged_to_the_budget():
+    clock = [0.0]
+    reranker = ColdReranker(clock, batch_size=4, budget_ms=10)
+    results = reranker.rerank("dragon", make_candidates(12), 5)
+    assert reranker.loaded.pairs == 12
+    assert reranker.stats()["over_budget"] == 0
+    assert [doc["id"] for doc in results] == [1, 2, 3, 5, 6]
+
+
+def test_scores_are_shared_through_the_disk_cache(tmp_path):
+    path = str(tmp_path / "rerank.sqlite")
+    candidates = make_candidates(12)
+    first = ColdReranker([0.0], batch_size=4, path=path)
+    results = first.rerank("dragon", candidates, 5)
+
+    # another process answers from disk and never loads the model
+    second = ColdReranker([0.0], batch_size=4, path=path)
+    assert second.rerank("dragon", candidates, 5) == results
+    assert second.loaded is None
+    assert second.stats()["hits"] == 12
+    assert second.cache.stats()["total"]["disk_hits"] == 12
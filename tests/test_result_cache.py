@@ -0,0 +1,68 @@
+from services.indexing import InvertedIndex
+from services.result_cache import ResultCache
+
+
+def test_bm25_results_are_cached_until_the_index_changes(
+    tmp_path, tokenizer, queries, make_movies
+):
+    index = InvertedIndex(tokenizer, str(tmp_path))
+    index.build(make_movies(300))
+    index.save()
+    index.result_cache = ResultCache("bm25")
+
+    expected = {query: index.bm25_search(query, 10) for query in queries}
+    for query in queries:
+        # the key is the tokens, so stop words and spacing do not matter
+        assert index.bm25_search(f"the  {query} ", 10) == expected[query]
+    stats = index.result_cache.stats()["process"]
+    assert stats["memory_hits"] == len(queries)
+    assert stats["misses"] == len(queries)
+
+    # a commit gets a new build id, so nothing from before it is reused
+    movie = dict(make_movies(1)[0], id=1000, description="ghost ghost ghost")
+    index.add_documents([movie])
+    assert 1000 in index.bm25_search("ghost", 10)
+    assert index.result_cache.stats()["process"]["misses"] == len(queries) + 1
+
+    # and another process loading the same index shares its build id
+    other = InvertedIndex(tokenizer, str(tmp_path))
+    other.load()
+    assert other.build_id == index.build_id
+
+
+def test_lru_and_ttl_eviction():
+    now = [0.0]
+    cache = ResultCache("bm25", memory_size=2, ttl=10, clock=lambda: now[0])
+    keys = [cache.key("v1", [str(i)], 5) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, [i])
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == [2]
+
+    now[0] = 11
+    assert cache.get(keys[2]) is None
+    assert cache.stats()["process"]["memory_entries"] == 1
+
+    # parameters are part of the key
+    assert cache.key("v1", ["a"], 5, k1=1.2) != cache.key("v1", ["a"], 5, k1=1.5)
+    assert cache.key("v1", ["a"], 5) != cache.key("v2", ["a"], 5)
+
+
+def test_disk_store_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    first = ResultCache("bm25", path)
+    second = ResultCache("bm25", path)
+    other_engine = ResultCache("semantic", path)
+
+    key = first.key("v1", ["ghost"], 5)
+    assert first.get(key) is None
+    first.put(key, [[1, 2.5]])
+    assert second.get(key) == [[1, 2.5]]
+    assert second.get(key) == [[1, 2.5]]
+
+    total = second.stats()["total"]
+    assert total["misses"] == 1
+    assert total["disk_hits"] == 1
+    assert total["memory_hits"] == 1
+    assert total["hit_rate"] == 2 / 3
+    assert other_engine.stats()["total"]["misses"] == 0
@@ -0,0 +1,150 @@
+import pickle
+import struct
+from collections import Counter
+
+import pytest
+
+from services import indexing
+from services.indexing import InvertedIndex
+from services.segment import SEGMENT_MAGIC, Segment, write_segment
+
+
+def test_segment_round_trip(tmp_path, make_index):
+    index = make_index(200)
+    path = str(tmp_path / "segment.bin")
+    write_segment(path, index.postings, index.docmap, "raw")
+
+    segment = Segment(path)
+    postings = segment.postings
+    assert postings.n_docs == index.postings.n_docs
+    assert postings.avg_doc_length == index.postings.avg_doc_length
+    assert set(postings.terms) == set(index.postings.terms)
+    for term in index.postings.terms:
+        doc_ids, tfs = postings.postings(term)
+        expected_doc_ids, expected_tfs = index.postings.postings(term)
+        assert doc_ids.tolist() == expected_doc_ids.tolist()
+        assert tfs.tolist() == expected_tfs.tolist()
+    for doc_id, doc in index.docmap.items():
+        assert segment.documents[doc_id] == doc
+        assert postings.doc_length(doc_id) == index.postings.doc_length(doc_id)
+    assert "unknownterm" not in postings.terms
+    with pytest.raises(KeyError):
+        segment.documents[10_000]
+
+
+def test_segment_rejects_other_files_and_versions(tmp_path, make_index):
+    path = tmp_path / "segment.bin"
+    path.write_bytes(b"not a segment at all")
+    with pytest.raises(ValueError, match="not an index segment"):
+        Segment(str(path))
+
+    index = make_index(20)
+    write_segment(str(path), index.postings, index.docmap)
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<8sI", data, 0, SEGMENT_MAGIC, 99)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="Unsupported segment version 99"):
+        Segment(str(path))
+
+
+def write_legacy_pickles(monkeypatch, directory, index):
+    # the four pickles of the original cache, rebuilt from the postings
+    inverted = {}
+    term_frequencies = {doc_id: Counter() for doc_id in index.docmap}
+    for term in index.postings.terms:
+        doc_ids, tfs = index.postings.postings(term)
+        inverted[term] = set(doc_ids.tolist())
+        for doc_id, tf in zip(doc_ids.tolist(), tfs.tolist()):
+            term_frequencies[doc_id][term] = tf
+    doc_lengths = dict(index.postings.doc_length_items())
+    for name, value in [
+        ("index_dir", inverted),
+        ("tf_dir", term_frequencies),
+        ("doc_lengths_dir", doc_lengths),
+        ("docmap_dir", index.docmap),
+    ]:
+        path = directory / f"{name}.pkl"
+        path.write_bytes(pickle.dumps(value))
+        monkeypatch.setattr(indexing, name, str(path))
+    monkeypatch.setattr(indexing, "postings_dir", str(directory / "missing.pkl"))
+
+
+def test_legacy_pickles_convert_to_segments(
+    monkeypatch, tmp_path, tokenizer, queries, make_index
+):
+    index = make_index(200)
+    write_legacy_pickles(monkeypatch, tmp_path, index)
+
+    converted = InvertedIndex(tokenizer, str(tmp_path / "index"))
+    converted.load_pickles()
+    converted.save()
+    loaded = InvertedIndex(tokenizer, str(tmp_path / "index"))
+    loaded.load()
+    assert loaded.segments
+    for query in queries:
+        assert loaded.bm25_search(query, 20) == index.bm25_search(query, 20)
+    assert loaded.docmap[7] == index.docmap[7]
+
+
+def test_updates_to_a_legacy_pickle_cache_keep_its_documents(
+    monkeypatch, tmp_path, tokenizer, make_movies, make_index
+):
+    index = make_index(200)
+    write_legacy_pickles(monkeypatch, tmp_path, index)
+
+    updated = InvertedIndex(tokenizer, str(tmp_path / "index"))
+    updated.add_documents([dict(make_movies(1)[0], id=1000)])
+    updated.delete_document(7)
+
+    reopened = InvertedIndex(tokenizer, str(tmp_path / "index"))
+    reopened.load()
+    assert set(reopened.docmap) == (set(index.docmap) | {1000}) - {7}
+    assert reopened.docmap[8] == index.docmap[8]
+
+
+def assert_same_bm25(index, documents, tokenizer, queries):
+    fresh = InvertedIndex(tokenizer)
+    fresh.build(list(documents.values()))
+    for query in queries:
+        for limit in (3, 10, len(documents)):
+            expected = fresh.bm25_search(query, limit)
+            actual = index.bm25_search(query, limit)
+            # equal scores rank by doc id, whichever segment holds them
+            assert list(actual) == list(expected)
+            assert actual == pytest.approx(expected, rel=1e-9)
+
+
+def test_updated_segments_score_like_a_fresh_build(
+    tmp_path, tokenizer, queries, make_movies
+):
+    documents = {movie["id"]: movie for movie in make_movies(300)}
+    index = InvertedIndex(tokenizer, str(tmp_path))
+    index.build(list(documents.values()))
+    index.save()
+    index = InvertedIndex(tokenizer, str(tmp_path))
+    index.load()
+
+    added = [dict(movie, id=movie["id"] + 1000) for movie in make_movies(40, seed=8)]
+    index.add_documents(added)
+    documents.update((movie["id"], movie) for movie in added)
+    assert_same_bm25(index, documents, tokenizer, queries)
+
+    for doc_id in (3, 50, 1005):
+        document = dict(documents[doc_id], description="ghost ghost alien robot")
+        index.update_document(document)
+        documents[doc_id] = document
+    assert_same_bm25(index, documents, tokenizer, queries)
+
+    for doc_id in (7, 120, 1020, 50):
+        index.delete_document(doc_id)
+        del documents[doc_id]
+    assert len(index.segments) > 1
+    assert_same_bm25(index, documents, tokenizer, queries)
+
+    index.merge()
+    assert len(index.segments) == 1
+    assert_same_bm25(index, documents, tokenizer, queries)
+
+    reopened = InvertedIndex(tokenizer, str(tmp_path))
+    reopened.load()
+    assert_same_bm25(reopened, documents, tokenizer, queries)
@@ -0,0 +1,83 @@
+import json
+import sys
+import types
+
+import numpy as np
+
+from benchmarks.corpus_generator import StubEmbedder
+from services.semantic_search import (
+    EMBEDDING_FORMAT,
+    SemanticSearch,
+    load_embedding_store,
+)
+from services.utils import EMBEDDING_MODEL
+
+
+class BatchCountingEmbedder(StubEmbedder):
+    def __init__(self, dimensions: int = 32):
+        super().__init__(dimensions)
+        self.calls = 0
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        self.calls += 1
+        # unnormalized, so the store has to normalize what it keeps
+        return 3 * super().encode(texts, batch_size, **kwargs)
+
+
+def test_store_is_normalized_and_old_files_are_migrated(tmp_path):
+    prefix = str(tmp_path / "embeddings")
+    vectors = np.random.default_rng(0).standard_normal((50, 16)) * 5
+    np.save(f"{prefix}.npy", vectors)
+
+    embeddings, meta = load_embedding_store(prefix)
+    assert embeddings.dtype == np.float32
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-6)
+    assert np.allclose(embeddings, vectors / np.linalg.norm(vectors, axis=1)[:, None])
+    with open(f"{prefix}.meta.json") as f:
+        assert json.load(f)["format"] == EMBEDDING_FORMAT
+    assert meta["count"] == 50 and meta["build_id"]
+
+    # a migrated store loads as it is
+    _, again = load_embedding_store(prefix)
+    assert again["build_id"] == meta["build_id"]
+
+
+def test_search_many_matches_search_with_one_encode(tmp_path, make_movies):
+    model = BatchCountingEmbedder()
+    search = SemanticSearch(
+        use_query_cache=False, prefix=str(tmp_path / "embeddings"), model=model
+    )
+    search.load_or_create_embeddings(make_movies(200))
+    assert np.allclose(np.linalg.norm(search.embeddings, axis=1), 1, atol=1e-6)
+
+    queries = ["ghost ship", "alien king", "detective in the city", "love"]
+    model.calls = 0
+    batched = search.search_many(queries, 5, exact=True)
+    assert model.calls == 1
+    for query, results in zip(queries, batched):
+        expected = search.search(query, 5, exact=True)
+        assert [doc["id"] for doc in results] == [doc["id"] for doc in expected]
+        assert np.allclose(
+            [doc["score"] for doc in results], [doc["score"] for doc in expected]
+        )
+        scores = [doc["score"] for doc in results]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_model_is_loaded_on_first_encode(monkeypatch):
+    loaded = []
+
+    class FakeSentenceTransformer(StubEmbedder):
+        def __init__(self, name: str):
+            super().__init__(16)
+            loaded.append(name)
+
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeSentenceTransformer
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+
+    search = SemanticSearch(use_query_cache=False)
+    assert loaded == []
+    search.generate_embedding("dragon")
+    search.generate_embedding("ghost")
+    assert loaded == [EMBEDDING_MODEL]
@@ -0,0 +1,63 @@
+import numpy as np
+
+from benchmarks.corpus_generator import StubEmbedder
+from services.semantic_search import SemanticSearch
+
+
+class CountingEmbedder(StubEmbedder):
+    def __init__(self, dimensions: int = 32):
+        super().__init__(dimensions)
+        self.encoded = []
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        self.encoded.extend(texts)
+        return super().encode(texts, batch_size, **kwargs)
+
+
+def open_search(prefix: str, documents, model=None) -> SemanticSearch:
+    search = SemanticSearch(
+        use_query_cache=False, prefix=prefix, model=model or CountingEmbedder()
+    )
+    search.load_or_create_embeddings(documents)
+    return search
+
+
+def test_update_encodes_only_changed_documents(tmp_path, make_movies):
+    movies = make_movies(60)
+    prefix = str(tmp_path / "embeddings")
+    search = open_search(prefix, movies)
+    mapped = search.embeddings
+    before = np.array(mapped)
+
+    # one changed, one deleted, two added (one reusing the deleted row)
+    updated = [dict(movie) for movie in movies if movie["id"] != 5]
+    updated[0]["description"] = "ghost ship ocean heist"
+    updated += [
+        {"id": 100, "title": "Space Dragon", "description": "alien king"},
+        {"id": 101, "title": "Robot Train", "description": "detective city"},
+    ]
+    model = CountingEmbedder()
+    search = open_search(prefix, updated, model)
+    assert sorted(model.encoded) == sorted(
+        f"{doc['title']}:{doc['description']}"
+        for doc in [updated[0], updated[-2], updated[-1]]
+    )
+    # the store was replaced, not written through a reader's mapping
+    assert np.array_equal(mapped, before)
+
+    fresh = open_search(str(tmp_path / "fresh"), updated)
+    for query in ["ghost ship", "alien king", "detective city", "love story"]:
+        actual = search.search(query, 10, exact=True)
+        # rows differ from the fresh build, so ties may come out in any order
+        expected = {doc["id"]: doc["score"] for doc in fresh.search(query, 61, True)}
+        assert np.allclose(
+            [doc["score"] for doc in actual], sorted(expected.values())[::-1][:10]
+        )
+        for doc in actual:
+            assert np.isclose(doc["score"], expected[doc["id"]])
+    assert all(doc["id"] != 5 for doc in search.search("love", 60, exact=True))
+
+    # nothing changed, nothing encoded
+    model = CountingEmbedder()
+    open_search(prefix, updated, model)
+    assert model.encoded == []
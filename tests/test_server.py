@@ -0,0 +1,90 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from services import server
+
+
+async def request(port: int, raw: bytes):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, value = line.decode().split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    return int(status_line.split()[1]), json.loads(body)
+
+
+def post(path: str, body: bytes) -> bytes:
+    return (
+        f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode() + body
+
+
+def get(target: str) -> bytes:
+    return f"GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n".encode()
+
+
+def run_requests(raw_requests):
+    async def main():
+        with ThreadPoolExecutor(2) as executor:
+            search_server = server.SearchServer(executor)
+            tcp_server = await asyncio.start_server(
+                search_server.handle, "127.0.0.1", 0
+            )
+            port = tcp_server.sockets[0].getsockname()[1]
+            async with tcp_server:
+                return [await request(port, raw) for raw in raw_requests]
+
+    return asyncio.run(main())
+
+
+def test_bad_requests_get_a_400_and_errors_a_500(monkeypatch, make_index):
+    index = make_index()
+    monkeypatch.setitem(server._engines, "index", index)
+    expected = list(index.bm25_search("alien robot", 3))
+
+    responses = run_requests(
+        [
+            get("/bm25?q=alien+robot&limit=3"),
+            post("/bm25", b'["alien", "robot"]'),
+            post("/bm25", b"{not json"),
+            post("/bm25", b'{"q": "alien", "limit": [3]}'),
+            get("/bm25?q=alien&limit=three"),
+            get("/bm25?q=alien&limit=-1"),
+            get("/bm25?q=alien&limit=0"),
+            b"GARBAGE\r\n\r\n",
+            get("/semantic?q=alien"),
+        ]
+    )
+    status, payload = responses[0]
+    assert status == 200
+    assert [result["id"] for result in payload["results"]] == expected
+    for status, payload in responses[1:8]:
+        assert status == 400 and payload["error"]
+    assert responses[8][0] == 503
+
+    # a failing engine, even with a KeyError, is the server's fault
+    for error in (RuntimeError("boom"), KeyError("index")):
+
+        def failing(query, limit, error=error):
+            raise error
+
+        monkeypatch.setattr(server, "bm25_results", failing)
+        ((status, payload),) = run_requests([get("/bm25?q=alien")])
+        assert status == 500
+        assert payload == {"error": "internal server error"}
+
+
+def test_limit_is_capped(monkeypatch, make_index):
+    monkeypatch.setitem(server._engines, "index", make_index())
+    monkeypatch.setattr(server, "SERVER_MAX_LIMIT", 4)
+
+    ((status, payload),) = run_requests([get("/bm25?q=alien&limit=1000000")])
+    assert status == 200
+    assert len(payload["results"]) == 4
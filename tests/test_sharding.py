@@ -0,0 +1,57 @@
+from services import bm25, sharding
+from services.postings import max_tf_score
+from services.sharding import ShardedIndex
+
+
+def test_sharded_bm25_search_matches_unsharded_index(
+    tmp_path, tokenizer, queries, make_movies, make_index
+):
+    index = make_index(400)
+    sharded = ShardedIndex(str(tmp_path), workers=2, tokenizer=tokenizer)
+    try:
+        assert sharded.build(3, make_movies(400)) == 400
+        assert sharded.n_docs == len(index.docmap)
+        assert sharded.avg_doc_length == index.postings.avg_doc_length
+
+        for query in queries:
+            for limit in (1, 5, 20, 1000):
+                expected = index.bm25_search(query, limit)
+                actual = sharded.bm25_search(query, limit)
+                assert list(actual.items()) == list(expected.items())
+
+        # a reopened sharded index gathers the same global statistics
+        reopened = ShardedIndex(str(tmp_path), workers=1, tokenizer=tokenizer)
+        reopened.load()
+        assert reopened.bm25_search("alien robot", 10) == sharded.bm25_search(
+            "alien robot", 10
+        )
+        assert reopened.document(7) == index.docmap[7]
+        reopened.close()
+    finally:
+        sharded.close()
+
+
+def test_shard_scorer_bounds_are_computed_once(
+    monkeypatch, tmp_path, stop_words, make_movies
+):
+    sharding.init_shard_worker(stop_words)
+    path = str(tmp_path / "shard")
+    sharding.build_shard(path, 0, 1, make_movies(200))
+    postings = sharding.open_shard(path).postings
+
+    computed = []
+
+    def counting_max_tf_score(*args):
+        computed.append(args)
+        return max_tf_score(*args)
+
+    monkeypatch.setattr(bm25, "max_tf_score", counting_max_tf_score)
+    # a global avgdl other than the shard's, so stored bounds do not apply
+    avg_doc_length = postings.avg_doc_length + 1
+    idf = {"alien": 1.0, "robot": 2.0}
+    args = (path, ["alien", "robot"], 5, postings.n_docs, avg_doc_length, idf)
+    first = sharding.shard_search(*args)
+    assert computed
+    n_computed = len(computed)
+    assert sharding.shard_search(*args) == first
+    assert len(computed) == n_computed
@@ -0,0 +1,42 @@
+from nltk import PorterStemmer
+
+from services import processing
+from services.processing import Tokenizer
+
+
+def reference_tokenize(text, stop_words):
+    # the pipeline the tokenizer replaces: a new stemmer for every token
+    words = processing.remove_punctuation(text).split()
+    return [PorterStemmer().stem(word) for word in words if word not in stop_words]
+
+
+def test_tokenize_matches_the_reference_pipeline(stop_words, make_movies):
+    tokenizer = Tokenizer(stop_words=stop_words, stem_cache_size=8)
+    texts = [movie["description"] for movie in make_movies(50)]
+    texts += ["The dragon's queens, running... in the city!", "", "   "]
+    expected = [reference_tokenize(text, set(stop_words)) for text in texts]
+    assert [tokenizer.tokenize(text) for text in texts] == expected
+    assert list(tokenizer.tokenize_many(texts)) == expected
+    # the stem cache stays within its bound
+    assert tokenizer.stem.cache_info().currsize <= 8
+    assert tokenizer.stem.cache_info().hits > 0
+
+
+def test_stop_words_are_read_once(monkeypatch, tmp_path):
+    path = tmp_path / "stop_words.txt"
+    path.write_text("the\nof\n")
+    monkeypatch.setenv("STOP_WORDS", str(path))
+    monkeypatch.setattr(processing, "_tokenizer", None)
+    reads = []
+
+    def counting_load_file(file_path):
+        reads.append(file_path)
+        return path.read_text().splitlines()
+
+    monkeypatch.setattr(processing, "load_file", counting_load_file)
+    for _ in range(3):
+        assert processing.tokenize("the king of dragons") == ["king", "dragon"]
+    assert processing.remove_stop_words(["the", "king", ""]) == ["king"]
+    assert processing.stem(["dragons", "running"]) == ["dragon", "run"]
+    assert reads == [str(path)]
+    assert processing.get_tokenizer() is processing.get_tokenizer()
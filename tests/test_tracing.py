@@ -0,0 +1,73 @@
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from services import tracing
+
+
+def in_span(name: str):
+    with tracing.span(name):
+        pass
+
+
+def test_spans_nest_and_report_self_time():
+    now = [0.0]
+    trace = tracing.Trace("query", clock=lambda: now[0], query="dragon")
+    token = tracing._current.set(trace)
+    try:
+        with tracing.span("search"):
+            now[0] += 1
+            for _ in range(2):
+                with tracing.span("score"):
+                    now[0] += 2
+            tracing.count("docs_scored", 5)
+        # a thread running in a copy of the context nests under the submitter
+        with tracing.span("hybrid"), ThreadPoolExecutor(1) as pool:
+            pool.submit(contextvars.copy_context().run, in_span, "bm25").result()
+    finally:
+        tracing._current.reset(token)
+    trace.end = 6.0
+
+    report = trace.to_dict()
+    assert report["query"] == "dragon"
+    assert report["total_ms"] == 6000
+    assert report["counters"] == {"docs_scored": 5}
+    spans = {span["name"]: span for span in report["spans"]}
+    assert spans["search"]["ms"] == 5000 and spans["search"]["self_ms"] == 1000
+    assert spans["search/score"]["calls"] == 2
+    assert spans["hybrid/bm25"]["calls"] == 1
+    assert trace.folded() == [
+        "query 1000000",
+        "query;search 1000000",
+        "query;search;score 4000000",
+    ]
+
+
+def test_bm25_search_is_traced_only_when_enabled(
+    monkeypatch, tmp_path, queries, make_index
+):
+    index = make_index()
+    expected = {query: index.bm25_search(query, 10) for query in queries}
+
+    # off: no trace, and the spans are shared no-ops
+    with tracing.trace("bm25") as current:
+        assert current is None
+        assert tracing.span("tokenize") is tracing.span("score")
+
+    monkeypatch.setattr(tracing, "_enabled", True)
+    output = str(tmp_path / "traces.jsonl")
+    for query in queries:
+        with tracing.trace("bm25", query=query) as current:
+            assert index.bm25_search(query, 10) == expected[query]
+        tracing.write_trace(current, output)
+
+    with open(output) as f:
+        traces = [json.loads(line) for line in f]
+    assert [trace["query"] for trace in traces] == queries
+    for trace in traces:
+        names = {span["name"] for span in trace["spans"]}
+        assert {"bm25_search", "bm25_search/tokenize"} <= names
+        # unknown terms and stop words have no postings to scan
+        matched = bool(expected[trace["query"]])
+        assert (trace["counters"].get("postings_scanned", 0) > 0) == matched
+        assert (trace["counters"].get("docs_scored", 0) > 0) == matched